@@ -2,8 +2,12 @@
 """
 life.py - Main Flask application for Life family archive
 Date: 2025-06-18
-Version: 1.1.01
+Version: 1.1.05
 Purpose: Application initialization with file logging
+Updated: 2026-10-18 - Register DB connection teardown and query stats reporting
+Updated: 2026-10-18 - Register maintenance CLI commands
+Updated: 2026-10-18 - Streaming upload request class
+Updated: 2026-10-18 - Start background job workers on the first request
 """
 
 import os
@@ -18,6 +22,11 @@ def create_app(config_name=None):
         config_name = os.environ.get('FLASK_ENV', 'development')
     
     app = Flask(__name__)
+    
+    # Stream uploaded files into DATA_DIR staging, hashing as they arrive
+    from utils.util_storage import StagingRequest
+    app.request_class = StagingRequest
+    
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
     
@@ -57,10 +66,16 @@ def create_app(config_name=None):
     app.logger.info(f'Life app starting with config: {config_name}')
     
     # Initialize database
-    from utils.util_db import init_db
+    from utils.util_db import init_db, close_db, report_query_stats
     with app.app_context():
         init_db()
     
+    # Return pooled DB connections at the end of every request
+    app.teardown_appcontext(close_db)
+    
+    # Log per-request query counts/timings and flag N+1 patterns
+    app.teardown_request(report_query_stats)
+    
     # Register blueprints
     from routes.bp_auth import auth_bp
     from routes.bp_main import main_bp
@@ -79,6 +94,18 @@ def create_app(config_name=None):
     except ImportError:
         app.logger.warning("Admin blueprint not found - skipping")
     
+    # Post-processing job workers - started lazily so CLI commands and
+    # pre-fork master processes never run them
+    from utils.util_jobs import start_job_workers
+    
+    @app.before_request
+    def ensure_job_workers():
+        start_job_workers(app)
+    
+    # Maintenance commands for the flask CLI
+    from utils.util_cli import register_commands
+    register_commands(app)
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found_error(error):
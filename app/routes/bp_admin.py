@@ -1,9 +1,16 @@
 """
 bp_admin.py - Admin routes with orphaned file management
-Version: 1.1.05
+Version: 1.1.13
 Purpose: Admin routes - system management, user management, settings, orphaned files
 Created: 2025-06-11
 Updated: 2025-06-16 - Added system backup functionality with fixed naming
+Updated: 2026-10-18 - Added DB pool stats endpoint
+Updated: 2026-10-18 - Settings save and orphan restore commit once
+Updated: 2026-10-18 - Recent files on the dashboard carry their tags
+Updated: 2026-10-18 - Background job queue stats and retry
+Updated: 2026-10-18 - Restored orphans join the object store when STORAGE_CAS is on
+Updated: 2026-10-18 - Relationship editing endpoints
+Updated: 2026-10-18 - Similar photos and documents reports
 """
 
 import os
@@ -11,8 +18,11 @@ import subprocess
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, session
 from datetime import datetime
 from routes.bp_auth import admin_required
-from utils.util_db import query_db, execute_db
-from utils.util_storage import cleanup_orphaned_files, create_backup_archive, create_system_backup, get_file_size_formatted, calculate_checksum, get_file_type, get_file_category
+from utils.util_db import query_db, execute_db, execute_many, transaction, attach_file_tags, get_pool_stats
+from utils.util_jobs import get_job_stats, retry_failed_jobs
+from utils.util_relationships import get_relationships, save_relationship, delete_relationship
+from utils.util_similar import get_similar_report, get_similar_documents_report
+from utils.util_storage import cleanup_orphaned_files, create_backup_archive, create_system_backup, get_file_size_formatted, calculate_checksum, get_file_type, get_file_category, store_object
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -26,7 +36,8 @@ def dashboard():
         'total_size': query_db('SELECT SUM(size) as size FROM files WHERE deleted = 0', one=True)['size'] or 0,
         'deleted_files': query_db('SELECT COUNT(*) as count FROM files WHERE deleted = 1', one=True)['count'],
         'total_tags': query_db('SELECT COUNT(*) as count FROM tags', one=True)['count'],
-        'recent_uploads': query_db('SELECT COUNT(*) as count FROM files WHERE upload_date >= date("now", "-7 days") AND deleted = 0', one=True)['count']
+        'recent_uploads': query_db('SELECT COUNT(*) as count FROM files WHERE upload_date >= date("now", "-7 days") AND deleted = 0', one=True)['count'],
+        'jobs': get_job_stats()['counts']
     }
     
     # Get disk space info
@@ -43,15 +54,15 @@ def dashboard():
         current_app.logger.error(f"Failed to get disk info: {str(e)}")
         disk_info = f"Error getting disk info: {str(e)}"
     
-    # Get recent activity - include file ID
-    recent_files = query_db('''
+    # Get recent activity - include file ID and tags
+    recent_files = attach_file_tags(query_db('''
         SELECT f.id, f.filename, f.upload_date, f.size, m.auto_category
         FROM files f
         LEFT JOIN metadata m ON f.id = m.file_id
         WHERE f.deleted = 0
         ORDER BY f.upload_date DESC
         LIMIT 10
-    ''')
+    '''))
     
     # Get storage by category
     storage_by_category = query_db('''
@@ -191,18 +202,21 @@ def restore_orphan():
             flash(f'File {filename} already exists in database', 'warning')
             return redirect(url_for('admin.show_orphans'))
         
-        # Add back to database
-        file_id = execute_db('''
-            INSERT INTO files (filename, filepath, filetype, size, checksum)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (filename, file_path, filetype, size, checksum))
+        if current_app.config.get('STORAGE_CAS', False):
+            store_object(file_path, checksum)
         
-        # Add basic metadata
+        # Add back to database with basic metadata
         category = get_file_category(filename, filetype)
-        execute_db('''
-            INSERT INTO metadata (file_id, title, auto_category)
-            VALUES (?, ?, ?)
-        ''', (file_id, filename, category))
+        with transaction():
+            file_id = execute_db('''
+                INSERT INTO files (filename, filepath, filetype, size, checksum)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (filename, file_path, filetype, size, checksum))
+            
+            execute_db('''
+                INSERT INTO metadata (file_id, title, auto_category)
+                VALUES (?, ?, ?)
+            ''', (file_id, filename, category))
         
         # Remove from session list
         orphaned_files = session.get('orphaned_files', [])
@@ -231,29 +245,19 @@ def settings():
         for bin_type in current_app.config.get('BIN_TYPES', {}).keys():
             setting_keys.extend([f'refuse_{bin_type}_day', f'refuse_{bin_type}_frequency'])
         
+        # Password changes are saved alongside the other settings
+        setting_keys.extend(['view_password', 'admin_password'])
+        
+        updates = []
         for key in setting_keys:
             value = request.form.get(key, '')
             if value:
-                execute_db('''
-                    INSERT OR REPLACE INTO settings (key, value, modified_date)
-                    VALUES (?, ?, CURRENT_TIMESTAMP)
-                ''', (key, value))
+                updates.append((key, value))
         
-        # Handle password changes
-        view_password = request.form.get('view_password')
-        admin_password = request.form.get('admin_password')
-        
-        if view_password:
-            execute_db('''
-                INSERT OR REPLACE INTO settings (key, value, modified_date)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            ''', ('view_password', view_password))
-            
-        if admin_password:
-            execute_db('''
-                INSERT OR REPLACE INTO settings (key, value, modified_date)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            ''', ('admin_password', admin_password))
+        execute_many('''
+            INSERT OR REPLACE INTO settings (key, value, modified_date)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        ''', updates)
         
         flash('Settings updated successfully', 'success')
         return redirect(url_for('admin.settings'))
@@ -325,6 +329,24 @@ def restore_file(file_id):
     flash('File restored successfully', 'success')
     return redirect(url_for('admin.deleted_files'))
 
+@admin_bp.route('/similar-photos')
+@admin_required
+def similar_photos():
+    """Near-duplicate photo pairs found by perceptual hash"""
+    return render_template('temp_admin_similar.html',
+                         kind='photos',
+                         pairs=get_similar_report(),
+                         max_distance=current_app.config.get('SIMILAR_MAX_DISTANCE', 6))
+
+@admin_bp.route('/similar-documents')
+@admin_required
+def similar_documents():
+    """Probable duplicate documents found by MinHash over their text"""
+    return render_template('temp_admin_similar.html',
+                         kind='documents',
+                         pairs=get_similar_documents_report(),
+                         threshold=current_app.config.get('DOCUMENT_SIMILARITY_THRESHOLD', 0.8))
+
 @admin_bp.route('/api/stats')
 @admin_required
 def api_stats():
@@ -338,6 +360,55 @@ def api_stats():
     
     return jsonify(stats)
 
+@admin_bp.route('/api/db-pool')
+@admin_required
+def api_db_pool():
+    """API endpoint for DB connection pool stats"""
+    return jsonify(get_pool_stats())
+
+@admin_bp.route('/api/jobs')
+@admin_required
+def api_jobs():
+    """API endpoint for background job queue stats"""
+    return jsonify(get_job_stats())
+
+@admin_bp.route('/jobs/retry', methods=['POST'])
+@admin_required
+def retry_jobs():
+    """Requeue failed background jobs"""
+    count = retry_failed_jobs()
+    flash(f'Requeued {count} failed jobs', 'success')
+    return redirect(url_for('admin.dashboard'))
+
+@admin_bp.route('/api/relationships', methods=['GET', 'POST'])
+@admin_required
+def api_relationships():
+    """List semantic relationships, or create/replace one (term plus related_terms list or comma string)"""
+    if request.method == 'GET':
+        return jsonify(get_relationships())
+    
+    data = request.get_json(silent=True) or request.form
+    related_terms = data.get('related_terms', [])
+    if isinstance(related_terms, str):
+        related_terms = related_terms.split(',')
+    
+    relationship_id = save_relationship(data.get('term', ''), related_terms)
+    if relationship_id is None:
+        return jsonify({'error': 'Term is required'}), 400
+    
+    current_app.logger.info(f"Relationship saved: {data.get('term')}")
+    return jsonify({'id': relationship_id})
+
+@admin_bp.route('/api/relationships/<int:relationship_id>', methods=['DELETE'])
+@admin_required
+def api_delete_relationship(relationship_id):
+    """Delete a semantic relationship"""
+    if not delete_relationship(relationship_id):
+        return jsonify({'error': 'Relationship not found'}), 404
+    
+    current_app.logger.info(f"Relationship deleted: {relationship_id}")
+    return jsonify({'deleted': relationship_id})
+
 @admin_bp.route('/download-latest-backups')
 @admin_required
 def download_latest_backups():
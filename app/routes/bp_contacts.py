@@ -1,15 +1,16 @@
 """
 bp_contacts.py - Contacts management routes with change request system
-Version: 1.0.01
+Version: 1.0.02
 Purpose: Contact management - family, institutions, banks, healthcare, utilities with CRUD and change requests
 Created: 2025-06-17
 Updated: 2025-06-17 - Initial implementation with fuzzy search and change request workflow
+Updated: 2026-10-18 - Contact saves and bulk request processing commit once per operation
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, session
 from datetime import datetime
 from routes.bp_auth import login_required, admin_required
-from utils.util_db import query_db, execute_db
+from utils.util_db import query_db, execute_db, execute_many, transaction
 
 contacts_bp = Blueprint('contacts', __name__)
 
@@ -143,24 +144,15 @@ def add_contact():
             return redirect(url_for('contacts.add_contact'))
         
         try:
-            # Create contact
-            contact_id = execute_db('''
-                INSERT INTO contacts (name, contact_type, category, notes)
-                VALUES (?, ?, ?, ?)
-            ''', (name, contact_type, category, notes))
-            
-            # Process contact details from form
-            detail_names = request.form.getlist('detail_name')
-            detail_values = request.form.getlist('detail_value')
-            detail_sensitive = request.form.getlist('detail_sensitive')
-            
-            for i, (field_name, field_value) in enumerate(zip(detail_names, detail_values)):
-                if field_name.strip() and field_value.strip():
-                    is_sensitive = str(i) in detail_sensitive
-                    execute_db('''
-                        INSERT INTO contact_details (contact_id, field_name, field_value, is_sensitive, field_order)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (contact_id, field_name.strip(), field_value.strip(), is_sensitive, i))
+            with transaction():
+                # Create contact
+                contact_id = execute_db('''
+                    INSERT INTO contacts (name, contact_type, category, notes)
+                    VALUES (?, ?, ?, ?)
+                ''', (name, contact_type, category, notes))
+                
+                # Process contact details from form
+                save_contact_details(contact_id)
             
             flash(f'Contact "{name}" added successfully', 'success')
             return redirect(url_for('contacts.view_contact', contact_id=contact_id))
@@ -196,28 +188,19 @@ def edit_contact(contact_id):
             return redirect(url_for('contacts.edit_contact', contact_id=contact_id))
         
         try:
-            # Update contact
-            execute_db('''
-                UPDATE contacts 
-                SET name = ?, contact_type = ?, category = ?, notes = ?, modified_date = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (name, contact_type, category, notes, contact_id))
-            
-            # Delete existing details
-            execute_db('DELETE FROM contact_details WHERE contact_id = ?', (contact_id,))
-            
-            # Add new details from form
-            detail_names = request.form.getlist('detail_name')
-            detail_values = request.form.getlist('detail_value')
-            detail_sensitive = request.form.getlist('detail_sensitive')
-            
-            for i, (field_name, field_value) in enumerate(zip(detail_names, detail_values)):
-                if field_name.strip() and field_value.strip():
-                    is_sensitive = str(i) in detail_sensitive
-                    execute_db('''
-                        INSERT INTO contact_details (contact_id, field_name, field_value, is_sensitive, field_order)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (contact_id, field_name.strip(), field_value.strip(), is_sensitive, i))
+            with transaction():
+                # Update contact
+                execute_db('''
+                    UPDATE contacts 
+                    SET name = ?, contact_type = ?, category = ?, notes = ?, modified_date = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (name, contact_type, category, notes, contact_id))
+                
+                # Delete existing details
+                execute_db('DELETE FROM contact_details WHERE contact_id = ?', (contact_id,))
+                
+                # Add new details from form
+                save_contact_details(contact_id)
             
             flash(f'Contact "{name}" updated successfully', 'success')
             return redirect(url_for('contacts.view_contact', contact_id=contact_id))
@@ -438,17 +421,13 @@ def bulk_process_requests():
             flash('No pending requests to process', 'warning')
             return redirect(url_for('contacts.admin_change_requests'))
         
-        # Process all requests
+        # Process all requests in one batch
         status = 'approved' if action == 'approve_all' else 'rejected'
-        processed_count = 0
-        
-        for request_row in pending_requests:
-            execute_db('''
-                UPDATE contact_change_requests 
-                SET status = ?, admin_notes = ?, processed_date = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (status, admin_notes, request_row['id']))
-            processed_count += 1
+        processed_count = execute_many('''
+            UPDATE contact_change_requests 
+            SET status = ?, admin_notes = ?, processed_date = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', [(status, admin_notes, request_row['id']) for request_row in pending_requests])
         
         flash(f'Bulk {status} {processed_count} change requests', 'success')
         
@@ -458,6 +437,23 @@ def bulk_process_requests():
     
     return redirect(url_for('contacts.admin_change_requests'))
 
+def save_contact_details(contact_id):
+    """Insert the contact detail rows submitted with the add/edit form"""
+    detail_names = request.form.getlist('detail_name')
+    detail_values = request.form.getlist('detail_value')
+    detail_sensitive = request.form.getlist('detail_sensitive')
+    
+    rows = []
+    for i, (field_name, field_value) in enumerate(zip(detail_names, detail_values)):
+        if field_name.strip() and field_value.strip():
+            is_sensitive = str(i) in detail_sensitive
+            rows.append((contact_id, field_name.strip(), field_value.strip(), is_sensitive, i))
+    
+    execute_many('''
+        INSERT INTO contact_details (contact_id, field_name, field_value, is_sensitive, field_order)
+        VALUES (?, ?, ?, ?, ?)
+    ''', rows)
+
 @contacts_bp.route('/api/stats')
 @admin_required
 def contact_stats():
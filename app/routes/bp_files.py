@@ -1,23 +1,43 @@
 """
 /home/life/app/routes/bp_files.py
-Version: 1.2.1
+Version: 1.7.2
 Purpose: File handling routes - upload, download, browse, search, edit
 Created: 2025-06-11
 Updated: 2025-06-16 - Fixed missing shutil import for file deletion
+Updated: 2026-10-18 - Upload and edit commit each file's rows in a single transaction
+Updated: 2026-10-18 - Search backed by the FTS5 index
+Updated: 2026-10-18 - Browse/search load tags per page instead of per file
+Updated: 2026-10-18 - Keyset pagination, cached counts and JSON browse for infinite scroll
+Updated: 2026-10-18 - Uploads use the streamed checksum/MIME type and are renamed into storage
+Updated: 2026-10-18 - Hash-first duplicate check endpoint, source checksum dedup
+Updated: 2026-10-18 - Per-file ingest moved to util_ingest, resumable chunked upload API
+Updated: 2026-10-18 - Per-file background processing status
+Updated: 2026-10-18 - Cached image derivatives at /files/thumb/<id>/<size>, browse thumbnails, checksum-only dedup
+Updated: 2026-10-18 - Downloads answer Range/If-None-Match, optional X-Accel-Redirect, associations recorded after sending
+Updated: 2026-10-18 - Association updates go through the write-behind buffer
+Updated: 2026-10-18 - Related files from the precomputed neighbour table
+Updated: 2026-10-18 - Processing status reports near-duplicate photos and documents
 """
 
 import os
+import re
 import shutil
+from urllib.parse import quote
 from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify, current_app, session
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from routes.bp_auth import login_required, admin_required
-from utils.util_db import get_db, query_db, execute_db
-from utils.util_storage import (
-    allowed_file, calculate_checksum, get_file_type, 
-    get_file_category, move_to_storage
+from utils.util_db import get_db, query_db, execute_db, execute_many, transaction, attach_file_tags, get_file_counts
+from utils.util_storage import allowed_file, get_file_type_from_buffer, StagedUpload
+from utils.util_ingest import (
+    ingest_file, add_file_tags, create_upload_session, get_upload_session,
+    append_upload_chunk, finalize_upload_session, discard_upload_session, cleanup_stale_uploads
 )
-from utils.util_image import process_image_file
+from utils.util_search import search_files
+from utils.util_associations import record_association
+from utils.util_related import mark_related_dirty, get_related_files
+from utils.util_similar import get_similar_files, get_similar_documents
+from utils.util_derivatives import DERIVATIVE_FORMATS, get_derivative_sizes, get_derivative, choose_format
 
 files_bp = Blueprint('files', __name__)
 
@@ -29,70 +49,16 @@ def browse(category=None):
     page = request.args.get('page', 1, type=int)
     per_page = current_app.config['ITEMS_PER_PAGE']
     
-    # Build query
+    files, next_cursor, prev_cursor = get_browse_page(category, per_page, page,
+                                                      after=request.args.get('after'),
+                                                      before=request.args.get('before'))
+    
+    # Counts are maintained by triggers, not recounted per page view
+    total_files, categories = get_file_counts()
     if category:
-        query = '''
-            SELECT f.id, f.filename, f.size, f.upload_date, 
-                   m.title, m.description, m.auto_category
-            FROM files f
-            LEFT JOIN metadata m ON f.id = m.file_id
-            WHERE f.deleted = 0 AND m.auto_category = ?
-            ORDER BY f.upload_date DESC
-            LIMIT ? OFFSET ?
-        '''
-        args = (category, per_page, (page - 1) * per_page)
-        
-        count_query = '''
-            SELECT COUNT(*) as count
-            FROM files f
-            LEFT JOIN metadata m ON f.id = m.file_id
-            WHERE f.deleted = 0 AND m.auto_category = ?
-        '''
-        count_args = (category,)
+        total_count = next((c['count'] for c in categories if c['auto_category'] == category), 0)
     else:
-        query = '''
-            SELECT f.id, f.filename, f.size, f.upload_date,
-                   m.title, m.description, m.auto_category
-            FROM files f
-            LEFT JOIN metadata m ON f.id = m.file_id
-            WHERE f.deleted = 0
-            ORDER BY f.upload_date DESC
-            LIMIT ? OFFSET ?
-        '''
-        args = (per_page, (page - 1) * per_page)
-        
-        count_query = 'SELECT COUNT(*) as count FROM files WHERE deleted = 0'
-        count_args = ()
-    
-    files_raw = query_db(query, args)
-    total_count = query_db(count_query, count_args, one=True)['count']
-    
-    # Convert SQLite Row objects to dicts and add tags
-    files = []
-    for file_row in files_raw:
-        # Convert Row to dict
-        file_dict = dict(file_row)
-        
-        # Get tags for this file
-        tags = query_db('''
-            SELECT t.name
-            FROM tags t
-            JOIN file_tags ft ON t.id = ft.tag_id
-            WHERE ft.file_id = ?
-        ''', (file_dict['id'],))
-        file_dict['tags'] = [tag['name'] for tag in tags]
-        
-        files.append(file_dict)
-    
-    # Get category list
-    categories = query_db('''
-        SELECT DISTINCT auto_category, COUNT(*) as count
-        FROM metadata m
-        JOIN files f ON m.file_id = f.id
-        WHERE f.deleted = 0 AND auto_category IS NOT NULL
-        GROUP BY auto_category
-        ORDER BY auto_category
-    ''')
+        total_count = total_files
     
     # Calculate pagination
     total_pages = (total_count + per_page - 1) // per_page
@@ -102,7 +68,45 @@ def browse(category=None):
                          categories=categories,
                          current_category=category,
                          page=page,
-                         total_pages=total_pages)
+                         total_pages=total_pages,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor)
+
+@files_bp.route('/api/browse')
+@files_bp.route('/api/browse/<path:category>')
+@login_required
+def api_browse(category=None):
+    """JSON page of files for infinite scroll - pass next_cursor back as ?after="""
+    per_page = request.args.get('limit', current_app.config['ITEMS_PER_PAGE'], type=int)
+    per_page = max(1, min(per_page, 200))
+    
+    files, next_cursor, _ = get_browse_page(category, per_page, after=request.args.get('after'))
+    
+    for file_dict in files:
+        file_dict['upload_date'] = str(file_dict['upload_date'])
+    
+    return jsonify({'files': files, 'next_cursor': next_cursor})
+
+@files_bp.route('/api/processing/<int:file_id>')
+@login_required
+def processing_status(file_id):
+    """Background job status for one file, plus near-duplicate photos/documents once it is processed"""
+    file = query_db('SELECT processing_status FROM files WHERE id = ?', (file_id,), one=True)
+    if not file:
+        return jsonify({'error': 'File not found'}), 404
+    
+    jobs = query_db('''
+        SELECT job_type, status, attempts, last_error
+        FROM jobs WHERE file_id = ?
+        ORDER BY id
+    ''', (file_id,))
+    
+    return jsonify({
+        'status': file['processing_status'],
+        'jobs': [dict(job) for job in jobs],
+        'similar': get_similar_files(file_id),
+        'similar_documents': get_similar_documents(file_id)
+    })
 
 @files_bp.route('/edit/<int:file_id>', methods=['POST'])
 @admin_required
@@ -120,34 +124,24 @@ def edit_file(file_id):
     new_tags = request.form.get('tags', '').strip()
     
     try:
-        # Update title if provided
-        if new_title:
-            execute_db('''
-                UPDATE metadata 
-                SET title = ? 
-                WHERE file_id = ?
-            ''', (new_title, file_id))
-        
-        # Update tags if provided
-        if 'tags' in request.form:  # Even if empty, user wants to update tags
-            # Remove existing tags
-            execute_db('DELETE FROM file_tags WHERE file_id = ?', (file_id,))
+        with transaction():
+            # Update title if provided
+            if new_title:
+                execute_db('''
+                    UPDATE metadata 
+                    SET title = ? 
+                    WHERE file_id = ?
+                ''', (new_title, file_id))
             
-            # Add new tags
-            if new_tags:
-                for tag_name in new_tags.split(','):
-                    tag_name = tag_name.strip().lower()
-                    if tag_name:
-                        # Get or create tag
-                        tag = query_db('SELECT id FROM tags WHERE name = ?', (tag_name,), one=True)
-                        if not tag:
-                            tag_id = execute_db('INSERT INTO tags (name) VALUES (?)', (tag_name,))
-                        else:
-                            tag_id = tag['id']
-                        
-                        # Link to file
-                        execute_db('INSERT INTO file_tags (file_id, tag_id) VALUES (?, ?)',
-                                 (file_id, tag_id))
+            # Update tags if provided
+            if 'tags' in request.form:  # Even if empty, user wants to update tags
+                # Remove existing tags
+                execute_db('DELETE FROM file_tags WHERE file_id = ?', (file_id,))
+                
+                # Add new tags
+                add_file_tags(file_id, new_tags)
+            
+            mark_related_dirty([file_id])
         
         if current_app.config['DEBUG']:
             current_app.logger.debug(f"Updated file {file_id}: title='{new_title}', tags='{new_tags}'")
@@ -182,76 +176,34 @@ def upload():
         uploaded_count = 0
         for index, file in enumerate(files):
             if file and file.filename != '' and allowed_file(file.filename):
-                # Secure filename
                 original_filename = file.filename
-                filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{timestamp}_{filename}"
-                
-                # Save to temp location first
-                temp_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                file.save(temp_path)
-                
-                # Process image if needed (HEIC conversion, resize)
-                if filename.lower().endswith(('.heic', '.jpg', '.jpeg', '.png', '.gif')):
-                    temp_path = process_image_file(temp_path)
-                    filename = os.path.basename(temp_path)
-                
-                # Calculate checksum
-                checksum = calculate_checksum(temp_path)
-                
-                # Check for duplicates
-                duplicate = query_db('SELECT id, filename FROM files WHERE checksum = ? AND deleted = 0', 
-                                   (checksum,), one=True)
-                
-                if duplicate:
-                    os.remove(temp_path)
-                    flash(f'Duplicate file skipped: {original_filename}', 'warning')
-                    continue
-                
-                # Get file info
-                filetype = get_file_type(temp_path)
-                size = os.path.getsize(temp_path)
-                category = get_file_category(original_filename, filetype)
                 
-                # Move to storage
-                storage_path = move_to_storage(temp_path, category, filename)
+                if isinstance(file.stream, StagedUpload):
+                    # Already on disk in staging, hashed and sniffed while receiving
+                    temp_path = file.stream.finish()
+                    checksum = file.stream.checksum
+                    filetype = get_file_type_from_buffer(file.stream.head, original_filename)
+                else:
+                    # Save to temp location first
+                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    filename = f"{timestamp}_{secure_filename(original_filename)}"
+                    temp_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+                    file.save(temp_path)
+                    checksum = None
+                    filetype = None
                 
-                # Store in database
-                file_id = execute_db('''
-                    INSERT INTO files (filename, filepath, filetype, size, checksum)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (original_filename, storage_path, filetype, size, checksum))
-                
-                # Add metadata
+                # Custom title from the form, falling back to the original filename
                 title = custom_titles[index] if index < len(custom_titles) and custom_titles[index].strip() else original_filename
                 
-                execute_db('''
-                    INSERT INTO metadata (file_id, title, description, keywords, auto_category)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (file_id, title, '', shared_tags, category))
+                file_id, status = ingest_file(temp_path, original_filename, title, shared_tags,
+                                              checksum=checksum, filetype=filetype)
                 
-                # Process shared tags
-                if shared_tags:
-                    for tag_name in shared_tags.split(','):
-                        tag_name = tag_name.strip().lower()
-                        if tag_name:
-                            # Get or create tag
-                            tag = query_db('SELECT id FROM tags WHERE name = ?', (tag_name,), one=True)
-                            if not tag:
-                                tag_id = execute_db('INSERT INTO tags (name) VALUES (?)', (tag_name,))
-                            else:
-                                tag_id = tag['id']
-                            
-                            # Link to file
-                            execute_db('INSERT INTO file_tags (file_id, tag_id) VALUES (?, ?)',
-                                     (file_id, tag_id))
-                
-                uploaded_count += 1
-                
-                if current_app.config['DEBUG']:
-                    current_app.logger.debug(f"File uploaded: {original_filename} -> {storage_path}, "
-                                           f"Category: {category}, Size: {size}")
+                if status == 'duplicate':
+                    flash(f'Duplicate file skipped: {original_filename}', 'warning')
+                elif status == 'failed':
+                    flash(f'Could not store {original_filename}', 'error')
+                else:
+                    uploaded_count += 1
         
         if uploaded_count > 0:
             flash(f'Successfully uploaded {uploaded_count} file{"s" if uploaded_count != 1 else ""}', 'success')
@@ -263,6 +215,146 @@ def upload():
     # GET request - show upload form
     return render_template('temp_upload.html')
 
+@files_bp.route('/api/check-duplicates', methods=['POST'])
+@login_required
+def check_duplicates():
+    """
+    Hash-first upload handshake: the upload page posts {"files": [{"checksum", "size"}, ...]}
+    with client-side MD5s and gets back the checksums the archive already has, so it can
+    skip sending them.
+    """
+    entries = (request.get_json(silent=True) or {}).get('files', [])
+    
+    sizes = {}
+    for entry in entries[:1000]:
+        if not isinstance(entry, dict):
+            continue
+        checksum = str(entry.get('checksum', '')).lower()
+        if re.fullmatch(r'[0-9a-f]{32}', checksum):
+            sizes[checksum] = entry.get('size')
+    
+    existing = set()
+    checksums = list(sizes)
+    for start in range(0, len(checksums), 900):
+        chunk = checksums[start:start + 900]
+        rows = query_db(f'''
+            SELECT checksum, size
+            FROM files
+            WHERE deleted = 0 AND checksum IN ({','.join('?' * len(chunk))})
+        ''', chunk)
+        
+        for row in rows:
+            if sizes[row['checksum']] in (None, row['size']):
+                existing.add(row['checksum'])
+    
+    if current_app.config['DEBUG']:
+        current_app.logger.debug(f"Duplicate check: {len(existing)} of {len(sizes)} files already archived")
+    
+    return jsonify({'existing': sorted(existing)})
+
+@files_bp.route('/api/uploads', methods=['POST'])
+@login_required
+def create_chunked_upload():
+    """
+    Start a resumable upload: {"filename", "size", "title", "tags", "checksum"}.
+    The client then PATCHes chunks at Upload-Offset and POSTs finalize.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename', ''))
+    
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        size = -1
+    
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    if size <= 0:
+        return jsonify({'error': 'Invalid size'}), 400
+    
+    # Hash-first: nothing to send if the archive already has these bytes
+    checksum = str(data.get('checksum', '')).lower()
+    if re.fullmatch(r'[0-9a-f]{32}', checksum):
+        duplicate = query_db('SELECT id FROM files WHERE checksum = ? AND deleted = 0', (checksum,), one=True)
+        if duplicate:
+            return jsonify({'status': 'duplicate', 'file_id': duplicate['id']})
+    
+    # Piggyback housekeeping on session creation rather than a scheduler
+    cleanup_stale_uploads()
+    
+    session_id = create_upload_session(filename, size,
+                                       str(data.get('title', '')).strip(),
+                                       str(data.get('tags', '')))
+    
+    response = jsonify({'id': session_id, 'offset': 0,
+                        'chunk_size': current_app.config.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)})
+    response.status_code = 201
+    response.headers['Location'] = url_for('files.chunked_upload', session_id=session_id)
+    response.headers['Upload-Offset'] = '0'
+    return response
+
+@files_bp.route('/api/uploads/<session_id>', methods=['GET', 'HEAD', 'PATCH', 'DELETE'])
+@login_required
+def chunked_upload(session_id):
+    """Report the offset to resume from, append a chunk at Upload-Offset, or abort"""
+    if request.method == 'DELETE':
+        discard_upload_session(session_id)
+        return '', 204
+    
+    upload = get_upload_session(session_id)
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    if request.method in ('GET', 'HEAD'):
+        response = jsonify({'id': session_id, 'offset': upload['upload_offset'], 'size': upload['size']})
+        response.headers['Upload-Offset'] = str(upload['upload_offset'])
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header required'}), 400
+    
+    # Keep each request short - a slow client holds a worker for one chunk at most
+    max_chunk = current_app.config.get('UPLOAD_CHUNK_MAX', 16 * 1024 * 1024)
+    if request.content_length is None or request.content_length > max_chunk:
+        return jsonify({'error': f'Chunks must declare a length of at most {max_chunk} bytes'}), 413
+    
+    data = request.stream.read(request.content_length)
+    if len(data) != request.content_length:
+        return jsonify({'error': 'Incomplete chunk'}), 400
+    
+    new_offset, error = append_upload_chunk(session_id, offset, data)
+    if error:
+        response = jsonify({'error': error, 'offset': new_offset})
+        if new_offset is None:
+            response.status_code = 404
+        else:
+            response.status_code = 409
+            response.headers['Upload-Offset'] = str(new_offset)
+        return response
+    
+    response = jsonify({'offset': new_offset})
+    response.headers['Upload-Offset'] = str(new_offset)
+    return response
+
+@files_bp.route('/api/uploads/<session_id>/finalize', methods=['POST'])
+@login_required
+def finalize_chunked_upload(session_id):
+    """Categorise, store and record a fully received chunked upload"""
+    file_id, status = finalize_upload_session(session_id)
+    
+    if status == 'missing':
+        return jsonify({'error': 'Upload not found'}), 404
+    if status == 'incomplete':
+        upload = get_upload_session(session_id)
+        return jsonify({'error': 'Upload incomplete', 'offset': upload['upload_offset']}), 409
+    if status == 'failed':
+        return jsonify({'status': status, 'error': 'Could not store file'}), 500
+    
+    return jsonify({'status': status, 'file_id': file_id})
+
 @files_bp.route('/download/<int:file_id>')
 @login_required
 def download(file_id):
@@ -278,33 +370,80 @@ def download(file_id):
         flash('File not found on disk', 'error')
         return redirect(url_for('files.browse'))
     
-    # Track file access for learning associations
-    if 'last_file_id' in session:
-        last_id = session['last_file_id']
-        if last_id != file_id:
-            # Update association
-            existing = query_db('''
-                SELECT strength FROM learned_associations
-                WHERE (file_id_1 = ? AND file_id_2 = ?) OR (file_id_1 = ? AND file_id_2 = ?)
-            ''', (last_id, file_id, file_id, last_id), one=True)
-            
-            if existing:
-                execute_db('''
-                    UPDATE learned_associations
-                    SET strength = strength + 0.1, last_accessed = CURRENT_TIMESTAMP
-                    WHERE (file_id_1 = ? AND file_id_2 = ?) OR (file_id_1 = ? AND file_id_2 = ?)
-                ''', (last_id, file_id, file_id, last_id))
-            else:
-                execute_db('''
-                    INSERT INTO learned_associations (file_id_1, file_id_2, strength)
-                    VALUES (?, ?, 1.0)
-                ''', (min(last_id, file_id), max(last_id, file_id)))
-    
+    last_id = session.get('last_file_id')
     session['last_file_id'] = file_id
     
-    return send_file(file_info['filepath'], 
-                    download_name=file_info['filename'],
-                    as_attachment=True)
+    response = send_archive_file(file_info)
+    
+    # Track file access for learning associations (buffered, written in batches)
+    if last_id is not None and last_id != file_id:
+        record_association(last_id, file_id)
+    
+    return response
+
+def send_archive_file(file_info):
+    """
+    Send an archived file as an attachment with a checksum ETag.
+    Range and If-None-Match are answered by send_file; with DOWNLOAD_ACCEL_REDIRECT set
+    the bytes are handed to nginx (X-Accel-Redirect), and Flask's USE_X_SENDFILE covers
+    Apache/lighttpd.
+    """
+    accel_prefix = current_app.config.get('DOWNLOAD_ACCEL_REDIRECT')
+    data_dir = os.path.realpath(current_app.config['DATA_DIR'])
+    filepath = os.path.realpath(file_info['filepath'])
+    
+    if accel_prefix and filepath.startswith(data_dir + os.sep):
+        # nginx serves the internal location itself, including ranges and conditionals
+        response = current_app.response_class(mimetype=file_info['filetype'] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(os.path.relpath(filepath, data_dir))
+        response.headers.set('Content-Disposition', 'attachment', filename=file_info['filename'])
+        if file_info['checksum']:
+            response.set_etag(file_info['checksum'])
+    else:
+        response = send_file(file_info['filepath'],
+                            mimetype=file_info['filetype'] or None,
+                            download_name=file_info['filename'],
+                            as_attachment=True,
+                            etag=file_info['checksum'] or True,
+                            conditional=True)
+    
+    # Browsers may keep a copy but must revalidate it against the ETag
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@files_bp.route('/thumb/<int:file_id>/<size>')
+@login_required
+def thumbnail(file_id, size):
+    """
+    Resized image derivative (thumb/medium/large), rendered on first request and
+    served from the derivative cache after that. ?format=webp|jpeg overrides Accept.
+    """
+    if size not in get_derivative_sizes():
+        return '', 404
+    
+    file_info = query_db('SELECT id, filepath, filetype, checksum FROM files WHERE id = ? AND deleted = 0',
+                        (file_id,), one=True)
+    if not file_info or not (file_info['filetype'] or '').startswith('image/') or not file_info['checksum']:
+        return '', 404
+    
+    fmt = request.args.get('format')
+    if fmt not in DERIVATIVE_FORMATS:
+        fmt = choose_format(request.accept_mimetypes)
+    
+    path = get_derivative(file_info, size, fmt)
+    if not path:
+        return '', 404
+    
+    # Content is keyed by checksum, so the ETag never changes for the same bytes
+    response = send_file(path, mimetype=DERIVATIVE_FORMATS[fmt][2],
+                         etag=f"{file_info['checksum']}-{size}-{fmt}",
+                         max_age=current_app.config.get('DERIVATIVE_MAX_AGE', 31536000),
+                         conditional=True)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.vary.add('Accept')
+    return response
 
 @files_bp.route('/search')
 @login_required
@@ -317,64 +456,13 @@ def search():
     if not query:
         return render_template('temp_search.html', query=query, results=[], total_count=0)
     
-    # Search in multiple fields
-    search_query = '''
-        SELECT DISTINCT f.id, f.filename, f.size, f.upload_date,
-               m.title, m.description, m.auto_category
-        FROM files f
-        LEFT JOIN metadata m ON f.id = m.file_id
-        LEFT JOIN file_tags ft ON f.id = ft.file_id
-        LEFT JOIN tags t ON ft.tag_id = t.id
-        WHERE f.deleted = 0 AND (
-            f.filename LIKE ? OR
-            m.title LIKE ? OR
-            m.description LIKE ? OR
-            m.keywords LIKE ? OR
-            m.ocr_text LIKE ? OR
-            t.name LIKE ?
-        )
-        ORDER BY f.upload_date DESC
-        LIMIT ? OFFSET ?
-    '''
-    
-    search_term = f'%{query}%'
-    args = (search_term,) * 6 + (per_page, (page - 1) * per_page)
-    
-    results_raw = query_db(search_query, args)
-    
-    # Convert to dicts and add tags
-    results = []
-    for result_row in results_raw:
-        result_dict = dict(result_row)
-        tags = query_db('''
-            SELECT t.name
-            FROM tags t
-            JOIN file_tags ft ON t.id = ft.tag_id
-            WHERE ft.file_id = ?
-        ''', (result_dict['id'],))
-        result_dict['tags'] = [tag['name'] for tag in tags]
-        results.append(result_dict)
-    
-    # Get total count
-    count_query = '''
-        SELECT COUNT(DISTINCT f.id) as count
-        FROM files f
-        LEFT JOIN metadata m ON f.id = m.file_id
-        LEFT JOIN file_tags ft ON f.id = ft.file_id
-        LEFT JOIN tags t ON ft.tag_id = t.id
-        WHERE f.deleted = 0 AND (
-            f.filename LIKE ? OR
-            m.title LIKE ? OR
-            m.description LIKE ? OR
-            m.keywords LIKE ? OR
-            m.ocr_text LIKE ? OR
-            t.name LIKE ?
-        )
-    '''
-    
-    total_count = query_db(count_query, (search_term,) * 6, one=True)['count']
-    
-    # Find related files using semantic relationships
+    # Full-text search, best matches first
+    results, total_count = search_files(query, per_page, (page - 1) * per_page)
+    
+    # Add tags to each result
+    results = attach_file_tags(results)
+    
+    # Related files for this page of results
     related_files = find_related_files(query, [r['id'] for r in results])
     
     total_pages = (total_count + per_page - 1) // per_page
@@ -433,7 +521,81 @@ def delete_file(file_id):
         flash('Error deleting file', 'error')
         return redirect(url_for('files.browse'))
 
+def encode_cursor(file_dict):
+    """Keyset cursor for a browse row: upload_date|id"""
+    return f"{file_dict['upload_date']}|{file_dict['id']}"
+
+def decode_cursor(cursor):
+    """Parse a browse cursor, returns (upload_date, id) or None if malformed"""
+    try:
+        upload_date, file_id = cursor.rsplit('|', 1)
+        return upload_date, int(file_id)
+    except (AttributeError, ValueError):
+        return None
+
+def get_browse_page(category, per_page, page=1, after=None, before=None):
+    """
+    One page of live files, newest first, using keyset pagination on (upload_date, id).
+    Falls back to OFFSET for plain ?page= links without a cursor.
+    Returns: (files with tags, next cursor or None, previous cursor or None)
+    """
+    where = ['f.deleted = 0']
+    args = []
+    
+    if category:
+        where.append('m.auto_category = ?')
+        args.append(category)
+    
+    after_key = decode_cursor(after) if after else None
+    before_key = decode_cursor(before) if before else None
+    
+    order = 'DESC'
+    offset = 0
+    if before_key:
+        # Walk backwards from the first row of the current page, then flip
+        where.append('(f.upload_date, f.id) > (?, ?)')
+        args.extend(before_key)
+        order = 'ASC'
+    elif after_key:
+        where.append('(f.upload_date, f.id) < (?, ?)')
+        args.extend(after_key)
+    else:
+        offset = (max(page, 1) - 1) * per_page
+    
+    rows = query_db(f'''
+        SELECT f.id, f.filename, f.filetype, f.size, f.upload_date, f.processing_status,
+               m.title, m.description, m.auto_category
+        FROM files f
+        LEFT JOIN metadata m ON f.id = m.file_id
+        WHERE {' AND '.join(where)}
+        ORDER BY f.upload_date {order}, f.id {order}
+        LIMIT ? OFFSET ?
+    ''', args + [per_page + 1, offset])
+    
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before_key:
+        rows.reverse()
+    
+    files = attach_file_tags(rows)
+    if not files:
+        return files, None, None
+    
+    has_next = has_more if not before_key else True
+    has_prev = has_more if before_key else bool(after_key or offset)
+    
+    next_cursor = encode_cursor(files[-1]) if has_next else None
+    prev_cursor = encode_cursor(files[0]) if has_prev else None
+    
+    return files, next_cursor, prev_cursor
+
 def find_related_files(query, exclude_ids):
-    """Find related files based on semantic relationships"""
-    # Placeholder function - implement semantic search logic
-    return []
\ No newline at end of file
+    """
+    Files related to the search results - one lookup in the neighbour table, which the
+    refresh_related job keeps current from associations, shared tags and term expansion
+    """
+    try:
+        return get_related_files(exclude_ids)
+    except Exception as e:
+        current_app.logger.warning(f"Related files lookup failed for '{query}': {str(e)}")
+        return []
\ No newline at end of file
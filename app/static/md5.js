@@ -0,0 +1,124 @@
+/*
+/home/life/app/static/md5.js
+Version: 1.0.0
+Purpose: Incremental MD5 so the upload page can match files against files.checksum before sending them
+Created: 2026-10-18
+*/
+
+const MD5_SHIFTS = [
+    7, 12, 17, 22, 7, 12, 17, 22, 7, 12, 17, 22, 7, 12, 17, 22,
+    5, 9, 14, 20, 5, 9, 14, 20, 5, 9, 14, 20, 5, 9, 14, 20,
+    4, 11, 16, 23, 4, 11, 16, 23, 4, 11, 16, 23, 4, 11, 16, 23,
+    6, 10, 15, 21, 6, 10, 15, 21, 6, 10, 15, 21, 6, 10, 15, 21
+];
+
+const MD5_CONSTANTS = new Int32Array(64).map((_, i) => Math.floor(Math.abs(Math.sin(i + 1)) * 4294967296));
+
+function MD5() {
+    this.state = new Int32Array([1732584193, -271733879, -1732584194, 271733878]);
+    this.buffer = new Uint8Array(64);
+    this.bufferLength = 0;
+    this.length = 0;
+    this.words = new Int32Array(16);
+}
+
+MD5.prototype.processBlock = function(bytes, offset) {
+    const x = this.words;
+    for (let i = 0; i < 16; i++) {
+        const j = offset + i * 4;
+        x[i] = bytes[j] | (bytes[j + 1] << 8) | (bytes[j + 2] << 16) | (bytes[j + 3] << 24);
+    }
+
+    let a = this.state[0], b = this.state[1], c = this.state[2], d = this.state[3];
+
+    for (let i = 0; i < 64; i++) {
+        let f, g;
+        if (i < 16) {
+            f = (b & c) | (~b & d);
+            g = i;
+        } else if (i < 32) {
+            f = (d & b) | (~d & c);
+            g = (5 * i + 1) % 16;
+        } else if (i < 48) {
+            f = b ^ c ^ d;
+            g = (3 * i + 5) % 16;
+        } else {
+            f = c ^ (b | ~d);
+            g = (7 * i) % 16;
+        }
+
+        const sum = (a + f + MD5_CONSTANTS[i] + x[g]) | 0;
+        a = d;
+        d = c;
+        c = b;
+        b = (b + ((sum << MD5_SHIFTS[i]) | (sum >>> (32 - MD5_SHIFTS[i])))) | 0;
+    }
+
+    this.state[0] += a;
+    this.state[1] += b;
+    this.state[2] += c;
+    this.state[3] += d;
+};
+
+MD5.prototype.update = function(bytes) {
+    let offset = 0;
+    this.length += bytes.length;
+
+    // Top up a partially filled block first
+    if (this.bufferLength > 0) {
+        const take = Math.min(64 - this.bufferLength, bytes.length);
+        this.buffer.set(bytes.subarray(0, take), this.bufferLength);
+        this.bufferLength += take;
+        offset = take;
+        if (this.bufferLength < 64) {
+            return this;
+        }
+        this.processBlock(this.buffer, 0);
+        this.bufferLength = 0;
+    }
+
+    for (; offset + 64 <= bytes.length; offset += 64) {
+        this.processBlock(bytes, offset);
+    }
+
+    this.buffer.set(bytes.subarray(offset), 0);
+    this.bufferLength = bytes.length - offset;
+    return this;
+};
+
+MD5.prototype.hexdigest = function() {
+    const bitLength = this.length * 8;
+    const padding = new Uint8Array(((this.bufferLength < 56 ? 56 : 120) - this.bufferLength) + 8);
+    padding[0] = 0x80;
+
+    // Message length in bits, little-endian 64-bit
+    const low = bitLength % 4294967296;
+    const high = Math.floor(bitLength / 4294967296);
+    const end = padding.length - 8;
+    for (let i = 0; i < 4; i++) {
+        padding[end + i] = (low >>> (8 * i)) & 0xff;
+        padding[end + 4 + i] = (high >>> (8 * i)) & 0xff;
+    }
+
+    const length = this.length;
+    this.update(padding);
+    this.length = length;
+
+    let hex = '';
+    for (let i = 0; i < 4; i++) {
+        for (let j = 0; j < 4; j++) {
+            hex += ((this.state[i] >>> (8 * j)) & 0xff).toString(16).padStart(2, '0');
+        }
+    }
+    return hex;
+};
+
+// Hash a File/Blob in 4 MB slices so large videos never sit in memory whole
+async function md5File(file, chunkSize = 4 * 1024 * 1024) {
+    const md5 = new MD5();
+    for (let offset = 0; offset < file.size; offset += chunkSize) {
+        const chunk = await file.slice(offset, offset + chunkSize).arrayBuffer();
+        md5.update(new Uint8Array(chunk));
+    }
+    return md5.hexdigest();
+}
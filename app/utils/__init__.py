@@ -6,17 +6,15 @@ Created: 2025-06-11
 """
 
 # Import commonly used utilities
-from .util_db import get_db, query_db, execute_db, init_db
+from .util_db import get_db, query_db, execute_db, execute_many, transaction, init_db
 from .util_storage import (
     allowed_file, calculate_checksum, get_file_type,
     get_file_category, move_to_storage
 )
-from .util_image import process_image_file
 
 # Export for easy access
 __all__ = [
-    'get_db', 'query_db', 'execute_db', 'init_db',
+    'get_db', 'query_db', 'execute_db', 'execute_many', 'transaction', 'init_db',
     'allowed_file', 'calculate_checksum', 'get_file_type',
-    'get_file_category', 'move_to_storage',
-    'process_image_file'
+    'get_file_category', 'move_to_storage'
 ]
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+/home/life/app/utils/util_associations.py
+Version: 1.1.1
+Purpose: Learned file associations - pairs of files opened one after the other
+Created: 2026-10-18
+Updated: 2026-10-18 - Write-behind buffer flushed as batched upserts
+Updated: 2026-10-18 - Flushed pairs mark both files for a related-files refresh
+"""
+
+import os
+import atexit
+import threading
+from datetime import datetime
+from flask import current_app
+from utils.util_db import execute_many, transaction
+from utils.util_related import mark_related_dirty
+
+# Strength of a new pair and the increment for each repeat visit
+ASSOCIATION_INITIAL_STRENGTH = 1.0
+ASSOCIATION_INCREMENT = 0.1
+
+# Pending increments per canonically ordered pair: {(smaller id, larger id): [count, last accessed]}
+_pending = {}
+_pending_lock = threading.Lock()
+_flusher = {'pid': None, 'app': None, 'wake': None}
+
+_UPSERT_SQL = '''
+    INSERT INTO learned_associations (file_id_1, file_id_2, strength, last_accessed)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (file_id_1, file_id_2) DO UPDATE
+    SET strength = strength + ?, last_accessed = excluded.last_accessed
+'''
+
+def record_association(last_id, file_id):
+    """
+    Buffer one association between two files opened in sequence.
+    Written by the flusher every ASSOCIATION_FLUSH_INTERVAL seconds, or sooner once
+    ASSOCIATION_FLUSH_SIZE pairs are waiting - a crash loses at most that much.
+    """
+    if last_id == file_id:
+        return
+    
+    _start_flusher()
+    pair = (min(last_id, file_id), max(last_id, file_id))
+    accessed = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    
+    with _pending_lock:
+        entry = _pending.setdefault(pair, [0, accessed])
+        entry[0] += 1
+        entry[1] = accessed
+        full = len(_pending) >= current_app.config.get('ASSOCIATION_FLUSH_SIZE', 100)
+    
+    if full:
+        _flusher['wake'].set()
+
+def flush_associations():
+    """Write all buffered increments in one batched upsert. Returns the number of pairs written."""
+    with _pending_lock:
+        if not _pending:
+            return 0
+        batch = list(_pending.items())
+        _pending.clear()
+    
+    rows = [(pair[0], pair[1],
+             ASSOCIATION_INITIAL_STRENGTH + ASSOCIATION_INCREMENT * (count - 1),
+             accessed,
+             ASSOCIATION_INCREMENT * count)
+            for pair, (count, accessed) in batch]
+    
+    try:
+        with transaction():
+            execute_many(_UPSERT_SQL, rows)
+            mark_related_dirty({file_id for pair, _ in batch for file_id in pair})
+    except Exception as e:
+        # Put the increments back so the next flush retries them
+        with _pending_lock:
+            for pair, (count, accessed) in batch:
+                entry = _pending.setdefault(pair, [0, accessed])
+                entry[0] += count
+        current_app.logger.warning(f"Failed to flush {len(rows)} associations: {str(e)}")
+        return 0
+    
+    if current_app.config['DEBUG']:
+        current_app.logger.debug(f"Flushed {len(rows)} learned associations")
+    
+    return len(rows)
+
+def _start_flusher():
+    """Start this process's flusher thread on first use (once per process)"""
+    if _flusher['pid'] == os.getpid():
+        return
+    
+    with _pending_lock:
+        if _flusher['pid'] == os.getpid():
+            return
+        
+        # Increments inherited across a fork belong to the parent
+        _pending.clear()
+        _flusher['app'] = current_app._get_current_object()
+        _flusher['wake'] = threading.Event()
+        threading.Thread(target=_flush_loop, args=(_flusher['app'], _flusher['wake']),
+                         name='association-flusher', daemon=True).start()
+        _flusher['pid'] = os.getpid()
+
+def _flush_loop(app, wake):
+    interval = app.config.get('ASSOCIATION_FLUSH_INTERVAL', 5)
+    while True:
+        wake.wait(interval)
+        wake.clear()
+        with app.app_context():
+            flush_associations()
+
+@atexit.register
+def _flush_at_exit():
+    if _flusher['pid'] == os.getpid() and _flusher['app'] is not None:
+        with _flusher['app'].app_context():
+            flush_associations()
@@ -0,0 +1,234 @@
+"""
+/home/life/app/utils/util_categories.py
+Version: 1.1.0
+Purpose: File categorisation - configurable rules compiled into one regex per file type and field,
+         plus bulk reclassification of the archive
+Created: 2026-10-18
+Updated: 2026-10-18 - Per-batch reclassify_rows shared with archive reprocessing
+"""
+
+import os
+import re
+from flask import current_app
+from utils.util_db import query_db, execute_many, transaction
+
+# Base types, checked in order: extension first, then MIME type prefix.
+# Files matching none fall back to CATEGORY_FALLBACK_TYPE.
+DEFAULT_CATEGORY_TYPES = {
+    'documents': {
+        'extensions': ['.pdf', '.doc', '.docx', '.txt', '.odt'],
+        'default': 'documents/personal'
+    },
+    'images': {
+        'extensions': ['.jpg', '.jpeg', '.png', '.gif', '.heic', '.bmp'],
+        'mimetypes': ['image/'],
+        'default': 'images/events'
+    },
+    'videos': {
+        'extensions': ['.mp4', '.mov', '.avi', '.mkv', '.webm'],
+        'mimetypes': ['video/'],
+        'default': 'videos/events'
+    }
+}
+
+# Refinements within a type (any type when omitted), earlier rules win. keywords match
+# as substrings of the filename and as whole words of extracted text; fields picks which
+# of the two apply; mimetypes are prefixes of the detected MIME type.
+DEFAULT_CATEGORY_RULES = [
+    {'category': 'documents/financial', 'type': 'documents',
+     'keywords': ['invoice', 'rechnung', 'bill', 'receipt'], 'fields': ['filename', 'text']},
+    {'category': 'documents/medical', 'type': 'documents',
+     'keywords': ['medical', 'doctor', 'prescription', 'gesundheit'], 'fields': ['filename', 'text']},
+    {'category': 'documents/legal', 'type': 'documents',
+     'keywords': ['contract', 'legal', 'vertrag', 'testament'], 'fields': ['filename', 'text']},
+    {'category': 'images/documents', 'type': 'images',
+     'keywords': ['passport', 'id', 'license', 'ausweis']},
+    {'category': 'images/family', 'type': 'images',
+     'keywords': ['family', 'birthday', 'wedding']},
+    {'category': 'videos/family', 'type': 'videos',
+     'keywords': ['family', 'birthday', 'christmas']},
+]
+
+# Signals in order of precedence - a filename hit beats a text hit on an earlier rule
+MATCH_FIELDS = ('filename', 'mimetype', 'text')
+
+# Last compiled rules and the config objects they came from
+_compiled = {'key': None, 'rules': None}
+
+class CategoryRules:
+    """Compiled categorisation rules; build through get_category_rules()"""
+    
+    def __init__(self, types, rules, fallback_type, text_limit):
+        self.fallback_type = fallback_type
+        self.text_limit = text_limit
+        self.defaults = {name: spec.get('default', f'{name}/personal') for name, spec in types.items()}
+        self.categories = [rule['category'] for rule in rules]
+        
+        # Longest extension first so '.tar.gz' beats '.gz'; the first type listing one owns it
+        extensions = sorted(((ext.lower(), name) for name, spec in types.items()
+                             for ext in spec.get('extensions', [])), key=lambda item: -len(item[0]))
+        self.extension_types = {}
+        for ext, name in extensions:
+            self.extension_types.setdefault(ext, name)
+        self.extension_re = re.compile('|'.join(re.escape(ext) + '$' for ext, _ in extensions)) if extensions else None
+        self.mimetype_types = [(prefix.lower(), name) for name, spec in types.items()
+                               for prefix in spec.get('mimetypes', [])]
+        
+        # One pattern per (type, field); group rN names the rule that matched
+        self.patterns = {}
+        for name in types:
+            for field in MATCH_FIELDS:
+                groups = []
+                for index, rule in enumerate(rules):
+                    if rule.get('type', name) != name:
+                        continue
+                    if field == 'mimetype':
+                        terms = [re.escape(prefix.lower()) for prefix in rule.get('mimetypes', [])]
+                    elif field in rule.get('fields', ['filename']):
+                        terms = [re.escape(word.lower()) for word in rule.get('keywords', [])]
+                        if field == 'text':
+                            terms = [rf'\b{term}\b' for term in terms]
+                    else:
+                        terms = []
+                    if terms:
+                        groups.append(f"(?P<r{index}>{'|'.join(terms)})")
+                if groups:
+                    # Lookahead tries every position, so overlapping keywords are all seen
+                    pattern = f"^(?:{'|'.join(groups)})" if field == 'mimetype' else f"(?=(?:{'|'.join(groups)}))"
+                    self.patterns[(name, field)] = re.compile(pattern)
+    
+    def file_type(self, filename, filetype=None):
+        """Base type from the extension, else the MIME type, else the fallback"""
+        match = self.extension_re.search(filename) if self.extension_re else None
+        if match:
+            return self.extension_types[match.group(0)]
+        
+        if filetype:
+            filetype = filetype.lower()
+            for prefix, name in self.mimetype_types:
+                if filetype.startswith(prefix):
+                    return name
+        
+        return self.fallback_type
+    
+    def categorize(self, filename, filetype=None, text=None):
+        """Category path such as 'documents/financial' for one file"""
+        filename = filename.lower()
+        name = self.file_type(filename, filetype)
+        
+        values = {
+            'filename': filename,
+            'mimetype': (filetype or '').lower(),
+            'text': (text or '')[:self.text_limit].lower()
+        }
+        for field in MATCH_FIELDS:
+            pattern = self.patterns.get((name, field))
+            if pattern is None or not values[field]:
+                continue
+            best = None
+            for match in pattern.finditer(values[field]):
+                index = int(match.lastgroup[1:])
+                if best is None or index < best:
+                    best = index
+            if best is not None:
+                return self.categories[best]
+        
+        return self.defaults.get(name, f'{name}/personal')
+
+def get_category_rules():
+    """Rules from CATEGORY_TYPES/CATEGORY_RULES (defaults above), compiled once per config"""
+    config = current_app.config
+    types = config.get('CATEGORY_TYPES', DEFAULT_CATEGORY_TYPES)
+    rules = config.get('CATEGORY_RULES', DEFAULT_CATEGORY_RULES)
+    fallback_type = config.get('CATEGORY_FALLBACK_TYPE', 'documents')
+    text_limit = config.get('CATEGORY_TEXT_LIMIT', 20000)
+    
+    key = (id(types), id(rules), fallback_type, text_limit)
+    if _compiled['key'] != key:
+        _compiled['rules'] = CategoryRules(types, rules, fallback_type, text_limit)
+        _compiled['key'] = key
+    
+    return _compiled['rules']
+
+def categorize(filename, filetype=None, text=None):
+    """Category for one file under the configured rules"""
+    return get_category_rules().categorize(filename, filetype, text)
+
+def reclassify_files(move=True, dry_run=False, batch_size=500):
+    """
+    Recompute metadata.auto_category for every live file under the current rules.
+    With move, changed files are moved into their new category directory too.
+    Returns counts: checked, changed, moved, failed.
+    """
+    rules = get_category_rules()
+    counts = {'checked': 0, 'changed': 0, 'moved': 0, 'failed': 0}
+    last_id = 0
+    
+    while True:
+        rows = query_db('''
+            SELECT f.id, f.filename, f.filepath, f.filetype, m.auto_category, m.ocr_text
+            FROM files f
+            JOIN metadata m ON m.file_id = f.id
+            WHERE f.deleted = 0 AND f.id > ?
+            ORDER BY f.id
+            LIMIT ?
+        ''', (last_id, batch_size))
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        counts['checked'] += len(rows)
+        
+        reclassify_rows(rows, rules, counts, move, dry_run)
+    
+    current_app.logger.info(f"Reclassified archive{' (dry run)' if dry_run else ''}: {counts}")
+    return counts
+
+def reclassify_rows(rows, rules, counts, move=True, dry_run=False):
+    """
+    Recategorise one batch of file rows (id, filename, filepath, filetype, auto_category,
+    ocr_text), moving changed files when move is set; adds to counts changed, moved, failed.
+    """
+    from utils.util_storage import relocate_file
+    
+    changes = []
+    for row in rows:
+        category = rules.categorize(row['filename'], row['filetype'], row['ocr_text'])
+        if category != row['auto_category']:
+            changes.append((row, category))
+    counts['changed'] += len(changes)
+    
+    if dry_run or not changes:
+        return
+    
+    # Move first, then record the batch's new categories and paths together
+    moved = []
+    updates = []
+    for row, category in changes:
+        filepath = row['filepath']
+        if move and os.path.exists(filepath):
+            try:
+                filepath = relocate_file(filepath, category)
+                moved.append((filepath, row['filepath']))
+            except OSError as e:
+                current_app.logger.warning(f"Could not move {row['filepath']} to {category}: {str(e)}")
+                counts['failed'] += 1
+                continue
+        updates.append((category, filepath, row['id']))
+    
+    try:
+        with transaction():
+            execute_many('UPDATE metadata SET auto_category = ? WHERE file_id = ?',
+                         [(category, file_id) for category, _, file_id in updates])
+            execute_many('UPDATE files SET filepath = ? WHERE id = ?',
+                         [(filepath, file_id) for _, filepath, file_id in updates])
+    except Exception as e:
+        current_app.logger.error(f"Reclassify batch failed, moving files back: {str(e)}")
+        for new_path, old_path in moved:
+            try:
+                os.rename(new_path, old_path)
+            except OSError:
+                current_app.logger.error(f"Could not move {new_path} back to {old_path}")
+        counts['failed'] += len(updates)
+        return
+    
+    counts['moved'] += len(moved)
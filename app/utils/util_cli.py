@@ -0,0 +1,211 @@
+"""
+/home/life/app/utils/util_cli.py
+Version: 1.0.9
+Purpose: Maintenance commands for the flask CLI (flask --app life <command>)
+Created: 2026-10-18
+Updated: 2026-10-18 - Added run-jobs worker command
+Updated: 2026-10-18 - Added cas-import and gc-objects for the content-addressed store
+Updated: 2026-10-18 - Added rebuild-related
+Updated: 2026-10-18 - Added reclassify
+Updated: 2026-10-18 - Added hash-images
+Updated: 2026-10-18 - Added index-documents
+Updated: 2026-10-18 - Added extract-text
+Updated: 2026-10-18 - Added import-files
+Updated: 2026-10-18 - Added reprocess
+"""
+
+import click
+
+def register_commands(app):
+    """Register maintenance commands on the app"""
+    
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Rebuild the full-text search index for all files"""
+        from utils.util_search import rebuild_search_index
+        
+        count = rebuild_search_index()
+        click.echo(f"Indexed {count} files")
+    
+    @app.cli.command('recount-files')
+    def recount_files_command():
+        """Rebuild the cached per-category file counts"""
+        from utils.util_db import recount_files
+        
+        total = recount_files()
+        click.echo(f"Counted {total} live files")
+    
+    @app.cli.command('rebuild-related')
+    def rebuild_related_command():
+        """Recompute the related-files neighbour table for every file"""
+        from utils.util_related import rebuild_related_files
+        
+        count = rebuild_related_files()
+        click.echo(f"Computed related files for {count} files")
+    
+    @app.cli.command('reclassify')
+    @click.option('--dry-run', is_flag=True, help='Only count the files whose category would change')
+    @click.option('--no-move', is_flag=True, help='Update auto_category but leave files where they are')
+    def reclassify_command(dry_run, no_move):
+        """Recompute every file's category under the current CATEGORY_RULES"""
+        from utils.util_categories import reclassify_files
+        
+        counts = reclassify_files(move=not no_move, dry_run=dry_run)
+        click.echo(f"Checked {counts['checked']}, changed {counts['changed']}, "
+                   f"moved {counts['moved']}, failed {counts['failed']}")
+    
+    @app.cli.command('hash-images')
+    def hash_images_command():
+        """Queue processing for images that have no perceptual hash yet"""
+        from utils.util_db import query_db, transaction
+        from utils.util_jobs import IMAGE_EXTENSIONS, enqueue_job
+        
+        rows = query_db('''
+            SELECT f.id, f.filepath FROM files f
+            LEFT JOIN image_hashes h ON h.file_id = f.id
+            WHERE f.deleted = 0 AND h.file_id IS NULL
+        ''')
+        images = [row['id'] for row in rows if row['filepath'].lower().endswith(IMAGE_EXTENSIONS)]
+        with transaction():
+            for file_id in images:
+                enqueue_job('process_image', file_id)
+        click.echo(f"Queued {len(images)} images")
+    
+    @app.cli.command('index-documents')
+    @click.option('--reindex', is_flag=True, help='Re-sign documents that already have a signature')
+    def index_documents_command(reindex):
+        """Build MinHash signatures for document text and record probable duplicates"""
+        from utils.util_similar import index_documents
+        
+        signed, duplicates = index_documents(reindex=reindex)
+        click.echo(f"Signed {signed} documents, {duplicates} with probable duplicates")
+    
+    @app.cli.command('extract-text')
+    @click.option('--reextract', is_flag=True, help='Also queue files whose text was already extracted')
+    def extract_text_command(reextract):
+        """Queue text extraction for documents in the archive"""
+        from utils.util_db import query_db, transaction
+        from utils.util_jobs import enqueue_job
+        from utils.util_text import can_extract_text
+        
+        rows = query_db(f'''
+            SELECT f.id, f.filepath FROM files f
+            LEFT JOIN file_texts t ON t.file_id = f.id
+            WHERE f.deleted = 0 {'' if reextract else 'AND t.file_id IS NULL'}
+        ''')
+        with transaction():
+            queued = [row['id'] for row in rows if can_extract_text(row['filepath'])]
+            for file_id in queued:
+                enqueue_job('extract_text', file_id)
+        click.echo(f"Queued {len(queued)} files")
+    
+    @app.cli.command('import-files')
+    @click.argument('source', type=click.Path(exists=True, file_okay=False))
+    @click.option('--tags', default='', help='Comma-separated tags for every imported file')
+    @click.option('--link', is_flag=True, help='Hardlink sources into DATA_DIR instead of copying (same filesystem only)')
+    @click.option('--dry-run', is_flag=True, help='Hash, dedupe and categorise only; nothing is stored')
+    @click.option('--checkpoint', type=click.Path(dir_okay=False), help='Checkpoint file (default: one per source under DATA_DIR/.imports)')
+    def import_files_command(source, tags, link, dry_run, checkpoint):
+        """Import an existing directory tree into the archive; rerun to resume"""
+        import time
+        from utils.util_import import import_tree, get_checkpoint_path
+        
+        started = time.monotonic()
+        
+        def progress(counts):
+            elapsed = max(time.monotonic() - started, 0.001)
+            click.echo(f"{counts['scanned']} scanned, {counts['skipped']} skipped, {counts['imported']} imported, "
+                       f"{counts['duplicates']} duplicates, {counts['failed']} failed - "
+                       f"{counts['imported'] / elapsed:.1f} files/s, {counts['bytes'] / elapsed / 1048576:.1f} MB/s")
+        
+        counts = import_tree(source, tags=tags, link=link, dry_run=dry_run,
+                             checkpoint=None if dry_run else checkpoint or get_checkpoint_path(source),
+                             progress=progress)
+        for category, count in sorted(counts['categories'].items()):
+            click.echo(f"  {category}: {count}")
+        click.echo(f"{'Would import' if dry_run else 'Imported'} {counts['imported']} files "
+                   f"({counts['duplicates']} duplicates, {counts['failed']} failed)")
+        if counts['restorable']:
+            click.echo(f"{counts['restorable']} duplicates match deleted files - restore those from Admin > Deleted Files")
+    
+    from utils.util_reprocess import REPROCESS_STAGES
+    
+    @app.cli.command('reprocess')
+    @click.option('--stage', 'stages', multiple=True, required=True, type=click.Choice(REPROCESS_STAGES),
+                  help='Stage to re-run; repeat for several')
+    @click.option('--category', help='Only files whose category starts with this, e.g. images/family')
+    @click.option('--type', 'filetype', help='Only files whose MIME type starts with this, e.g. image/')
+    @click.option('--since', help='Only files uploaded on or after this date (YYYY-MM-DD)')
+    @click.option('--until', help='Only files uploaded before this date (YYYY-MM-DD)')
+    @click.option('--workers', type=int, help='Pool processes (default: half the cores)')
+    @click.option('--pause', type=float, help='Seconds to sleep between batches (default REPROCESS_PAUSE)')
+    @click.option('--nice', type=int, default=10, show_default=True, help='Scheduling priority increment for this run')
+    @click.option('--no-move', is_flag=True, help='Recategorise without moving files')
+    @click.option('--restart', is_flag=True, help='Ignore a saved checkpoint and start from the beginning')
+    def reprocess_command(stages, category, filetype, since, until, workers, pause, nice, no_move, restart):
+        """Re-run pipeline stages over existing files; rerun the same command to resume"""
+        import os
+        from utils.util_reprocess import reprocess_files, get_checkpoint_path
+        
+        # Lower priority before the pools fork so their processes inherit it
+        if nice:
+            os.nice(nice)
+        workers = workers or max(1, (os.cpu_count() or 1) // 2)
+        app.config['IMAGE_PROCESS_WORKERS'] = workers
+        app.config['TEXT_EXTRACT_WORKERS'] = workers
+        
+        filters = {key: value for key, value in
+                   {'category': category, 'filetype': filetype, 'since': since, 'until': until}.items() if value}
+        checkpoint = get_checkpoint_path(stages, filters)
+        if restart and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        
+        def progress(report):
+            click.echo(f"{report['processed']}/{report['total']} files, {report['seconds']:.0f}s, "
+                       f"{report['processed'] / max(report['seconds'], 0.001):.1f} files/s")
+        
+        report = reprocess_files(stages, filters, checkpoint=checkpoint, move=not no_move,
+                                 pause=pause, progress=progress)
+        
+        click.echo(f"Reprocessed {report['processed']} of {report['total']} files in {report['seconds']:.0f}s")
+        for stage, counts in report['stages'].items():
+            click.echo(f"  {stage}: {counts['done']} done, {counts['changed']} changed, {counts['failed']} failed")
+        for failure in report['failures']:
+            click.echo(f"  file {failure['file_id']} {failure['stage']}: {failure['error']}")
+    
+    @app.cli.command('run-jobs')
+    @click.option('--drain', is_flag=True, help='Exit once no job is runnable')
+    def run_jobs_command(drain):
+        """Run background jobs in the foreground (set JOB_WORKERS = 0 to keep them out of the web workers)"""
+        from utils.util_jobs import work_jobs
+        
+        try:
+            count = work_jobs(app, drain=drain)
+        except KeyboardInterrupt:
+            return
+        click.echo(f"Ran {count} jobs")
+    
+    @app.cli.command('cas-import')
+    def cas_import_command():
+        """Link existing archive files into the object store, collapsing duplicate bytes"""
+        from utils.util_db import query_db
+        from utils.util_storage import store_object
+        
+        counts = {'added': 0, 'deduplicated': 0, 'present': 0, 'mismatch': 0, 'failed': 0}
+        for row in query_db('SELECT filepath, checksum FROM files WHERE checksum IS NOT NULL'):
+            try:
+                counts[store_object(row['filepath'], row['checksum'])] += 1
+            except OSError as e:
+                app.logger.warning(f"Could not import {row['filepath']}: {str(e)}")
+                counts['failed'] += 1
+        
+        click.echo(', '.join(f"{count} {status}" for status, count in counts.items()))
+    
+    @app.cli.command('gc-objects')
+    @click.option('--grace', type=int, help='Keep objects changed in the last N seconds (default OBJECT_GC_GRACE)')
+    def gc_objects_command(grace):
+        """Remove stored objects no archive file references any more"""
+        from utils.util_storage import collect_unreferenced_objects
+        
+        removed, freed = collect_unreferenced_objects(grace)
+        click.echo(f"Removed {removed} objects, freed {freed} bytes")
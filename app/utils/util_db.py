@@ -1,67 +1,203 @@
 """
 /home/life/app/utils/util_db.py
-Version: 1.2.0
+Version: 1.8.1
 Purpose: Database operations with contacts and change request tables
 Created: 2025-06-11
 Updated: 2025-06-17 - Added contacts, contact_details, and contact_change_requests tables
+Updated: 2026-10-18 - Pooled, pragma-tuned connections returned to the pool on teardown
+Updated: 2026-10-18 - Per-request query instrumentation and repeated-statement (N+1) warnings
+Updated: 2026-10-18 - transaction() and execute_many for single-commit batches
+Updated: 2026-10-18 - init_db runs versioned migrations instead of re-running DDL
+Updated: 2026-10-18 - attach_file_tags loads tags for a page of files in one query
+Updated: 2026-10-18 - Cached file counts (file_counts table) for browse
+Updated: 2026-10-18 - in_transaction() for caches that must only load committed rows
 """
 
 import sqlite3
 import json
 import os
+import re
+import time
+import queue
+import threading
 from datetime import datetime
-from flask import current_app, g
-from contextlib import closing
+from functools import lru_cache
+from flask import current_app, g, request
+from contextlib import closing, contextmanager
+
+# Per-process connection pool, created lazily by _get_pool()
+_pool = None
+_pool_lock = threading.Lock()
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection tagged with the pool that opened it"""
+    pool = None
+
+def _open_connection(db_path, pool=None):
+    """Open a new SQLite connection with performance pragmas applied"""
+    config = current_app.config
+    busy_timeout = config.get('DB_BUSY_TIMEOUT', 5000)
+    
+    conn = sqlite3.connect(
+        db_path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=busy_timeout / 1000.0,
+        check_same_thread=False,
+        factory=PooledConnection
+    )
+    conn.pool = pool
+    conn.row_factory = sqlite3.Row
+    
+    # WAL lets readers proceed while a writer commits; NORMAL sync is safe with WAL
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f"PRAGMA cache_size=-{int(config.get('DB_CACHE_SIZE_KB', 16384))}")
+    conn.execute(f"PRAGMA mmap_size={int(config.get('DB_MMAP_SIZE', 256 * 1024 * 1024))}")
+    conn.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    
+    if config['DEBUG']:
+        current_app.logger.debug(f"DB connection opened: {db_path}")
+    
+    return conn
+
+def _get_pool():
+    """Get the connection pool for this worker process, creating it if needed"""
+    global _pool
+    
+    db_path = current_app.config['DB_PATH']
+    pid = os.getpid()
+    
+    with _pool_lock:
+        # A forked worker must never reuse connections inherited from its parent
+        if _pool is None or _pool['pid'] != pid or _pool['db_path'] != db_path:
+            if _pool is not None and _pool['pid'] == pid:
+                # DB_PATH changed - idle connections point at the old database
+                while not _pool['idle'].empty():
+                    _pool['idle'].get_nowait().close()
+            _pool = {
+                'pid': pid,
+                'db_path': db_path,
+                'size': max(1, int(current_app.config.get('DB_POOL_SIZE', 5))),
+                'idle': queue.LifoQueue(),
+                'open': 0,
+                'hits': 0,
+                'misses': 0,
+                'waits': 0,
+                'timeouts': 0
+            }
+        return _pool
+
+def _acquire_connection():
+    """Take an idle pooled connection, open a new one, or wait for one to be returned"""
+    pool = _get_pool()
+    
+    try:
+        conn = pool['idle'].get_nowait()
+        with _pool_lock:
+            pool['hits'] += 1
+        return conn
+    except queue.Empty:
+        pass
+    
+    with _pool_lock:
+        can_open = pool['open'] < pool['size']
+        if can_open:
+            pool['open'] += 1
+            pool['misses'] += 1
+        else:
+            pool['waits'] += 1
+    
+    if can_open:
+        try:
+            return _open_connection(pool['db_path'], pool)
+        except Exception:
+            with _pool_lock:
+                pool['open'] -= 1
+            raise
+    
+    try:
+        return pool['idle'].get(timeout=current_app.config.get('DB_POOL_TIMEOUT', 10))
+    except queue.Empty:
+        with _pool_lock:
+            pool['timeouts'] += 1
+        current_app.logger.error(f"DB pool exhausted: {pool['open']} connections in use")
+        raise sqlite3.OperationalError('Timed out waiting for a pooled database connection')
+
+def _release_connection(conn):
+    """Return a connection to the pool it came from, discarding it if it is unusable"""
+    pool = conn.pool
+    
+    if pool is not _get_pool():
+        # Its pool was replaced (fork or DB_PATH change) - never mix it into the new one
+        if pool is None or pool['pid'] == os.getpid():
+            conn.close()
+        return
+    
+    try:
+        # Never hand a half-finished transaction to the next request
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error as e:
+        current_app.logger.warning(f"Discarding broken DB connection: {str(e)}")
+        conn.close()
+        with _pool_lock:
+            pool['open'] = max(0, pool['open'] - 1)
+        return
+    
+    pool['idle'].put(conn)
 
 def get_db():
     """Get database connection for current request"""
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DB_PATH'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
-        
-        if current_app.config['DEBUG']:
-            current_app.logger.debug(f"DB connection opened: {current_app.config['DB_PATH']}")
+        g.db = _acquire_connection()
     
     return g.db
 
 def close_db(error=None):
-    """Close database connection"""
+    """Return database connection to the pool"""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        _release_connection(db)
         if current_app.config['DEBUG']:
-            current_app.logger.debug("DB connection closed")
+            current_app.logger.debug("DB connection returned to pool")
+
+def get_pool_stats():
+    """Connection pool statistics for sizing DB_POOL_SIZE"""
+    pool = _get_pool()
+    
+    with _pool_lock:
+        return {
+            'size': pool['size'],
+            'open': pool['open'],
+            'idle': pool['idle'].qsize(),
+            'in_use': pool['open'] - pool['idle'].qsize(),
+            'hits': pool['hits'],
+            'misses': pool['misses'],
+            'waits': pool['waits'],
+            'timeouts': pool['timeouts']
+        }
 
 def init_db():
-    """Initialize database with schema"""
+    """Initialize database - apply any pending schema migrations"""
+    from utils.util_migrations import run_migrations
+    
     db_path = current_app.config['DB_PATH']
     db_dir = os.path.dirname(db_path)
     
     # Ensure database directory exists
     os.makedirs(db_dir, exist_ok=True)
     
-    with closing(sqlite3.connect(db_path)) as db:
-        # Read and execute schema
-        schema_path = os.path.join(os.path.dirname(__file__), '..', 'models', 'schema.sql')
-        if os.path.exists(schema_path):
-            with open(schema_path, 'r') as f:
-                db.executescript(f.read())
-        else:
-            # Create tables if schema.sql doesn't exist
-            create_tables(db)
-        
-        # Insert default data
-        insert_defaults(db)
-        db.commit()
+    # Generous timeout: another worker may be holding the lock while it migrates
+    timeout = current_app.config.get('DB_MIGRATION_TIMEOUT', 600)
+    with closing(sqlite3.connect(db_path, timeout=timeout)) as db:
+        version = run_migrations(db)
     
     if current_app.config['DEBUG']:
-        current_app.logger.debug(f"Database initialized at: {db_path}")
+        current_app.logger.debug(f"Database initialized at: {db_path} (schema version {version})")
 
 def create_tables(db):
-    """Create database tables"""
+    """Create database tables (baseline schema, applied by migration 1)"""
     # Files table with soft delete
     db.execute('''
         CREATE TABLE IF NOT EXISTS files (
@@ -305,6 +441,67 @@ def insert_defaults(db):
     if current_app.config['DEBUG']:
         current_app.logger.debug("Default data inserted")
 
+@lru_cache(maxsize=512)
+def _normalize_query(query):
+    """Collapse whitespace and literals so repeated statements group together"""
+    normalized = re.sub(r"'(?:[^']|'')*'", '?', query)
+    normalized = re.sub(r'\b\d+(?:\.\d+)?\b', '?', normalized)
+    return ' '.join(normalized.split())
+
+def _record_query(query, elapsed, rows):
+    """Record one statement in the per-request query stats"""
+    stats = g.get('db_stats')
+    if stats is None:
+        stats = g.db_stats = {
+            'count': 0,
+            'time': 0.0,
+            'rows': 0,
+            'statements': {},
+            'slowest': []
+        }
+    
+    normalized = _normalize_query(query)
+    stats['count'] += 1
+    stats['time'] += elapsed
+    stats['rows'] += rows
+    stats['statements'][normalized] = stats['statements'].get(normalized, 0) + 1
+    
+    # Keep only the slowest few statements
+    slowest = stats['slowest']
+    slowest.append((elapsed, normalized))
+    if len(slowest) > current_app.config.get('DB_SLOWEST_TRACKED', 5):
+        slowest.sort(reverse=True)
+        slowest.pop()
+
+def get_query_stats():
+    """Query stats recorded so far for the current request"""
+    return g.get('db_stats')
+
+def report_query_stats(error=None):
+    """Log per-request DB stats and warn about repeated statements (N+1 patterns)"""
+    stats = g.pop('db_stats', None)
+    if not stats:
+        return
+    
+    config = current_app.config
+    endpoint = request.endpoint or request.path
+    
+    threshold = config.get('DB_REPEAT_QUERY_THRESHOLD', 10)
+    for statement, count in stats['statements'].items():
+        if count > threshold:
+            current_app.logger.warning(f"Possible N+1 in {endpoint}: statement ran {count} times: "
+                                       f"{statement[:200]}")
+    
+    total_ms = stats['time'] * 1000
+    if total_ms > config.get('DB_SLOW_REQUEST_MS', 500):
+        slowest = ', '.join(f"{elapsed * 1000:.1f}ms {statement[:80]}"
+                            for elapsed, statement in sorted(stats['slowest'], reverse=True))
+        current_app.logger.warning(f"Slow DB work in {endpoint}: {stats['count']} queries, "
+                                   f"{total_ms:.1f}ms - slowest: {slowest}")
+    elif config['DEBUG']:
+        current_app.logger.debug(f"DB stats for {endpoint}: {stats['count']} queries, "
+                                 f"{total_ms:.1f}ms, {stats['rows']} rows")
+
 def query_db(query, args=(), one=False):
     """Execute query and return results"""
     if current_app.config['DEBUG']:
@@ -312,8 +509,10 @@ def query_db(query, args=(), one=False):
         current_app.logger.debug(f"DB Args: {args}")
     
     db = get_db()
+    started = time.perf_counter()
     cur = db.execute(query, args)
     rv = cur.fetchall()
+    _record_query(query, time.perf_counter() - started, len(rv))
     
     if current_app.config['DEBUG']:
         current_app.logger.debug(f"DB Result count: {len(rv)}")
@@ -327,14 +526,141 @@ def execute_db(query, args=()):
         current_app.logger.debug(f"DB Args: {args}")
     
     db = get_db()
+    started = time.perf_counter()
     cur = db.execute(query, args)
-    db.commit()
+    if not g.get('db_transaction_depth'):
+        db.commit()
+    _record_query(query, time.perf_counter() - started, max(cur.rowcount, 0))
     
     if current_app.config['DEBUG']:
         current_app.logger.debug(f"DB Rows affected: {cur.rowcount}")
     
     return cur.lastrowid
 
+def execute_many(query, args_list):
+    """Execute one modifying statement for every args tuple, committing once"""
+    args_list = list(args_list)
+    if not args_list:
+        return 0
+    
+    if current_app.config['DEBUG']:
+        current_app.logger.debug(f"DB Execute many ({len(args_list)}): {query}")
+    
+    db = get_db()
+    started = time.perf_counter()
+    cur = db.executemany(query, args_list)
+    if not g.get('db_transaction_depth'):
+        db.commit()
+    _record_query(query, time.perf_counter() - started, max(cur.rowcount, 0))
+    
+    if current_app.config['DEBUG']:
+        current_app.logger.debug(f"DB Rows affected: {cur.rowcount}")
+    
+    return cur.rowcount
+
+@contextmanager
+def transaction():
+    """
+    Group execute_db/execute_many calls into one transaction with a single commit.
+    Nested blocks join the outermost transaction; any exception rolls it all back.
+    """
+    db = get_db()
+    depth = g.get('db_transaction_depth', 0)
+    
+    if depth == 0 and not db.in_transaction:
+        # Take the write lock up front so a read-then-write cannot fail on lock upgrade
+        db.execute('BEGIN IMMEDIATE')
+    
+    g.db_transaction_depth = depth + 1
+    try:
+        yield db
+    except Exception:
+        g.db_transaction_depth = depth
+        if depth == 0:
+            db.rollback()
+        raise
+    
+    g.db_transaction_depth = depth
+    if depth == 0:
+        db.commit()
+
+def in_transaction():
+    """True inside a transaction() block, whose writes other connections cannot see yet"""
+    return bool(g.get('db_transaction_depth'))
+
+def attach_file_tags(rows):
+    """
+    Convert file rows to dicts and add each file's tag names.
+    Loads tags for the whole page in one IN (...) query instead of one per file.
+    """
+    files = [dict(row) for row in rows]
+    if not files:
+        return files
+    
+    file_ids = list({f['id'] for f in files})
+    tags_by_file = {}
+    
+    # Stay well under SQLite's bound-parameter limit
+    for start in range(0, len(file_ids), 500):
+        chunk = file_ids[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        tag_rows = query_db(f'''
+            SELECT ft.file_id, t.name
+            FROM file_tags ft
+            JOIN tags t ON t.id = ft.tag_id
+            WHERE ft.file_id IN ({placeholders})
+        ''', chunk)
+        
+        for tag_row in tag_rows:
+            tags_by_file.setdefault(tag_row['file_id'], []).append(tag_row['name'])
+    
+    for f in files:
+        f['tags'] = tags_by_file.get(f['id'], [])
+    
+    return files
+
+# Recompute file_counts from scratch; triggers keep it current afterwards
+RECOUNT_FILES_SQL = (
+    'DELETE FROM file_counts',
+    '''
+        INSERT INTO file_counts (category, count)
+        SELECT '*', COUNT(*) FROM files WHERE deleted = 0
+    ''',
+    '''
+        INSERT INTO file_counts (category, count)
+        SELECT m.auto_category, COUNT(*)
+        FROM files f
+        JOIN metadata m ON f.id = m.file_id
+        WHERE f.deleted = 0 AND m.auto_category IS NOT NULL
+        GROUP BY m.auto_category
+    '''
+)
+
+def get_file_counts():
+    """
+    Cached live file counts maintained by triggers
+    Returns: (total count, list of {'auto_category', 'count'} rows ordered by category)
+    """
+    rows = query_db('SELECT category, count FROM file_counts WHERE count > 0 ORDER BY category')
+    
+    total = 0
+    categories = []
+    for row in rows:
+        if row['category'] == '*':
+            total = row['count']
+        else:
+            categories.append({'auto_category': row['category'], 'count': row['count']})
+    
+    return total, categories
+
+def recount_files():
+    """Rebuild the cached file counts; returns the live file total"""
+    with transaction():
+        for statement in RECOUNT_FILES_SQL:
+            execute_db(statement)
+    
+    return get_file_counts()[0]
+
 def parse_any_timestamp(timestamp_str):
     """Handle ALL timestamp formats created across sessions."""
     if not timestamp_str:
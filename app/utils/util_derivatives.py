@@ -0,0 +1,191 @@
+"""
+/home/life/app/utils/util_derivatives.py
+Version: 1.1.0
+Purpose: Bounded on-disk cache of resized image derivatives with LRU eviction
+Created: 2026-10-18
+Updated: 2026-10-18 - drop_derivatives for re-rendering after size changes
+"""
+
+import os
+import threading
+from PIL import features
+from flask import current_app
+from utils.util_db import query_db, execute_db, execute_many, transaction
+from utils.util_image import run_image_pipeline
+
+# Named sizes (longest edge in px) - override with DERIVATIVE_SIZES
+DEFAULT_DERIVATIVE_SIZES = {'thumb': 200, 'medium': 800, 'large': 1600}
+
+# format name: (PIL format, file extension, mimetype)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+
+# Per-process running cache size: {'key': (pid, DB_PATH), 'bytes', 'registrations' since the last recount}
+_cache_total = {'key': None, 'bytes': 0, 'registrations': 0}
+_cache_total_lock = threading.Lock()
+
+def get_derivative_sizes():
+    """Configured derivative sizes"""
+    return current_app.config.get('DERIVATIVE_SIZES', DEFAULT_DERIVATIVE_SIZES)
+
+def get_derivative_dir():
+    """Cache directory - hidden under DATA_DIR so orphan scans and backups of the archive skip it"""
+    cache_dir = current_app.config.get('DERIVATIVE_CACHE_DIR',
+                                       os.path.join(current_app.config['DATA_DIR'], '.derivatives'))
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def get_derivative_path(checksum, size_name, fmt):
+    """Cache path keyed by content checksum, so an edited file never serves a stale derivative"""
+    return os.path.join(get_derivative_dir(), checksum[:2],
+                        f"{checksum}_{size_name}.{DERIVATIVE_FORMATS[fmt][1]}")
+
+def default_format():
+    """Format rendered ahead of requests - WebP when Pillow can write it"""
+    return 'webp' if features.check('webp') else 'jpeg'
+
+def choose_format(accept_mimetypes):
+    """WebP for clients that accept it (and when Pillow can write it), JPEG otherwise"""
+    if accept_mimetypes.quality('image/webp') > 0:
+        return default_format()
+    return 'jpeg'
+
+def derivative_outputs(checksum, size_names, fmt):
+    """run_image_pipeline outputs for the given sizes of one file"""
+    sizes = get_derivative_sizes()
+    quality = current_app.config.get('IMAGE_QUALITY', 85)
+    return [(get_derivative_path(checksum, size_name, fmt), sizes[size_name],
+             DERIVATIVE_FORMATS[fmt][0], quality)
+            for size_name in size_names]
+
+def get_derivative(file, size_name, fmt):
+    """
+    Path of a cached derivative for a file row (id, filepath, checksum), rendering it
+    on first request. Returns None if the image cannot be decoded.
+    """
+    path = get_derivative_path(file['checksum'], size_name, fmt)
+    
+    if os.path.exists(path):
+        touch_derivative(path)
+        return path
+    
+    result = run_image_pipeline(file['filepath'], derivative_outputs(file['checksum'], [size_name], fmt))
+    if result['error']:
+        current_app.logger.error(f"Failed to render {size_name} for file {file['id']}: {result['error']}")
+        return None
+    
+    register_derivatives(file['checksum'], result['derivatives'])
+    check_derivative_budget(keep={path})
+    
+    if current_app.config['DEBUG']:
+        current_app.logger.debug(f"Rendered {size_name}/{fmt} for file {file['id']}: {result['timings']}")
+    
+    return path
+
+def register_derivatives(checksum, derivatives):
+    """
+    Record newly written derivatives [(path, bytes)]. Joins the caller's transaction;
+    call check_derivative_budget once it has committed.
+    """
+    if not derivatives:
+        return
+    
+    execute_many('''
+        INSERT OR REPLACE INTO derivative_cache (path, checksum, bytes, last_access)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ''', [(path, checksum, size) for path, size in derivatives])
+    
+    with _cache_total_lock:
+        _cache_total['bytes'] += sum(size for _, size in derivatives)
+        _cache_total['registrations'] += 1
+
+def drop_derivatives(checksum, keep=()):
+    """
+    Forget a file's cached derivatives other than keep, so they re-render at current sizes.
+    Returns the paths to pass to remove_derivative_files once the caller has committed.
+    """
+    rows = query_db('SELECT path FROM derivative_cache WHERE checksum = ?', (checksum,))
+    stale = [row['path'] for row in rows if row['path'] not in keep]
+    execute_many('DELETE FROM derivative_cache WHERE path = ?', [(path,) for path in stale])
+    return stale
+
+def remove_derivative_files(paths):
+    """Delete derivative files whose cache rows are gone"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            current_app.logger.error(f"Error removing derivative {path}: {e}")
+
+def touch_derivative(path):
+    """Mark a derivative as used; at most one write per hour per file keeps hits cheap"""
+    execute_db('''
+        UPDATE derivative_cache SET last_access = CURRENT_TIMESTAMP
+        WHERE path = ? AND last_access < datetime('now', '-1 hour')
+    ''', (path,))
+
+def get_cache_total():
+    """
+    Cache size in bytes as tracked by this process - summed from the table on first use
+    and every DERIVATIVE_RECOUNT_EVERY registrations, which also picks up other processes' renders
+    """
+    with _cache_total_lock:
+        if _cache_total['key'] == (os.getpid(), current_app.config['DB_PATH']) and \
+                _cache_total['registrations'] < current_app.config.get('DERIVATIVE_RECOUNT_EVERY', 100):
+            return _cache_total['bytes']
+    
+    total = query_db('SELECT COALESCE(SUM(bytes), 0) as total FROM derivative_cache', one=True)['total']
+    _set_cache_total(total)
+    return total
+
+def _set_cache_total(total):
+    with _cache_total_lock:
+        _cache_total.update(key=(os.getpid(), current_app.config['DB_PATH']), bytes=total, registrations=0)
+
+def check_derivative_budget(keep=()):
+    """
+    Evict when the running total is over DERIVATIVE_CACHE_MAX_MB. Removes files, so call
+    it outside transactions - after the batch that registered the derivatives commits.
+    Returns the number of files removed.
+    """
+    budget_bytes = current_app.config.get('DERIVATIVE_CACHE_MAX_MB', 2048) * 1024 * 1024
+    if get_cache_total() <= budget_bytes:
+        return 0
+    return evict_derivatives(budget_bytes, keep)
+
+def evict_derivatives(budget_bytes=None, keep=()):
+    """
+    Delete least recently used derivatives (other than keep) until the cache is back
+    under 90% of DERIVATIVE_CACHE_MAX_MB. Returns the number of files removed.
+    """
+    if budget_bytes is None:
+        budget_bytes = current_app.config.get('DERIVATIVE_CACHE_MAX_MB', 2048) * 1024 * 1024
+    
+    total = query_db('SELECT COALESCE(SUM(bytes), 0) as total FROM derivative_cache', one=True)['total']
+    if total <= budget_bytes:
+        _set_cache_total(total)
+        return 0
+    
+    # Evict down to 90% so the next few renders do not each trigger a scan
+    target = budget_bytes * 0.9
+    evicted = []
+    for row in query_db('SELECT path, bytes FROM derivative_cache ORDER BY last_access, path'):
+        if total <= target:
+            break
+        if row['path'] in keep:
+            continue
+        evicted.append(row['path'])
+        total -= row['bytes']
+    
+    with transaction():
+        execute_many('DELETE FROM derivative_cache WHERE path = ?', [(path,) for path in evicted])
+    remove_derivative_files(evicted)
+    
+    _set_cache_total(total)
+    
+    current_app.logger.info(f"Evicted {len(evicted)} derivatives, cache now {total / 1048576:.1f} MB")
+    return len(evicted)
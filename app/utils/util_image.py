@@ -1,13 +1,21 @@
 """
 /home/life/app/utils/util_image.py
-Version: 1.0.0
-Purpose: Image processing - HEIC conversion, resizing, thumbnails
+Version: 1.4.0
+Purpose: Image processing - decoding, derivative rendering, metadata
 Created: 2025-06-11
+Updated: 2026-10-18 - Process-pool pipeline for batches of images on the shared util_pool helper
+Updated: 2026-10-18 - Single decode with JPEG draft mode, metadata and per-stage timings
+Updated: 2026-10-18 - Originals are never rewritten; pipeline renders cache derivatives instead
+Updated: 2026-10-18 - Perceptual difference hash computed from the pipeline's decode
 """
 
 import os
+import math
+import time
+import tempfile
 from PIL import Image
 from flask import current_app
+from utils.util_pool import map_in_pool
 
 # Try to import HEIC support
 try:
@@ -17,184 +25,154 @@ try:
 except ImportError:
     HEIC_SUPPORT = False
 
-def process_image_file(filepath):
+# Smallest decode that still gives the difference hash enough detail
+HASH_DECODE_PX = 256
+
+# EXIF Orientation -> transpose that makes the pixels upright
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90
+}
+
+def run_image_pipeline(filepath, outputs, image_hash=False):
     """
-    Process image file - convert HEIC to JPG, resize if needed
-    Returns: path to processed file
+    Decode an image once and render every requested derivative from it, reading
+    EXIF/dimension metadata from the header on the way. The original is only read.
+    outputs: list of (path, max_px, PIL format, quality), rendered largest first so
+    each size is downscaled from the previous one. JPEGs use draft mode to decode
+    at the smallest 1/2, 1/4 or 1/8 scale that still covers the largest output.
+    image_hash adds the 64-bit difference hash of the decoded image.
+    Runs in a pool process, so it only takes plain arguments and never touches current_app.
+    Returns: dict with source, derivatives [(path, bytes)], metadata, image_hash, timings (ms) and error
     """
+    result = {'source': filepath, 'derivatives': [], 'metadata': {}, 'image_hash': None, 'timings': {}, 'error': None}
+    clock = [time.perf_counter()]
+    
+    def mark(stage):
+        now = time.perf_counter()
+        result['timings'][stage] = round((now - clock[0]) * 1000, 1)
+        clock[0] = now
+    
     try:
-        # Check if file is HEIC
-        if filepath.lower().endswith('.heic'):
-            if not HEIC_SUPPORT:
-                if current_app:
-                    current_app.logger.error("HEIC file uploaded but pillow-heif not installed")
-                return filepath
-            
-            # Convert HEIC to JPG
-            new_filepath = convert_heic_to_jpg(filepath)
-            if new_filepath != filepath:
-                # Remove original HEIC file
-                os.remove(filepath)
-                filepath = new_filepath
-        
-        # Resize if needed
-        filepath = resize_image_if_needed(filepath)
+        if filepath.lower().endswith('.heic') and not HEIC_SUPPORT:
+            raise RuntimeError("HEIC file uploaded but pillow-heif not installed")
         
-        # Generate thumbnail
-        generate_thumbnail(filepath)
+        img = Image.open(filepath)
+        result['metadata'] = read_image_metadata(img)
+        mark('open')
         
-        return filepath
+        if not outputs and not image_hash:
+            return result
         
-    except Exception as e:
-        if current_app:
-            current_app.logger.error(f"Error processing image {filepath}: {str(e)}")
-        return filepath
-
-def convert_heic_to_jpg(heic_path):
-    """Convert HEIC file to JPG"""
-    try:
-        # Open HEIC file
-        img = Image.open(heic_path)
+        outputs = sorted(outputs, key=lambda output: output[1], reverse=True)
         
-        # Convert to RGB if necessary
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        # Decode once, at the smallest resolution the largest output (or the hash) needs
+        largest = outputs[0][1] if outputs else HASH_DECODE_PX
+        scale = min(1.0, largest / max(img.size))
+        img.draft(img.mode, (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+        img.load()
+        mark('decode')
         
-        # Create new filename
-        jpg_path = heic_path.rsplit('.', 1)[0] + '.jpg'
+        if image_hash:
+            result['image_hash'] = compute_dhash(img)
+            mark('hash')
         
-        # Save as JPG
-        img.save(jpg_path, 'JPEG', quality=current_app.config.get('IMAGE_QUALITY', 85))
-        
-        if current_app.config['DEBUG']:
-            current_app.logger.debug(f"Converted HEIC to JPG: {heic_path} -> {jpg_path}")
-        
-        return jpg_path
+        for path, max_px, image_format, quality in outputs:
+            img.thumbnail((max_px, max_px), Image.Resampling.LANCZOS)
+            result['derivatives'].append((path, save_derivative(img, path, image_format, quality)))
+        mark('render')
         
     except Exception as e:
-        current_app.logger.error(f"Failed to convert HEIC: {str(e)}")
-        return heic_path
+        result['error'] = str(e)
+    
+    return result
 
-def resize_image_if_needed(image_path):
-    """Resize image if larger than configured max size"""
-    try:
-        max_size = current_app.config.get('IMAGE_MAX_SIZE', 1024)
-        
-        # Open image
-        img = Image.open(image_path)
-        
-        # Check if resize needed
-        if max(img.size) <= max_size:
-            return image_path
-        
-        # Calculate new size maintaining aspect ratio
-        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-        
-        # Save resized image
-        if image_path.lower().endswith('.jpg') or image_path.lower().endswith('.jpeg'):
-            img.save(image_path, 'JPEG', quality=current_app.config.get('IMAGE_QUALITY', 85))
-        elif image_path.lower().endswith('.png'):
-            img.save(image_path, 'PNG', optimize=True)
-        else:
-            img.save(image_path)
-        
-        if current_app.config['DEBUG']:
-            current_app.logger.debug(f"Resized image: {image_path} to max dimension {max_size}px")
-        
-        return image_path
-        
-    except Exception as e:
-        current_app.logger.error(f"Failed to resize image: {str(e)}")
-        return image_path
+def compute_dhash(img):
+    """
+    64-bit difference hash: 9x8 grayscale, one bit per horizontally adjacent pair.
+    Taken upright per the EXIF orientation so a re-export that rotated the pixels
+    hashes the same. Returned as a signed 64-bit int to fit an SQLite INTEGER.
+    """
+    gray = img.convert('L')
+    transpose = EXIF_TRANSPOSE.get(img.getexif().get(0x0112))
+    if transpose is not None:
+        gray = gray.transpose(transpose)
+    
+    # One byte per pixel in an 'L' image
+    pixels = gray.resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    
+    return value - (1 << 64) if value >= 1 << 63 else value
 
-def generate_thumbnail(image_path):
-    """Generate thumbnail for image"""
+def save_derivative(img, path, image_format, quality):
+    """Write an image atomically (temp file + rename) so readers never see a partial file; returns bytes"""
+    if image_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unique per call - threads in one process can render the same derivative at once
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
     try:
-        # Create thumbnail directory
-        thumb_dir = os.path.join(os.path.dirname(image_path), '.thumbnails')
-        os.makedirs(thumb_dir, exist_ok=True)
-        
-        # Thumbnail path
-        filename = os.path.basename(image_path)
-        thumb_path = os.path.join(thumb_dir, f"thumb_{filename}")
-        
-        # Skip if thumbnail exists
-        if os.path.exists(thumb_path):
-            return thumb_path
-        
-        # Open and create thumbnail
-        img = Image.open(image_path)
-        img.thumbnail((200, 200), Image.Resampling.LANCZOS)
-        
-        # Save thumbnail
-        if image_path.lower().endswith('.jpg') or image_path.lower().endswith('.jpeg'):
-            img.save(thumb_path, 'JPEG', quality=70)
-        elif image_path.lower().endswith('.png'):
-            img.save(thumb_path, 'PNG', optimize=True)
-        else:
-            img.save(thumb_path)
-        
-        if current_app.config['DEBUG']:
-            current_app.logger.debug(f"Generated thumbnail: {thumb_path}")
-        
-        return thumb_path
-        
-    except Exception as e:
-        current_app.logger.error(f"Failed to generate thumbnail: {str(e)}")
-        return None
+        with os.fdopen(fd, 'wb') as f:
+            img.save(f, image_format, quality=quality)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return os.path.getsize(path)
 
 def get_image_metadata(image_path):
     """Extract EXIF data from image"""
     try:
-        img = Image.open(image_path)
-        
-        # Get basic info
-        metadata = {
-            'width': img.width,
-            'height': img.height,
-            'format': img.format,
-            'mode': img.mode
-        }
-        
-        # Try to get EXIF data
-        if hasattr(img, '_getexif') and img._getexif():
-            from PIL.ExifTags import TAGS
-            exif = img._getexif()
-            
-            for tag_id, value in exif.items():
-                tag = TAGS.get(tag_id, tag_id)
-                metadata[tag] = value
-        
-        return metadata
+        # Header only - no pixel data is decoded
+        return read_image_metadata(Image.open(image_path))
         
     except Exception as e:
         current_app.logger.error(f"Failed to extract image metadata: {str(e)}")
         return {}
 
-def rotate_image(image_path, degrees):
-    """Rotate image by specified degrees"""
-    try:
-        img = Image.open(image_path)
-        
-        # Rotate
-        rotated = img.rotate(degrees, expand=True)
-        
-        # Save
-        if image_path.lower().endswith('.jpg') or image_path.lower().endswith('.jpeg'):
-            rotated.save(image_path, 'JPEG', quality=current_app.config.get('IMAGE_QUALITY', 85))
-        elif image_path.lower().endswith('.png'):
-            rotated.save(image_path, 'PNG', optimize=True)
-        else:
-            rotated.save(image_path)
-        
-        # Regenerate thumbnail
-        generate_thumbnail(image_path)
-        
-        if current_app.config['DEBUG']:
-            current_app.logger.debug(f"Rotated image {degrees} degrees: {image_path}")
-        
-        return True
-        
-    except Exception as e:
-        current_app.logger.error(f"Failed to rotate image: {str(e)}")
-        return False
\ No newline at end of file
+def read_image_metadata(img):
+    """
+    Dimensions, format and EXIF tags of an opened image, read from its header.
+    Only plain str/int/float values are kept so the result pickles and serialises.
+    """
+    metadata = {
+        'width': img.width,
+        'height': img.height,
+        'format': img.format,
+        'mode': img.mode
+    }
+    
+    # Try to get EXIF data
+    if hasattr(img, '_getexif') and img._getexif():
+        from PIL.ExifTags import TAGS
+        exif = img._getexif()
+        
+        for tag_id, value in exif.items():
+            if isinstance(value, (str, int, float)):
+                metadata[TAGS.get(tag_id, tag_id)] = value.strip('\x00 ') if isinstance(value, str) else value
+    
+    return metadata
+
+def process_images_parallel(tasks):
+    """
+    Run run_image_pipeline over several images across IMAGE_PROCESS_WORKERS processes
+    (inline when 0). tasks: list of (filepath, outputs[, image_hash]) as taken by
+    run_image_pipeline. Each file is allowed IMAGE_PROCESS_TIMEOUT seconds; files that
+    overrun or crash a worker come back with an error instead of stalling the batch.
+    Returns: list of result dicts in tasks order
+    """
+    config = current_app.config
+    return map_in_pool('image', config.get('IMAGE_PROCESS_WORKERS', os.cpu_count() or 1),
+                       run_image_pipeline, tasks, config.get('IMAGE_PROCESS_TIMEOUT', 120),
+                       lambda task, error: {'source': task[0], 'derivatives': [], 'error': error})
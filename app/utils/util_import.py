@@ -0,0 +1,297 @@
+"""
+/home/life/app/utils/util_import.py
+Version: 1.0.0
+Purpose: Bulk import of existing directory trees - parallel hashing and staging, bulk dedupe,
+         batched inserts, resumable through a checkpoint file
+Created: 2026-10-18
+"""
+
+import os
+import uuid
+import shutil
+import hashlib
+import magic
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.utils import secure_filename
+from utils.util_db import query_db, execute_db, transaction
+from utils.util_storage import (StagedUpload, UPLOAD_HEAD_SIZE, allowed_file, get_staging_dir,
+                                get_file_type_from_extension, get_file_category, move_to_storage)
+from utils.util_ingest import add_file_tags
+from utils.util_jobs import enqueue_file_jobs
+from utils.util_related import mark_related_dirty
+
+# Read size while hashing/copying sources
+IMPORT_CHUNK_SIZE = 1024 * 1024
+
+# Checksums per dedupe query (SQLite's 999 variable limit)
+DEDUPE_QUERY_SIZE = 900
+
+def scan_tree(root):
+    """Yield the path of every allowed file under root, skipping hidden entries and symlinks"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                subdirs = []
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and allowed_file(entry.name):
+                        yield entry.path
+        except OSError as e:
+            current_app.logger.warning(f"Cannot read {directory}: {str(e)}")
+            continue
+        
+        # Visit subdirectories in name order so progress follows the tree
+        stack.extend(sorted(subdirs, reverse=True))
+
+def get_checkpoint_path(root):
+    """Default checkpoint for importing root: DATA_DIR/.imports/<hash of the absolute path>.txt"""
+    key = hashlib.md5(os.path.abspath(root).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(current_app.config['DATA_DIR'], '.imports', f'{key}.txt')
+
+def load_checkpoint(path):
+    """Source paths an earlier run already finished with"""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8', errors='surrogateescape') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+def append_checkpoint(path, sources):
+    """Record finished source paths; appended after each committed batch"""
+    if not path or not sources:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8', errors='surrogateescape') as f:
+        f.writelines(f'{source}\n' for source in sources)
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_source(source, staging_dir=None, link=False):
+    """
+    Hash one source file and, unless staging_dir is None (dry run), stage it for storage:
+    copied in the same read pass, or hardlinked when link is set. Runs in the hashing pool.
+    Returns: {'source', 'checksum', 'head', 'size', 'staged', 'error'}
+    """
+    result = {'source': source, 'checksum': None, 'head': b'', 'size': 0, 'staged': None, 'error': None}
+    suffix = os.path.splitext(secure_filename(os.path.basename(source)))[1].lower()
+    staged = None
+    
+    try:
+        if staging_dir is None or link:
+            hash_obj = hashlib.md5()
+            with open(source, 'rb') as f:
+                result['head'] = f.read(UPLOAD_HEAD_SIZE)
+                hash_obj.update(result['head'])
+                for chunk in iter(lambda: f.read(IMPORT_CHUNK_SIZE), b''):
+                    hash_obj.update(chunk)
+            result['checksum'] = hash_obj.hexdigest()
+            result['size'] = os.path.getsize(source)
+            
+            if staging_dir is not None:
+                staged = os.path.join(staging_dir, f"import_{uuid.uuid4().hex}{suffix}")
+                try:
+                    os.link(source, staged)
+                except OSError:
+                    # Source on another filesystem - fall back to a copy
+                    shutil.copyfile(source, staged)
+                result['staged'] = staged
+        else:
+            staged = StagedUpload(staging_dir, suffix)
+            with open(source, 'rb') as f:
+                for chunk in iter(lambda: f.read(IMPORT_CHUNK_SIZE), b''):
+                    staged.write(chunk)
+            result['staged'] = staged.finish()
+            result['checksum'] = staged.checksum
+            result['head'] = staged.head
+            result['size'] = staged.size
+    
+    except OSError as e:
+        result['error'] = str(e)
+        if isinstance(staged, StagedUpload):
+            staged.discard()
+        elif staged and os.path.exists(staged):
+            os.remove(staged)
+        result['staged'] = None
+    
+    return result
+
+def find_archived_checksums(checksums):
+    """
+    {checksum: deleted} for the checksums any file row already holds - deleted is True
+    when only soft-deleted files have it. files.checksum is unique across deleted rows
+    too, so those are never inserted again.
+    """
+    checksums = list(checksums)
+    found = {}
+    for start in range(0, len(checksums), DEDUPE_QUERY_SIZE):
+        chunk = checksums[start:start + DEDUPE_QUERY_SIZE]
+        rows = query_db(f'''
+            SELECT checksum, MIN(deleted) as deleted FROM files
+            WHERE checksum IN ({','.join('?' * len(chunk))})
+            GROUP BY checksum
+        ''', chunk)
+        for row in rows:
+            found[row['checksum']] = bool(row['deleted'])
+    return found
+
+def _discard_staged(results):
+    for result in results:
+        if result['staged'] and os.path.exists(result['staged']):
+            os.remove(result['staged'])
+
+def import_batch(results, tags, seen, counts, dry_run, mime):
+    """
+    Dedupe one hashed batch against the archive and this run, store the new files and
+    insert their rows in one transaction. Returns the source paths that are finished with.
+    """
+    failed = [result for result in results if result['error']]
+    for result in failed:
+        current_app.logger.warning(f"Import could not read {result['source']}: {result['error']}")
+    counts['failed'] += len(failed)
+    
+    results = [result for result in results if not result['error']]
+    archived = find_archived_checksums({result['checksum'] for result in results})
+    
+    new = []
+    duplicates = []
+    for result in results:
+        if result['checksum'] in archived or result['checksum'] in seen:
+            duplicates.append(result)
+            # Same bytes as a deleted file - that one can be restored instead
+            if archived.get(result['checksum']):
+                counts['restorable'] += 1
+        else:
+            seen.add(result['checksum'])
+            new.append(result)
+    counts['duplicates'] += len(duplicates)
+    _discard_staged(duplicates)
+    
+    for result in new:
+        name = os.path.basename(result['source'])
+        try:
+            result['filetype'] = mime.from_buffer(result['head'])
+        except Exception:
+            result['filetype'] = get_file_type_from_extension(name)
+        result['category'] = get_file_category(name, result['filetype'])
+        counts['categories'][result['category']] = counts['categories'].get(result['category'], 0) + 1
+    
+    if dry_run:
+        counts['imported'] += len(new)
+        counts['bytes'] += sum(result['size'] for result in new)
+        return []
+    
+    # Into storage first - move_to_storage hands back the staged path when it fails
+    stored = []
+    for result in new:
+        name = os.path.basename(result['source'])
+        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secure_filename(name)}"
+        storage_path = move_to_storage(result['staged'], result['category'], filename, result['checksum'])
+        if storage_path == result['staged']:
+            counts['failed'] += 1
+            _discard_staged([result])
+            continue
+        result['storage_path'] = storage_path
+        stored.append(result)
+    
+    try:
+        with transaction():
+            file_ids = []
+            for result in stored:
+                name = os.path.basename(result['source'])
+                file_id = execute_db('''
+                    INSERT INTO files (filename, filepath, filetype, size, checksum)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (name, result['storage_path'], result['filetype'], result['size'], result['checksum']))
+                execute_db('''
+                    INSERT INTO metadata (file_id, title, description, keywords, auto_category)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (file_id, name, '', tags, result['category']))
+                add_file_tags(file_id, tags)
+                enqueue_file_jobs(file_id, result['storage_path'])
+                file_ids.append(file_id)
+            mark_related_dirty(file_ids)
+    except Exception as e:
+        current_app.logger.error(f"Import batch failed, removing its stored files: {str(e)}")
+        for result in stored:
+            # CAS objects left behind are unreferenced and go with gc-objects
+            if os.path.exists(result['storage_path']):
+                os.remove(result['storage_path'])
+            seen.discard(result['checksum'])
+        counts['failed'] += len(stored)
+        return [result['source'] for result in duplicates]
+    
+    counts['imported'] += len(stored)
+    counts['bytes'] += sum(result['size'] for result in stored)
+    return [result['source'] for result in duplicates + stored]
+
+def import_tree(root, tags='', link=False, dry_run=False, checkpoint=None, progress=None):
+    """
+    Import every allowed file under root. Files are hashed (and copied, or hardlinked with
+    link) on IMPORT_WORKERS threads while the previous batch of IMPORT_BATCH_SIZE is
+    deduped and inserted. Sources listed in the checkpoint file are skipped, and each
+    committed batch is appended to it, so an interrupted import resumes where it stopped.
+    progress(counts) is called after every batch.
+    Returns counts: scanned, skipped, imported, duplicates (restorable of them only match
+    deleted files), failed, bytes, categories.
+    """
+    config = current_app.config
+    workers = config.get('IMPORT_WORKERS', min(16, (os.cpu_count() or 1) * 2))
+    batch_size = config.get('IMPORT_BATCH_SIZE', 1000)
+    
+    done = load_checkpoint(checkpoint)
+    staging_dir = None if dry_run else get_staging_dir()
+    mime = magic.Magic(mime=True)
+    
+    counts = {'scanned': 0, 'skipped': 0, 'imported': 0, 'duplicates': 0, 'restorable': 0, 'failed': 0,
+              'bytes': 0, 'categories': {}}
+    seen = set()
+    
+    def batches():
+        batch = []
+        for source in scan_tree(root):
+            counts['scanned'] += 1
+            if source in done:
+                counts['skipped'] += 1
+                continue
+            batch.append(source)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    def finish(futures):
+        finished = import_batch([future.result() for future in futures], tags, seen, counts, dry_run, mime)
+        append_checkpoint(checkpoint, finished)
+        if progress:
+            progress(counts)
+    
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import') as executor:
+        # One batch hashing ahead while the oldest is written
+        pending = []
+        try:
+            for batch in batches():
+                pending.append([executor.submit(read_source, source, staging_dir, link) for source in batch])
+                if len(pending) > 1:
+                    finish(pending[0])
+                    pending.pop(0)
+            while pending:
+                finish(pending[0])
+                pending.pop(0)
+        finally:
+            # Interrupted - drop whatever unfinished batches staged
+            for futures in pending:
+                for future in futures:
+                    future.cancel()
+                _discard_staged([future.result() for future in futures
+                                 if not future.cancelled() and future.exception() is None])
+    
+    summary = ', '.join(f'{count} {key}' for key, count in counts.items() if key != 'categories')
+    current_app.logger.info(f"Imported {root}{' (dry run)' if dry_run else ''}: {summary}")
+    return counts
@@ -0,0 +1,260 @@
+"""
+/home/life/app/utils/util_ingest.py
+Version: 1.0.4
+Purpose: Shared ingest path - dedupe, process, categorise, store and record a received file,
+         plus resumable chunked upload sessions that finish through it
+Created: 2026-10-18
+Updated: 2026-10-18 - Image processing queued as background jobs after the original is stored
+Updated: 2026-10-18 - Dedupe on checksum alone now that originals are stored as received
+Updated: 2026-10-18 - Storage keyed by checksum when STORAGE_CAS is on
+Updated: 2026-10-18 - New files queued for related-files computation
+"""
+
+import os
+import uuid
+import fcntl
+import hashlib
+import threading
+from datetime import datetime
+from flask import current_app
+from werkzeug.utils import secure_filename
+from utils.util_db import query_db, execute_db, execute_many, transaction
+from utils.util_storage import calculate_checksum, get_file_type, get_file_category, move_to_storage
+from utils.util_jobs import enqueue_file_jobs
+from utils.util_related import mark_related_dirty
+
+# Running MD5 per chunked upload session: {session_id: (offset hashed up to, hash object)}
+_upload_hashes = {}
+_upload_hashes_lock = threading.Lock()
+
+def ingest_file(temp_path, original_filename, title, shared_tags, checksum=None, filetype=None):
+    """
+    Move one fully received file into the archive.
+    checksum/filetype may be passed in when they were computed while receiving.
+    Images are stored as received; conversion and thumbnails run as background jobs.
+    Returns: (file_id or None, status) - status is 'stored', 'duplicate' or 'failed'
+    """
+    # Secure filename
+    filename = secure_filename(original_filename)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"{timestamp}_{filename}"
+    
+    if checksum is None:
+        checksum = calculate_checksum(temp_path)
+    
+    # Skip files whose bytes are already archived - originals are stored as received
+    duplicate = query_db('SELECT id FROM files WHERE checksum = ? AND deleted = 0', (checksum,), one=True)
+    
+    if duplicate:
+        os.remove(temp_path)
+        return None, 'duplicate'
+    
+    # Get file info
+    if filetype is None:
+        filetype = get_file_type(temp_path)
+    size = os.path.getsize(temp_path)
+    category = get_file_category(original_filename, filetype)
+    
+    # Move to storage - a rename when the source shares the DATA_DIR filesystem
+    storage_path = move_to_storage(temp_path, category, filename, checksum)
+    if storage_path == temp_path:
+        return None, 'failed'
+    
+    # Store in database - file, metadata and tags commit together
+    with transaction():
+        file_id = execute_db('''
+            INSERT INTO files (filename, filepath, filetype, size, checksum)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (original_filename, storage_path, filetype, size, checksum))
+        
+        execute_db('''
+            INSERT INTO metadata (file_id, title, description, keywords, auto_category)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (file_id, title, '', shared_tags, category))
+        
+        # Process shared tags
+        add_file_tags(file_id, shared_tags)
+        
+        # Committed with the file row so no upload is left without its jobs
+        enqueue_file_jobs(file_id, storage_path)
+        mark_related_dirty([file_id])
+    
+    if current_app.config['DEBUG']:
+        current_app.logger.debug(f"File uploaded: {original_filename} -> {storage_path}, "
+                               f"Category: {category}, Size: {size}")
+    
+    return file_id, 'stored'
+
+def add_file_tags(file_id, tags_string):
+    """Create any missing tags from a comma-separated string and link them to a file"""
+    tag_names = []
+    for tag_name in tags_string.split(','):
+        tag_name = tag_name.strip().lower()
+        if tag_name and tag_name not in tag_names:
+            tag_names.append(tag_name)
+    
+    if not tag_names:
+        return
+    
+    execute_many('INSERT OR IGNORE INTO tags (name) VALUES (?)',
+                 [(tag_name,) for tag_name in tag_names])
+    execute_many('''
+        INSERT OR IGNORE INTO file_tags (file_id, tag_id)
+        SELECT ?, id FROM tags WHERE name = ?
+    ''', [(file_id, tag_name) for tag_name in tag_names])
+
+def get_chunk_dir():
+    """Directory under UPLOAD_FOLDER holding partially received chunked uploads"""
+    chunk_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'chunked')
+    os.makedirs(chunk_dir, exist_ok=True)
+    return chunk_dir
+
+def get_chunk_path(session_id):
+    """Path of the .part file for an upload session"""
+    return os.path.join(get_chunk_dir(), f"{session_id}.part")
+
+def create_upload_session(filename, size, title='', tags=''):
+    """Start a chunked upload; returns the new session id"""
+    session_id = uuid.uuid4().hex
+    
+    # Create the empty .part file up front so every chunk is a seek + write
+    open(get_chunk_path(session_id), 'wb').close()
+    
+    execute_db('''
+        INSERT INTO upload_sessions (id, filename, size, title, tags)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (session_id, filename, size, title, tags))
+    
+    with _upload_hashes_lock:
+        _upload_hashes[session_id] = (0, hashlib.md5())
+    
+    return session_id
+
+def get_upload_session(session_id):
+    """Fetch an upload session row, or None"""
+    return query_db('SELECT * FROM upload_sessions WHERE id = ?', (session_id,), one=True)
+
+def append_upload_chunk(session_id, offset, data):
+    """
+    Write one chunk at the client's offset.
+    Returns: (new offset, None) or (current offset, error) when the offset does not match
+    """
+    try:
+        part = open(get_chunk_path(session_id), 'r+b')
+    except FileNotFoundError:
+        return None, 'Upload not found'
+    
+    with part:
+        # flock on the .part file serialises PATCHes for this session across threads and
+        # workers; the database is only locked for the offset check-and-set below
+        fcntl.flock(part, fcntl.LOCK_EX)
+        
+        upload = get_upload_session(session_id)
+        if not upload:
+            return None, 'Upload not found'
+        if offset != upload['upload_offset']:
+            return upload['upload_offset'], 'Offset mismatch'
+        if offset + len(data) > upload['size']:
+            return upload['upload_offset'], 'Chunk exceeds declared size'
+        
+        part.seek(offset)
+        part.write(data)
+        part.flush()
+        
+        new_offset = offset + len(data)
+        with transaction():
+            upload = get_upload_session(session_id)
+            if not upload or upload['upload_offset'] != offset:
+                # Discarded or finalized while the chunk was written
+                return (upload['upload_offset'] if upload else None), 'Upload changed during write'
+            execute_db('''
+                UPDATE upload_sessions SET upload_offset = ?, updated_date = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (new_offset, session_id))
+        
+        # Only extend the running hash if it covers exactly the bytes before this chunk
+        with _upload_hashes_lock:
+            state = _upload_hashes.get(session_id)
+            if state and state[0] == offset:
+                state[1].update(data)
+                _upload_hashes[session_id] = (new_offset, state[1])
+            else:
+                _upload_hashes.pop(session_id, None)
+    
+    return new_offset, None
+
+def finalize_upload_session(session_id):
+    """
+    Hand a completely received chunked upload to ingest_file.
+    Returns: (file_id or None, status) - status as ingest_file, or 'incomplete'/'missing'
+    """
+    upload = get_upload_session(session_id)
+    if not upload:
+        return None, 'missing'
+    if upload['upload_offset'] != upload['size']:
+        return None, 'incomplete'
+    
+    with _upload_hashes_lock:
+        state = _upload_hashes.pop(session_id, None)
+    
+    # The running hash is per process - re-read the file if another worker took chunks
+    checksum = state[1].hexdigest() if state and state[0] == upload['size'] else None
+    
+    execute_db('DELETE FROM upload_sessions WHERE id = ?', (session_id,))
+    
+    # Give the assembled file its real extension - image processing goes by it
+    ext = os.path.splitext(secure_filename(upload['filename']))[1].lower()
+    temp_path = os.path.join(get_chunk_dir(), f"{session_id}{ext}")
+    try:
+        os.replace(get_chunk_path(session_id), temp_path)
+    except FileNotFoundError:
+        # A concurrent finalize already took it
+        return None, 'missing'
+    
+    file_id, status = ingest_file(temp_path, upload['filename'],
+                                  upload['title'] or upload['filename'], upload['tags'] or '',
+                                  checksum=checksum)
+    
+    if status == 'failed' and os.path.exists(temp_path):
+        os.remove(temp_path)
+    
+    return file_id, status
+
+def discard_upload_session(session_id):
+    """Abort a chunked upload and remove its partial file"""
+    with _upload_hashes_lock:
+        _upload_hashes.pop(session_id, None)
+    
+    execute_db('DELETE FROM upload_sessions WHERE id = ?', (session_id,))
+    
+    part_path = get_chunk_path(session_id)
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+def cleanup_stale_uploads():
+    """
+    Drop chunked uploads that have not received data within UPLOAD_SESSION_TTL_HOURS,
+    and this process's running hashes for sessions that no longer exist
+    """
+    ttl_hours = current_app.config.get('UPLOAD_SESSION_TTL_HOURS', 48)
+    stale = query_db('''
+        SELECT id FROM upload_sessions
+        WHERE updated_date < datetime('now', ?)
+    ''', (f'-{int(ttl_hours)} hours',))
+    
+    for row in stale:
+        try:
+            discard_upload_session(row['id'])
+        except OSError as e:
+            current_app.logger.error(f"Error removing stale upload {row['id']}: {e}")
+    
+    # Running hashes of sessions finished, discarded or expired in other workers
+    live = {row['id'] for row in query_db('SELECT id FROM upload_sessions')}
+    with _upload_hashes_lock:
+        for session_id in [session_id for session_id in _upload_hashes if session_id not in live]:
+            del _upload_hashes[session_id]
+    
+    if stale and current_app.config['DEBUG']:
+        current_app.logger.debug(f"Removed {len(stale)} stale chunked uploads")
+    
+    return len(stale)
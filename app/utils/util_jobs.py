@@ -0,0 +1,431 @@
+"""
+/home/life/app/utils/util_jobs.py
+Version: 1.5.1
+Purpose: Durable SQLite-backed job queue and worker threads for upload post-processing
+         and index maintenance
+Created: 2026-10-18
+Updated: 2026-10-18 - process_image jobs run in batches through the image process pool
+Updated: 2026-10-18 - Date taken recorded from the pipeline's single decode, stage timings logged
+Updated: 2026-10-18 - process_image leaves originals untouched and prewarms cached derivatives
+Updated: 2026-10-18 - refresh_related job recomputes related-file neighbour lists
+Updated: 2026-10-18 - process_image stores a perceptual hash and records near-duplicates
+Updated: 2026-10-18 - extract_text jobs read document text through the text extraction pool
+Updated: 2026-10-18 - record_date_taken can overwrite an existing date for reprocessing
+"""
+
+import os
+import time
+import threading
+from datetime import datetime
+from flask import current_app
+from utils.util_db import query_db, execute_db, execute_many, transaction
+from utils.util_image import process_images_parallel
+from utils.util_derivatives import derivative_outputs, register_derivatives, check_derivative_budget, default_format
+from utils.util_similar import (get_similarity_index, record_image_hash, prepare_document_signatures,
+                                record_document_signatures)
+from utils.util_text import can_extract_text, extract_texts_parallel, store_file_text
+
+IMAGE_EXTENSIONS = ('.heic', '.jpg', '.jpeg', '.png', '.gif')
+
+# In-process workers: {'pid': owning process, 'threads': [...]} - restarted after a fork
+_workers = {'pid': None, 'threads': []}
+_workers_lock = threading.Lock()
+_wakeup = threading.Event()
+
+def enqueue_job(job_type, file_id=None, delay=0):
+    """Queue a job; joins the caller's transaction when inside one"""
+    job_id = execute_db('''
+        INSERT INTO jobs (job_type, file_id, max_attempts, run_after)
+        VALUES (?, ?, ?, datetime('now', ?))
+    ''', (job_type, file_id, current_app.config.get('JOB_MAX_ATTEMPTS', 3), f'+{int(delay)} seconds'))
+    
+    if file_id is not None:
+        execute_db("UPDATE files SET processing_status = 'pending' WHERE id = ?", (file_id,))
+    
+    _wakeup.set()
+    return job_id
+
+def enqueue_file_jobs(file_id, filepath):
+    """Queue the post-processing an uploaded file needs; returns the number of jobs"""
+    count = 0
+    if filepath.lower().endswith(IMAGE_EXTENSIONS):
+        # Thumbnail and metadata follow from process_image once the final file exists
+        enqueue_job('process_image', file_id)
+        count += 1
+    
+    if can_extract_text(filepath):
+        enqueue_job('extract_text', file_id)
+        count += 1
+    
+    return count
+
+def claim_jobs(limit=1, job_type=None):
+    """Atomically take up to limit of the oldest runnable jobs (optionally of one type)"""
+    where = "status = 'pending' AND run_after <= CURRENT_TIMESTAMP"
+    args = []
+    if job_type:
+        where += ' AND job_type = ?'
+        args.append(job_type)
+    
+    with transaction():
+        # BEGIN IMMEDIATE makes select-then-update safe across workers and processes
+        jobs = query_db(f'''
+            SELECT * FROM jobs
+            WHERE {where}
+            ORDER BY id
+            LIMIT ?
+        ''', args + [limit])
+        
+        execute_many('''
+            UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                            started_date = CURRENT_TIMESTAMP, last_error = NULL
+            WHERE id = ?
+        ''', [(job['id'],) for job in jobs])
+    
+    claimed = [dict(job) for job in jobs]
+    for job in claimed:
+        job['attempts'] += 1
+    return claimed
+
+def claim_job():
+    """Atomically take the oldest runnable job, or None"""
+    jobs = claim_jobs(1)
+    return jobs[0] if jobs else None
+
+def run_job(job):
+    """Run one claimed job, recording success, a scheduled retry or a final failure"""
+    handler = JOB_HANDLERS.get(job['job_type'])
+    started = time.perf_counter()
+    
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job type: {job['job_type']}")
+        handler(job['file_id'])
+        finish_job(job)
+        
+        if current_app.config['DEBUG']:
+            current_app.logger.debug(f"Job {job['id']} {job['job_type']} file {job['file_id']} "
+                                   f"done in {(time.perf_counter() - started) * 1000:.0f}ms")
+    
+    except Exception as e:
+        finish_job(job, e)
+
+def finish_job(job, error=None):
+    """Mark a job done, schedule a retry or fail it for good; joins the caller's transaction"""
+    if error is None:
+        execute_db('''
+            UPDATE jobs SET status = 'done', finished_date = CURRENT_TIMESTAMP WHERE id = ?
+        ''', (job['id'],))
+    elif job['attempts'] < job['max_attempts']:
+        # Exponential backoff: 30s, 60s, 120s...
+        delay = current_app.config.get('JOB_RETRY_DELAY', 30) * 2 ** (job['attempts'] - 1)
+        execute_db('''
+            UPDATE jobs SET status = 'pending', last_error = ?, run_after = datetime('now', ?)
+            WHERE id = ?
+        ''', (str(error), f'+{int(delay)} seconds', job['id']))
+        current_app.logger.warning(f"Job {job['id']} {job['job_type']} failed "
+                                 f"(attempt {job['attempts']}), retrying in {delay}s: {error}")
+    else:
+        execute_db('''
+            UPDATE jobs SET status = 'failed', last_error = ?, finished_date = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (str(error), job['id']))
+        current_app.logger.error(f"Job {job['id']} {job['job_type']} failed permanently: {error}")
+    
+    if job['file_id'] is not None:
+        update_processing_status(job['file_id'])
+
+def run_image_batch(jobs):
+    """
+    Run a batch of process_image jobs through the image process pool - metadata, the
+    perceptual hash and the DERIVATIVE_PREWARM sizes from one decode each - and record
+    every result in one transaction. Originals are only read.
+    """
+    started = time.perf_counter()
+    
+    files = {}
+    for job in jobs:
+        file = _load_file(job['file_id'])
+        if file and os.path.exists(file['filepath']):
+            files[job['id']] = file
+    
+    # Deleted or vanished since upload - nothing left to do
+    for job in jobs:
+        if job['id'] not in files:
+            finish_job(job)
+    jobs = [job for job in jobs if job['id'] in files]
+    if not jobs:
+        return
+    
+    # Browse thumbnails are rendered now; other sizes wait for their first request
+    prewarm = current_app.config.get('DERIVATIVE_PREWARM', ('thumb',))
+    fmt = default_format()
+    # Load committed hashes now - inside the transaction the index is not topped up
+    get_similarity_index()
+    
+    results = process_images_parallel([
+        (files[job['id']]['filepath'], derivative_outputs(files[job['id']]['checksum'], prewarm, fmt), True)
+        for job in jobs
+    ])
+    
+    try:
+        with transaction():
+            for job, result in zip(jobs, results):
+                if result['error']:
+                    finish_job(job, result['error'])
+                    continue
+                register_derivatives(files[job['id']]['checksum'], result['derivatives'])
+                record_date_taken(job['file_id'], result['metadata'])
+                if result['image_hash'] is not None:
+                    record_image_hash(job['file_id'], result['image_hash'])
+                finish_job(job)
+    except Exception as e:
+        current_app.logger.error(f"Recording image batch failed: {e}")
+        for job in jobs:
+            finish_job(job, e)
+        return
+    
+    # Eviction deletes files, so it waits until the batch's rows are committed
+    check_derivative_budget()
+    
+    # Per-stage totals across the batch (ms of worker time)
+    stage_totals = {}
+    for result in results:
+        for stage, ms in result.get('timings', {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0) + ms
+    
+    stages = ', '.join(f"{stage} {ms:.0f}ms" for stage, ms in stage_totals.items())
+    current_app.logger.info(f"Image batch of {len(jobs)} processed in "
+                          f"{(time.perf_counter() - started) * 1000:.0f}ms ({stages or 'no stages completed'})")
+    
+    if current_app.config['DEBUG']:
+        for result in results:
+            current_app.logger.debug(f"Image {result['source']}: {result.get('timings')}")
+
+def run_text_batch(jobs):
+    """
+    Run a batch of extract_text jobs through the text extraction pool and record each
+    file's text, search text and document signature in one transaction.
+    """
+    from utils.util_related import mark_related_dirty
+    
+    started = time.perf_counter()
+    
+    files = {}
+    for job in jobs:
+        file = _load_file(job['file_id'])
+        if file and os.path.exists(file['filepath']):
+            files[job['id']] = file
+    
+    for job in jobs:
+        if job['id'] not in files:
+            finish_job(job)
+    jobs = [job for job in jobs if job['id'] in files]
+    if not jobs:
+        return
+    
+    results = extract_texts_parallel([files[job['id']]['filepath'] for job in jobs])
+    
+    try:
+        # Signatures are hashed before the transaction - it only holds the writes
+        prepared = prepare_document_signatures([(job['file_id'], result['text'])
+                                                for job, result in zip(jobs, results) if not result['error']])
+        with transaction():
+            extracted = []
+            for job, result in zip(jobs, results):
+                if result['error']:
+                    finish_job(job, result['error'])
+                    continue
+                store_file_text(job['file_id'], result['text'], result['extractor'])
+                if result['text']:
+                    extracted.append(job['file_id'])
+                finish_job(job)
+            record_document_signatures(prepared)
+            
+            # Text feeds the semantic part of the related-files score
+            mark_related_dirty(extracted)
+    except Exception as e:
+        current_app.logger.error(f"Recording text batch failed: {e}")
+        for job in jobs:
+            finish_job(job, e)
+        return
+    
+    chars = sum(len(result['text']) for result in results)
+    current_app.logger.info(f"Text batch of {len(jobs)} extracted in "
+                          f"{(time.perf_counter() - started) * 1000:.0f}ms ({chars} characters)")
+    
+    if current_app.config['DEBUG']:
+        for result in results:
+            current_app.logger.debug(f"Text {result['source']}: {result['extractor']} "
+                                   f"{len(result['text'])} chars in {result.get('ms', 0):.0f}ms {result['error'] or ''}")
+
+def update_processing_status(file_id):
+    """Derive files.processing_status from the file's outstanding and failed jobs"""
+    execute_db('''
+        UPDATE files SET processing_status = CASE
+            WHEN EXISTS (SELECT 1 FROM jobs WHERE file_id = ? AND status IN ('pending', 'running')) THEN 'pending'
+            WHEN EXISTS (SELECT 1 FROM jobs WHERE file_id = ? AND status = 'failed') THEN 'failed'
+            ELSE 'ready'
+        END
+        WHERE id = ?
+    ''', (file_id, file_id, file_id))
+
+def requeue_stale_jobs():
+    """
+    Return jobs left 'running' by a dead worker to the queue - or fail them once they have
+    used all their attempts, so a file that hangs or kills its worker is not retried
+    forever - and purge old finished jobs
+    """
+    timeout = current_app.config.get('JOB_TIMEOUT', 600)
+    retention_days = current_app.config.get('JOB_RETENTION_DAYS', 7)
+    
+    with transaction():
+        stale = query_db('''
+            SELECT id, file_id, attempts, max_attempts FROM jobs
+            WHERE status = 'running' AND started_date < datetime('now', ?)
+        ''', (f'-{int(timeout)} seconds',))
+        execute_many('''
+            UPDATE jobs SET status = 'pending', last_error = 'Worker timed out' WHERE id = ?
+        ''', [(job['id'],) for job in stale if job['attempts'] < job['max_attempts']])
+        execute_many('''
+            UPDATE jobs SET status = 'failed', last_error = 'Worker timed out', finished_date = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', [(job['id'],) for job in stale if job['attempts'] >= job['max_attempts']])
+        for file_id in {job['file_id'] for job in stale if job['file_id'] is not None}:
+            update_processing_status(file_id)
+        execute_db('''
+            DELETE FROM jobs WHERE status = 'done' AND finished_date < datetime('now', ?)
+        ''', (f'-{int(retention_days)} days',))
+
+def retry_failed_jobs():
+    """Give permanently failed jobs a fresh set of attempts; returns how many"""
+    with transaction():
+        failed = query_db("SELECT id, file_id FROM jobs WHERE status = 'failed'")
+        execute_db('''
+            UPDATE jobs SET status = 'pending', attempts = 0, run_after = CURRENT_TIMESTAMP
+            WHERE status = 'failed'
+        ''')
+        execute_many("UPDATE files SET processing_status = 'pending' WHERE id = ?",
+                     [(file_id,) for file_id in {row['file_id'] for row in failed} if file_id is not None])
+    
+    _wakeup.set()
+    return len(failed)
+
+def get_job_stats():
+    """Job counts by status plus the most recent failures"""
+    counts = {row['status']: row['count'] for row in query_db(
+        'SELECT status, COUNT(*) as count FROM jobs GROUP BY status')}
+    failures = query_db('''
+        SELECT id, job_type, file_id, attempts, last_error, finished_date
+        FROM jobs WHERE status = 'failed'
+        ORDER BY id DESC LIMIT 20
+    ''')
+    
+    return {
+        'counts': counts,
+        'failed': [dict(row) for row in failures],
+        'workers': len([t for t in _workers['threads'] if t.is_alive()]) if _workers['pid'] == os.getpid() else 0
+    }
+
+def work_jobs(app, stop_event=None, drain=False):
+    """
+    Worker loop: claim and run jobs until stop_event is set.
+    drain=True returns as soon as no job is runnable (flask run-jobs --drain).
+    Returns the number of jobs run.
+    """
+    poll_interval = app.config.get('JOB_POLL_INTERVAL', 5)
+    stop_event = stop_event or threading.Event()
+    processed = 0
+    
+    while not stop_event.is_set():
+        job = None
+        try:
+            # Fresh app context per job so the pooled connection goes back in between
+            with app.app_context():
+                job = claim_job()
+                if job and job['job_type'] in BATCH_HANDLERS:
+                    # Fan same-type work out together, e.g. a 40-photo upload across all cores
+                    batch_size = app.config.get('IMAGE_BATCH_SIZE', 16)
+                    batch = [job] + claim_jobs(batch_size - 1, job['job_type'])
+                    BATCH_HANDLERS[job['job_type']](batch)
+                    processed += len(batch)
+                elif job:
+                    run_job(job)
+                    processed += 1
+                else:
+                    requeue_stale_jobs()
+        except Exception as e:
+            app.logger.error(f"Job worker error: {e}")
+        
+        if job:
+            continue
+        if drain:
+            break
+        
+        _wakeup.wait(poll_interval)
+        _wakeup.clear()
+    
+    return processed
+
+def start_job_workers(app):
+    """Start JOB_WORKERS daemon threads in this process (once per process)"""
+    count = app.config.get('JOB_WORKERS', 2)
+    if count <= 0 or _workers['pid'] == os.getpid():
+        return
+    
+    with _workers_lock:
+        if _workers['pid'] == os.getpid():
+            return
+        
+        threads = []
+        for i in range(count):
+            thread = threading.Thread(target=work_jobs, args=(app,), name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            threads.append(thread)
+        
+        _workers['threads'] = threads
+        _workers['pid'] = os.getpid()
+    
+    app.logger.info(f"Started {count} job workers in process {os.getpid()}")
+
+# Job handlers - each takes a file id and raises to trigger a retry
+
+def _load_file(file_id):
+    return query_db('SELECT * FROM files WHERE id = ? AND deleted = 0', (file_id,), one=True)
+
+def job_refresh_related(file_id):
+    """Recompute neighbour lists for files marked dirty (not tied to one file)"""
+    from utils.util_related import refresh_related_files
+    
+    refresh_related_files()
+
+def record_date_taken(file_id, image_metadata, overwrite=False):
+    """
+    Store EXIF DateTimeOriginal as metadata.date_taken unless one is already set, or
+    replacing it when overwrite. Returns True when the stored date changed.
+    """
+    taken = image_metadata.get('DateTimeOriginal')
+    if not taken:
+        return False
+    
+    try:
+        date_taken = datetime.strptime(str(taken), '%Y:%m:%d %H:%M:%S').date()
+    except ValueError:
+        return False
+    
+    current = query_db('SELECT date_taken FROM metadata WHERE file_id = ?', (file_id,), one=True)
+    if current is None or current['date_taken'] == date_taken or (current['date_taken'] and not overwrite):
+        return False
+    
+    execute_db('UPDATE metadata SET date_taken = ? WHERE file_id = ?', (date_taken.isoformat(), file_id))
+    return True
+
+JOB_HANDLERS = {
+    'refresh_related': job_refresh_related,
+}
+
+# Job types claimed and run together, taking the list of claimed jobs
+BATCH_HANDLERS = {
+    'process_image': run_image_batch,
+    'extract_text': run_text_batch,
+}
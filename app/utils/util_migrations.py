@@ -0,0 +1,352 @@
+"""
+/home/life/app/utils/util_migrations.py
+Version: 1.0.10
+Purpose: Versioned schema migrations tracked in the schema_version table
+Created: 2026-10-18
+Updated: 2026-10-18 - Added FTS5 search index migration
+Updated: 2026-10-18 - Added browse index and file_counts migration
+Updated: 2026-10-18 - Added files.source_checksum migration
+Updated: 2026-10-18 - Added upload_sessions table for chunked uploads
+Updated: 2026-10-18 - Added jobs queue and files.processing_status
+Updated: 2026-10-18 - Added derivative_cache table
+Updated: 2026-10-18 - Added file_neighbours and related_dirty tables
+Updated: 2026-10-18 - Added image_hashes and image_duplicates tables
+Updated: 2026-10-18 - Added document MinHash signature, LSH bucket and duplicate tables
+Updated: 2026-10-18 - Added file_texts table for extracted text
+"""
+
+import os
+import time
+import sqlite3
+from flask import current_app
+
+def _split_sql(script):
+    """Complete statements of an SQL script, trigger bodies kept whole"""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ''
+    if statement.strip():
+        yield statement.strip()
+
+def migration_001_baseline(db):
+    """Baseline schema and default data"""
+    from utils.util_db import create_tables, insert_defaults
+    
+    schema_path = os.path.join(os.path.dirname(__file__), '..', 'models', 'schema.sql')
+    if os.path.exists(schema_path):
+        # executescript() would commit first and escape the migration's transaction
+        with open(schema_path, 'r') as f:
+            for statement in _split_sql(f.read()):
+                db.execute(statement)
+    else:
+        create_tables(db)
+    
+    insert_defaults(db)
+
+def migration_002_search_index(db):
+    """FTS5 full-text index over files, metadata and tags"""
+    from utils.util_search import create_search_index
+    create_search_index(db)
+
+def _count_delta(category, delta, condition='1'):
+    """Trigger statement adding delta to one file_counts row when condition holds"""
+    return f'''
+        INSERT INTO file_counts (category, count)
+        SELECT {category}, {delta} WHERE {category} IS NOT NULL AND {condition}
+        ON CONFLICT(category) DO UPDATE SET count = count + excluded.count;
+    '''
+
+def migration_003_browse_counts(db):
+    """Keyset pagination index and trigger-maintained file counts"""
+    db.execute('CREATE INDEX IF NOT EXISTS idx_files_deleted_upload ON files(deleted, upload_date, id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_metadata_auto_category ON metadata(auto_category)')
+    
+    # Live (non-deleted) file counts per auto_category; '*' holds the total
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS file_counts (
+            category TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    live_file = 'EXISTS (SELECT 1 FROM files WHERE id = {} AND deleted = 0)'
+    old_category = '(SELECT auto_category FROM metadata WHERE file_id = OLD.id)'
+    triggers = {
+        'file_counts_files_ai': ('AFTER INSERT ON files WHEN NEW.deleted = 0',
+                                 _count_delta("'*'", 1)),
+        'file_counts_files_ad': ('AFTER DELETE ON files WHEN OLD.deleted = 0',
+                                 _count_delta("'*'", -1) + _count_delta(old_category, -1)),
+        'file_counts_files_au': ('AFTER UPDATE OF deleted ON files WHEN NEW.deleted != OLD.deleted',
+                                 _count_delta("'*'", 'CASE WHEN NEW.deleted THEN -1 ELSE 1 END') +
+                                 _count_delta(old_category, 'CASE WHEN NEW.deleted THEN -1 ELSE 1 END')),
+        'file_counts_metadata_ai': ('AFTER INSERT ON metadata',
+                                    _count_delta('NEW.auto_category', 1, live_file.format('NEW.file_id'))),
+        'file_counts_metadata_au': ('AFTER UPDATE OF auto_category ON metadata '
+                                    'WHEN OLD.auto_category IS NOT NEW.auto_category',
+                                    _count_delta('OLD.auto_category', -1, live_file.format('OLD.file_id')) +
+                                    _count_delta('NEW.auto_category', 1, live_file.format('NEW.file_id'))),
+        'file_counts_metadata_ad': ('AFTER DELETE ON metadata',
+                                    _count_delta('OLD.auto_category', -1, live_file.format('OLD.file_id'))),
+    }
+    
+    for name, (event, body) in triggers.items():
+        db.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+    
+    from utils.util_db import RECOUNT_FILES_SQL
+    for statement in RECOUNT_FILES_SQL:
+        db.execute(statement)
+
+def migration_004_source_checksum(db):
+    """Checksum of uploaded bytes before image conversion/resizing"""
+    columns = [row[1] for row in db.execute('PRAGMA table_info(files)')]
+    if 'source_checksum' not in columns:
+        db.execute('ALTER TABLE files ADD COLUMN source_checksum TEXT')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_files_source_checksum ON files(source_checksum)')
+
+def migration_005_upload_sessions(db):
+    """Resumable chunked upload sessions"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            upload_offset INTEGER NOT NULL DEFAULT 0,
+            title TEXT,
+            tags TEXT,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated ON upload_sessions(updated_date)')
+
+def migration_006_jobs(db):
+    """Background job queue and per-file processing status"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_type TEXT NOT NULL,
+            file_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            run_after TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_date TIMESTAMP,
+            finished_date TIMESTAMP,
+            FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+        )
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_runnable ON jobs(status, run_after)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_file ON jobs(file_id, status)')
+    
+    columns = [row[1] for row in db.execute('PRAGMA table_info(files)')]
+    if 'processing_status' not in columns:
+        db.execute("ALTER TABLE files ADD COLUMN processing_status TEXT DEFAULT 'ready'")
+
+def migration_007_derivative_cache(db):
+    """Cached image derivatives with last access times for LRU eviction"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS derivative_cache (
+            path TEXT PRIMARY KEY,
+            checksum TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_access TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_derivative_cache_access ON derivative_cache(last_access)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_derivative_cache_checksum ON derivative_cache(checksum)')
+
+def migration_008_related_files(db):
+    """Precomputed top-k related files per file, and files waiting to be recomputed"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS file_neighbours (
+            file_id INTEGER NOT NULL,
+            neighbour_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (file_id, neighbour_id),
+            FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE,
+            FOREIGN KEY (neighbour_id) REFERENCES files(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS related_dirty (
+            file_id INTEGER PRIMARY KEY,
+            marked_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Associations are looked up from either end
+    db.execute('CREATE INDEX IF NOT EXISTS idx_learned_associations_file2 ON learned_associations(file_id_2)')
+    
+    # Existing files get their neighbours on the first refresh
+    db.execute('INSERT OR IGNORE INTO related_dirty (file_id) SELECT id FROM files WHERE deleted = 0')
+    db.execute('''
+        INSERT INTO jobs (job_type) SELECT 'refresh_related' WHERE EXISTS (SELECT 1 FROM related_dirty)
+    ''')
+
+def migration_009_image_hashes(db):
+    """Perceptual image hashes and the near-duplicate pairs found from them"""
+    # id only grows, so processes can load hashes stored since they last looked
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS image_hashes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_id INTEGER NOT NULL UNIQUE,
+            hash INTEGER NOT NULL,
+            FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+        )
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS image_duplicates (
+            file_id INTEGER NOT NULL,
+            similar_id INTEGER NOT NULL,
+            distance INTEGER NOT NULL,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (file_id, similar_id),
+            FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE,
+            FOREIGN KEY (similar_id) REFERENCES files(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_image_duplicates_similar ON image_duplicates(similar_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_image_duplicates_created ON image_duplicates(created_date)')
+
+def migration_010_document_signatures(db):
+    """MinHash signatures of document text, their LSH buckets and probable duplicate pairs"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS document_signatures (
+            file_id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL,
+            FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+        )
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS document_buckets (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            file_id INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket, file_id),
+            FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_document_buckets_file ON document_buckets(file_id)')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS document_duplicates (
+            file_id INTEGER NOT NULL,
+            similar_id INTEGER NOT NULL,
+            similarity REAL NOT NULL,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (file_id, similar_id),
+            FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE,
+            FOREIGN KEY (similar_id) REFERENCES files(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_document_duplicates_similar ON document_duplicates(similar_id)')
+
+def migration_011_file_texts(db):
+    """Compressed full text extracted from documents"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS file_texts (
+            file_id INTEGER PRIMARY KEY,
+            content BLOB NOT NULL,
+            extractor TEXT,
+            length INTEGER NOT NULL,
+            extracted_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+        )
+    ''')
+
+# Numbered migrations - append only, never renumber or edit an applied one
+MIGRATIONS = [
+    (1, 'Baseline schema and default data', migration_001_baseline),
+    (2, 'Full-text search index', migration_002_search_index),
+    (3, 'Browse index and cached file counts', migration_003_browse_counts),
+    (4, 'Source checksum for upload dedup', migration_004_source_checksum),
+    (5, 'Chunked upload sessions', migration_005_upload_sessions),
+    (6, 'Background job queue', migration_006_jobs),
+    (7, 'Image derivative cache', migration_007_derivative_cache),
+    (8, 'Related files neighbour table', migration_008_related_files),
+    (9, 'Perceptual image hashes', migration_009_image_hashes),
+    (10, 'Document MinHash signatures', migration_010_document_signatures),
+    (11, 'Extracted document text', migration_011_file_texts),
+]
+
+def get_schema_version(db):
+    """Get the highest applied migration number (0 for a fresh database)"""
+    try:
+        row = db.execute('SELECT MAX(version) FROM schema_version').fetchone()
+        return row[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+def _progress_logger(version):
+    """Progress handler that logs every few seconds while a long migration runs"""
+    started = time.monotonic()
+    last_logged = [started]
+    
+    def handler():
+        now = time.monotonic()
+        if now - last_logged[0] >= 5:
+            last_logged[0] = now
+            current_app.logger.info(f"Schema migration {version} still running ({now - started:.0f}s)")
+        return 0
+    
+    return handler
+
+def run_migrations(db):
+    """
+    Apply pending migrations, each in its own transaction.
+    Returns the schema version after running.
+    """
+    latest = MIGRATIONS[-1][0]
+    current = get_schema_version(db)
+    
+    # Fast path for every worker start once the schema is current
+    if current >= latest:
+        if current_app.config['DEBUG']:
+            current_app.logger.debug(f"Schema up to date at version {current}")
+        return current
+    
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    db.commit()
+    
+    current_app.logger.info(f"Migrating schema from version {current} to {latest}")
+    
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        
+        # Serialise concurrent worker starts; WAL readers keep working meanwhile
+        db.execute('BEGIN IMMEDIATE')
+        if get_schema_version(db) >= version:
+            db.rollback()
+            continue
+        
+        current_app.logger.info(f"Applying schema migration {version}/{latest}: {description}")
+        started = time.monotonic()
+        db.set_progress_handler(_progress_logger(version), 100000)
+        
+        try:
+            migrate(db)
+            db.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                       (version, description))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            current_app.logger.error(f"Schema migration {version} failed: {str(e)}")
+            raise
+        finally:
+            db.set_progress_handler(None, 0)
+        
+        current_app.logger.info(f"Schema migration {version} applied in {time.monotonic() - started:.2f}s")
+    
+    return get_schema_version(db)
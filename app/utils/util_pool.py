@@ -0,0 +1,127 @@
+"""
+/home/life/app/utils/util_pool.py
+Version: 1.0.0
+Purpose: Named process pools for CPU-bound pipelines - started without fork() from threaded
+         processes, shared by job threads, retired rather than killed under other batches
+Created: 2026-10-18
+"""
+
+import os
+import math
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+
+# Per-process pools by name: {name: {'pid', 'executor', 'workers'}}
+_pools = {}
+# Batches currently using each executor, and executors retired after a stuck or crashed worker
+_in_use = {}
+_retired = set()
+_pools_lock = threading.Lock()
+
+def get_pool_context():
+    """
+    Start method for pool processes - POOL_START_METHOD, forkserver by default. Forking a
+    web or job-worker process copies locks other threads hold (logging, sqlite, pools)
+    and can deadlock the child; forkserver and spawn start from a clean interpreter.
+    """
+    method = current_app.config.get('POOL_START_METHOD', 'forkserver')
+    if method not in multiprocessing.get_all_start_methods():
+        method = 'spawn'
+    return multiprocessing.get_context(method)
+
+def _acquire_pool(name, workers):
+    """
+    This process's pool for name, creating it on first use or after it was retired.
+    A pool started with a different worker count is retired and shut down once the
+    batches still in it finish.
+    """
+    idle = None
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool and pool['pid'] == os.getpid() and pool['workers'] != workers:
+            if pool['executor'] in _in_use:
+                _retired.add(pool['executor'])
+            else:
+                idle = pool['executor']
+            pool = None
+        if not pool or pool['pid'] != os.getpid():
+            pool = {'pid': os.getpid(), 'workers': workers,
+                    'executor': ProcessPoolExecutor(max_workers=workers, mp_context=get_pool_context())}
+            _pools[name] = pool
+        executor = pool['executor']
+        _in_use[executor] = _in_use.get(executor, 0) + 1
+    
+    if idle is not None:
+        idle.shutdown(wait=False, cancel_futures=True)
+    return executor
+
+def _release_pool(name, executor, broken=False):
+    """
+    Finish a batch on executor. A broken pool is retired at once so new batches get a
+    fresh one, but its processes are only killed when no other batch still has work in it.
+    """
+    with _pools_lock:
+        _in_use[executor] -= 1
+        if broken:
+            _retired.add(executor)
+            pool = _pools.get(name)
+            if pool and pool['executor'] is executor:
+                del _pools[name]
+        
+        if _in_use[executor] > 0:
+            return
+        del _in_use[executor]
+        if executor not in _retired:
+            return
+        _retired.discard(executor)
+    
+    # Killing the workers is the only way to stop a task that never returns
+    for process in list((getattr(executor, '_processes', None) or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def map_in_pool(name, workers, func, tasks, timeout, failed):
+    """
+    Run func(*task) for every task on the named pool (inline when workers is 0).
+    Tasks queue behind each other, so the deadline is timeout per task per worker;
+    tasks that overrun it, raise or crash their worker come back as failed(task, message).
+    Only an overrun or a crash retires the pool.
+    Returns: results in tasks order
+    """
+    if workers <= 0:
+        return [func(*task) for task in tasks]
+    
+    executor = _acquire_pool(name, workers)
+    broken = False
+    results = []
+    try:
+        try:
+            futures = [executor.submit(func, *task) for task in tasks]
+        except Exception as e:
+            # BrokenProcessPool - a worker died before this batch got in
+            broken = True
+            return [failed(task, f'Worker failed: {e}') for task in tasks]
+        
+        deadline = time.monotonic() + timeout * math.ceil(len(futures) / workers)
+        for task, future in zip(tasks, futures):
+            try:
+                results.append(future.result(timeout=max(0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                broken = True
+                results.append(failed(task, f'Timed out after {timeout}s'))
+            except BrokenProcessPool as e:
+                broken = True
+                results.append(failed(task, f'Worker failed: {e}'))
+            except Exception as e:
+                # The task raised - its worker is fine
+                results.append(failed(task, f'Task failed: {e}'))
+    finally:
+        _release_pool(name, executor, broken)
+        if broken:
+            current_app.logger.error(f"{name} pool worker stuck or crashed - starting a new pool")
+    
+    return results
@@ -0,0 +1,237 @@
+"""
+/home/life/app/utils/util_related.py
+Version: 1.0.1
+Purpose: Related-file recommendations - a precomputed top-k neighbour table per file,
+         scored from learned associations, shared tags and semantic term expansion
+Created: 2026-10-18
+Updated: 2026-10-18 - Term expansion from the shared in-memory relationships index
+"""
+
+import math
+import sqlite3
+from datetime import datetime
+from flask import current_app
+from utils.util_db import query_db, execute_db, execute_many, transaction
+from utils.util_jobs import enqueue_job
+from utils.util_relationships import get_expansion_index, expand_terms
+
+# Relative weight of each signal in a neighbour's score
+DEFAULT_RELATED_WEIGHTS = {'association': 1.0, 'tags': 0.5, 'semantic': 0.3}
+
+def mark_related_dirty(file_ids):
+    """
+    Flag files whose neighbours need recomputing and make sure a refresh job is queued.
+    Joins the caller's transaction when inside one.
+    """
+    file_ids = {file_id for file_id in file_ids if file_id is not None}
+    if not file_ids:
+        return
+    
+    execute_many('INSERT OR IGNORE INTO related_dirty (file_id) VALUES (?)', [(file_id,) for file_id in file_ids])
+    
+    # One refresh job drains every dirty file, so only queue when none is waiting
+    pending = query_db('''
+        SELECT 1 FROM jobs WHERE job_type = 'refresh_related' AND status = 'pending' LIMIT 1
+    ''', one=True)
+    if not pending:
+        enqueue_job('refresh_related', delay=current_app.config.get('RELATED_REFRESH_DELAY', 30))
+
+def refresh_related_files(limit=None):
+    """
+    Recompute the neighbour lists of dirty files, up to limit (RELATED_REFRESH_BATCH).
+    Returns the number refreshed; queues another refresh when dirty files remain.
+    """
+    limit = limit or current_app.config.get('RELATED_REFRESH_BATCH', 200)
+    
+    # Take the batch off the dirty list first, so a file marked again meanwhile is redone
+    with transaction():
+        dirty = [row['file_id'] for row in query_db(
+            'SELECT file_id FROM related_dirty ORDER BY marked_date LIMIT ?', (limit,))]
+        execute_many('DELETE FROM related_dirty WHERE file_id = ?', [(file_id,) for file_id in dirty])
+    if not dirty:
+        return 0
+    
+    index = get_expansion_index()
+    top_k = current_app.config.get('RELATED_TOP_K', 10)
+    for file_id in dirty:
+        try:
+            neighbours = compute_neighbours(file_id, index)
+            with transaction():
+                execute_db('DELETE FROM file_neighbours WHERE file_id = ?', (file_id,))
+                execute_many('''
+                    INSERT INTO file_neighbours (file_id, neighbour_id, score) VALUES (?, ?, ?)
+                ''', [(file_id, neighbour_id, score) for neighbour_id, score in neighbours])
+                _offer_reverse(file_id, neighbours, top_k)
+        except Exception as e:
+            current_app.logger.warning(f"Related files refresh failed for file {file_id}: {str(e)}")
+            execute_db('INSERT OR IGNORE INTO related_dirty (file_id) VALUES (?)', (file_id,))
+    
+    if len(dirty) == limit:
+        enqueue_job('refresh_related')
+    
+    if current_app.config['DEBUG']:
+        current_app.logger.debug(f"Refreshed related files for {len(dirty)} files")
+    
+    return len(dirty)
+
+def _offer_reverse(file_id, neighbours, top_k):
+    """
+    Add file_id to each neighbour's own list, keeping that list to its top_k, so a new or
+    edited file shows up beside older files without recomputing them
+    """
+    execute_many('''
+        INSERT INTO file_neighbours (file_id, neighbour_id, score) VALUES (?, ?, ?)
+        ON CONFLICT (file_id, neighbour_id) DO UPDATE SET score = excluded.score
+    ''', [(neighbour_id, file_id, score) for neighbour_id, score in neighbours])
+    execute_many('''
+        DELETE FROM file_neighbours
+        WHERE file_id = ? AND neighbour_id NOT IN (
+            SELECT neighbour_id FROM file_neighbours WHERE file_id = ? ORDER BY score DESC LIMIT ?
+        )
+    ''', [(neighbour_id, neighbour_id, top_k) for neighbour_id, _ in neighbours])
+
+def rebuild_related_files():
+    """Mark every live file dirty and recompute all neighbour lists now; returns the file count"""
+    with transaction():
+        execute_db('DELETE FROM file_neighbours')
+        execute_db('INSERT OR IGNORE INTO related_dirty (file_id) SELECT id FROM files WHERE deleted = 0')
+    
+    total = 0
+    while True:
+        count = refresh_related_files()
+        total += count
+        if not count:
+            break
+    
+    current_app.logger.info(f"Related files rebuilt for {total} files")
+    return total
+
+def compute_neighbours(file_id, index=None):
+    """Top RELATED_TOP_K (neighbour id, score) pairs for one file, best first"""
+    file = query_db('''
+        SELECT f.id, f.deleted, m.title, m.keywords, m.auto_category
+        FROM files f
+        LEFT JOIN metadata m ON m.file_id = f.id
+        WHERE f.id = ?
+    ''', (file_id,), one=True)
+    if not file or file['deleted']:
+        return []
+    
+    weights = {**DEFAULT_RELATED_WEIGHTS, **current_app.config.get('RELATED_WEIGHTS', {})}
+    scores = {}
+    
+    def add(signal, other_id, value):
+        if other_id != file_id and value > 0:
+            scores[other_id] = scores.get(other_id, 0.0) + weights[signal] * value
+    
+    for other_id, value in _association_scores(file_id).items():
+        add('association', other_id, value)
+    
+    tags = [row['name'] for row in query_db('''
+        SELECT t.name FROM file_tags ft JOIN tags t ON t.id = ft.tag_id WHERE ft.file_id = ?
+    ''', (file_id,))]
+    for other_id, value in _tag_scores(file_id).items():
+        add('tags', other_id, value)
+    
+    text = ' '.join(filter(None, [file['title'], file['keywords'], file['auto_category'], ' '.join(tags)]))
+    for other_id, value in _semantic_scores(text, index or get_expansion_index()).items():
+        add('semantic', other_id, value)
+    
+    if not scores:
+        return []
+    
+    # Only live files make the list
+    candidates = list(scores)
+    live = {row['id'] for row in query_db(
+        f"SELECT id FROM files WHERE deleted = 0 AND id IN ({','.join('?' * len(candidates))})", candidates)}
+    
+    top_k = current_app.config.get('RELATED_TOP_K', 10)
+    ranked = sorted(((other_id, score) for other_id, score in scores.items() if other_id in live),
+                    key=lambda item: item[1], reverse=True)
+    return ranked[:top_k]
+
+def _association_scores(file_id):
+    """Association strength, halved every RELATED_DECAY_DAYS since the pair was last visited"""
+    half_life = current_app.config.get('RELATED_DECAY_DAYS', 30)
+    rows = query_db('''
+        SELECT file_id_2 as other_id, strength, last_accessed FROM learned_associations WHERE file_id_1 = ?
+        UNION ALL
+        SELECT file_id_1, strength, last_accessed FROM learned_associations WHERE file_id_2 = ?
+    ''', (file_id, file_id))
+    
+    now = datetime.utcnow()
+    scores = {}
+    for row in rows:
+        last_accessed = row['last_accessed']
+        if isinstance(last_accessed, str):
+            last_accessed = datetime.fromisoformat(last_accessed)
+        age_days = max((now - last_accessed).total_seconds() / 86400, 0) if last_accessed else 0
+        scores[row['other_id']] = row['strength'] * 0.5 ** (age_days / half_life)
+    
+    return scores
+
+def _tag_scores(file_id):
+    """Shared tags, each weighted by rarity; tags on more than RELATED_MAX_TAG_FILES files are ignored"""
+    max_files = current_app.config.get('RELATED_MAX_TAG_FILES', 500)
+    tag_counts = query_db('''
+        SELECT ft.tag_id, (SELECT COUNT(*) FROM file_tags WHERE tag_id = ft.tag_id) as file_count
+        FROM file_tags ft WHERE ft.file_id = ?
+    ''', (file_id,))
+    
+    scores = {}
+    for tag in tag_counts:
+        if tag['file_count'] < 2 or tag['file_count'] > max_files:
+            continue
+        weight = 1 / math.log2(1 + tag['file_count'])
+        for row in query_db('SELECT file_id FROM file_tags WHERE tag_id = ? AND file_id != ?',
+                            (tag['tag_id'], file_id)):
+            scores[row['file_id']] = scores.get(row['file_id'], 0.0) + weight
+    
+    return scores
+
+def _semantic_scores(text, index):
+    """Files matching the expanded terms in the search index, scored 0-1 by bm25 rank"""
+    terms = expand_terms(text, index) if text else set()
+    if not terms:
+        return {}
+    
+    # Each term quoted as a phrase so multi-word terms and FTS5 operators are literal
+    match_query = ' OR '.join('"' + term.replace('"', '') + '"' for term in sorted(terms))
+    try:
+        rows = query_db('''
+            SELECT rowid as file_id, bm25(files_fts) as rank
+            FROM files_fts
+            WHERE files_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ''', (match_query, current_app.config.get('RELATED_SEMANTIC_CANDIDATES', 50)))
+    except sqlite3.OperationalError as e:
+        current_app.logger.warning(f"Semantic related-file lookup failed: {str(e)}")
+        return {}
+    
+    if not rows:
+        return {}
+    
+    # bm25 is negative, more negative is better
+    best = min(row['rank'] for row in rows) or -1.0
+    return {row['file_id']: row['rank'] / best for row in rows}
+
+def get_related_files(file_ids, limit=None):
+    """Neighbours of the given files from the precomputed table, excluding those files, best first"""
+    file_ids = list(file_ids)
+    if not file_ids:
+        return []
+    
+    placeholders = ','.join('?' * len(file_ids))
+    rows = query_db(f'''
+        SELECT f.id, f.filename, m.title, m.description, SUM(n.score) as score
+        FROM file_neighbours n
+        JOIN files f ON f.id = n.neighbour_id AND f.deleted = 0
+        LEFT JOIN metadata m ON m.file_id = f.id
+        WHERE n.file_id IN ({placeholders}) AND n.neighbour_id NOT IN ({placeholders})
+        GROUP BY f.id
+        ORDER BY score DESC
+        LIMIT ?
+    ''', file_ids + file_ids + [limit or current_app.config.get('RELATED_LIMIT', 6)])
+    
+    return [dict(row) for row in rows]
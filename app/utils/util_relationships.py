@@ -0,0 +1,169 @@
+"""
+/home/life/app/utils/util_relationships.py
+Version: 1.0.0
+Purpose: Semantic relationships - in-memory bidirectional term expansion index over the
+         relationships table, reloaded when any process edits it
+Created: 2026-10-18
+"""
+
+import re
+import json
+import time
+import threading
+from flask import current_app
+from utils.util_db import query_db, execute_db, transaction
+
+# Settings key bumped on every edit so other processes know to reload
+VERSION_KEY = 'relationships_version'
+
+# Loaded index: {'terms': {term: frozenset}, 'parents': {term: frozenset},
+#                'max_words': longest term in words, 'version', 'checked'}
+# Never changed in place apart from 'checked' - readers keep whichever object they fetched
+_index = {'terms': None}
+_index_lock = threading.Lock()
+
+def _normalize_term(term):
+    return ' '.join(re.findall(r'\w+', str(term).lower()))
+
+def _load_index():
+    """Build the expansion index from the relationships table"""
+    forward, reverse = {}, {}
+    for row in query_db('SELECT term, related_terms FROM relationships'):
+        try:
+            related = json.loads(row['related_terms'])
+        except (TypeError, ValueError):
+            current_app.logger.warning(f"Skipping relationship '{row['term']}' with invalid related_terms")
+            continue
+        
+        term = _normalize_term(row['term'])
+        for other in map(_normalize_term, related):
+            if other and other != term:
+                forward.setdefault(term, set()).add(other)
+                reverse.setdefault(other, set()).add(term)
+    
+    all_terms = set(forward) | set(reverse)
+    return {
+        'terms': {term: frozenset(related) for term, related in forward.items()},
+        'parents': {term: frozenset(parents) for term, parents in reverse.items()},
+        'max_words': max((len(term.split()) for term in all_terms), default=1),
+    }
+
+def _stored_version():
+    row = query_db('SELECT value FROM settings WHERE key = ?', (VERSION_KEY,), one=True)
+    return row['value'] if row else None
+
+def get_expansion_index():
+    """
+    The loaded index, built on first use. Other processes' edits are noticed within
+    RELATIONSHIPS_RELOAD_CHECK seconds (one settings lookup per check).
+    """
+    global _index
+    now = time.monotonic()
+    index = _index
+    if index['terms'] is not None and now - index['checked'] < current_app.config.get('RELATIONSHIPS_RELOAD_CHECK', 10):
+        return index
+    
+    with _index_lock:
+        index = _index
+        version = _stored_version()
+        if index['terms'] is None or index['version'] != version:
+            index = dict(_load_index(), version=version, checked=now)
+            _index = index
+            if current_app.config['DEBUG']:
+                current_app.logger.debug(f"Loaded {len(index['terms'])} relationships (version {version})")
+        else:
+            index['checked'] = now
+    
+    return index
+
+def _bump_version():
+    """Record an edit for other processes; joins the caller's transaction"""
+    execute_db('''
+        INSERT INTO settings (key, value, modified_date) VALUES (?, '1', CURRENT_TIMESTAMP)
+        ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1, modified_date = CURRENT_TIMESTAMP
+    ''', (VERSION_KEY,))
+
+def invalidate_expansion_index():
+    """Drop this process's loaded index so the next lookup reloads it"""
+    global _index
+    with _index_lock:
+        _index = {'terms': None}
+
+def find_terms(text, index=None):
+    """Relationship terms (single or multi-word) that occur in text"""
+    index = index or get_expansion_index()
+    words = re.findall(r'\w+', text.lower())
+    found = set()
+    
+    for size in range(1, index['max_words'] + 1):
+        for start in range(len(words) - size + 1):
+            gram = ' '.join(words[start:start + size])
+            if gram in index['terms'] or gram in index['parents']:
+                found.add(gram)
+    
+    return found
+
+def expand_terms(text, index=None):
+    """
+    Related terms for text: children of any term it contains, plus the parent terms of any
+    related term it contains. Terms already in the text are left out.
+    """
+    index = index or get_expansion_index()
+    present = find_terms(text, index)
+    expanded = set()
+    for term in present:
+        expanded |= index['terms'].get(term, frozenset())
+        expanded |= index['parents'].get(term, frozenset())
+    
+    return expanded - present
+
+def get_relationships():
+    """All relationships as dicts with related_terms decoded"""
+    relationships = []
+    for row in query_db('SELECT id, term, related_terms FROM relationships ORDER BY term'):
+        try:
+            related = json.loads(row['related_terms'])
+        except (TypeError, ValueError):
+            related = []
+        relationships.append({'id': row['id'], 'term': row['term'], 'related_terms': related})
+    
+    return relationships
+
+def save_relationship(term, related_terms):
+    """Create or replace the relationship for term; returns its id, or None for an empty term"""
+    term = _normalize_term(term)
+    related = []
+    for other in map(_normalize_term, related_terms):
+        if other and other != term and other not in related:
+            related.append(other)
+    
+    if not term:
+        return None
+    
+    with transaction():
+        existing = query_db('SELECT id FROM relationships WHERE LOWER(term) = ?', (term,), one=True)
+        if existing:
+            execute_db('UPDATE relationships SET term = ?, related_terms = ? WHERE id = ?',
+                       (term, json.dumps(related), existing['id']))
+            relationship_id = existing['id']
+        else:
+            relationship_id = execute_db('INSERT INTO relationships (term, related_terms) VALUES (?, ?)',
+                                         (term, json.dumps(related)))
+        _bump_version()
+    
+    invalidate_expansion_index()
+    
+    return relationship_id
+
+def delete_relationship(relationship_id):
+    """Delete one relationship; returns True when it existed"""
+    with transaction():
+        existing = query_db('SELECT id FROM relationships WHERE id = ?', (relationship_id,), one=True)
+        if not existing:
+            return False
+        execute_db('DELETE FROM relationships WHERE id = ?', (relationship_id,))
+        _bump_version()
+    
+    invalidate_expansion_index()
+    
+    return True
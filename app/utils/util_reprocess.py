@@ -0,0 +1,271 @@
+"""
+/home/life/app/utils/util_reprocess.py
+Version: 1.0.0
+Purpose: Archive-wide reprocessing - re-run chosen pipeline stages over a selection of files
+         through the image and text process pools, throttled and resumable
+Created: 2026-10-18
+"""
+
+import os
+import json
+import time
+import hashlib
+from flask import current_app
+from utils.util_db import query_db, transaction
+from utils.util_image import process_images_parallel
+from utils.util_derivatives import (derivative_outputs, register_derivatives, drop_derivatives, default_format,
+                                    remove_derivative_files, check_derivative_budget)
+from utils.util_storage import calculate_checksum
+from utils.util_similar import (get_similarity_index, record_image_hash, prepare_document_signatures,
+                                record_document_signatures)
+from utils.util_text import can_extract_text, extract_texts_parallel, store_file_text, get_file_text
+from utils.util_categories import get_category_rules, reclassify_rows
+from utils.util_jobs import IMAGE_EXTENSIONS, record_date_taken
+from utils.util_related import mark_related_dirty
+
+# Stages in the order they run on each batch; category goes last as it can move files
+REPROCESS_STAGES = ('thumbnails', 'metadata', 'hash', 'text', 'category')
+
+# Failures kept for the summary report
+MAX_REPORTED_FAILURES = 50
+
+def _selection_sql(category=None, filetype=None, since=None, until=None):
+    """WHERE clause and args for the selection filters"""
+    where = ['f.deleted = 0']
+    args = []
+    if category:
+        where.append('m.auto_category LIKE ?')
+        args.append(f'{category}%')
+    if filetype:
+        where.append('f.filetype LIKE ?')
+        args.append(f'{filetype}%')
+    if since:
+        where.append('f.upload_date >= ?')
+        args.append(since)
+    if until:
+        where.append('f.upload_date < ?')
+        args.append(until)
+    return ' AND '.join(where), args
+
+def select_files(filters, after_id=0, limit=100):
+    """Next batch of selected live files after after_id, in id order"""
+    where, args = _selection_sql(**filters)
+    return [dict(row) for row in query_db(f'''
+        SELECT f.id, f.filename, f.filepath, f.filetype, f.checksum, m.auto_category, m.ocr_text
+        FROM files f
+        JOIN metadata m ON m.file_id = f.id
+        WHERE {where} AND f.id > ?
+        ORDER BY f.id
+        LIMIT ?
+    ''', args + [after_id, limit])]
+
+def count_files(filters):
+    """Number of files the filters select"""
+    where, args = _selection_sql(**filters)
+    return query_db(f'''
+        SELECT COUNT(*) as count FROM files f
+        JOIN metadata m ON m.file_id = f.id
+        WHERE {where}
+    ''', args, one=True)['count']
+
+def get_checkpoint_path(stages, filters):
+    """Default checkpoint for one stages + filters combination, under DATA_DIR/.reprocess"""
+    key = hashlib.md5(json.dumps([sorted(stages), filters], sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(current_app.config['DATA_DIR'], '.reprocess', f'{key}.json')
+
+def load_checkpoint(path):
+    """Saved {'last_id', 'report'} of an interrupted run, or None"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path, last_id, report):
+    """Write the checkpoint atomically after each batch"""
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({'last_id': last_id, 'report': report}, f)
+    os.replace(temp_path, path)
+
+def _record(report, stage, file_id=None, error=None, changed=False):
+    counts = report['stages'][stage]
+    if error:
+        counts['failed'] += 1
+        if len(report['failures']) < MAX_REPORTED_FAILURES:
+            report['failures'].append({'file_id': file_id, 'stage': stage, 'error': str(error)})
+    else:
+        counts['done'] += 1
+        if changed:
+            counts['changed'] += 1
+
+def verify_checksums(rows, report):
+    """
+    hash stage: re-read each file in the batch and compare its MD5 with files.checksum.
+    Missing files and mismatches are reported, not rewritten - the stored checksum also
+    names the file's storage object and derivatives. Returns the ids that verified.
+    """
+    verified = set()
+    for row in rows:
+        if not os.path.exists(row['filepath']):
+            _record(report, 'hash', row['id'], f"File missing: {row['filepath']}")
+            continue
+        actual = calculate_checksum(row['filepath'])
+        if actual != row['checksum']:
+            _record(report, 'hash', row['id'], f"Checksum mismatch: stored {row['checksum']}, file {actual}")
+            continue
+        verified.add(row['id'])
+    
+    return verified
+
+def reprocess_images(rows, stages, report, verified=()):
+    """thumbnails/metadata/hash for the images in a batch - one decode per image in the pool"""
+    image_stages = [stage for stage in ('thumbnails', 'metadata', 'hash') if stage in stages]
+    images = [row for row in rows
+              if row['filepath'].lower().endswith(IMAGE_EXTENSIONS) and os.path.exists(row['filepath'])]
+    if not image_stages or not images:
+        return
+    
+    prewarm = current_app.config.get('DERIVATIVE_PREWARM', ('thumb',)) if 'thumbnails' in stages else ()
+    fmt = default_format()
+    results = process_images_parallel([
+        (row['filepath'], derivative_outputs(row['checksum'], prewarm, fmt), 'hash' in stages)
+        for row in images
+    ])
+    
+    if 'hash' in stages:
+        get_similarity_index()
+    
+    stale = []
+    with transaction():
+        for row, result in zip(images, results):
+            if result['error']:
+                for stage in image_stages:
+                    _record(report, stage, row['id'], result['error'])
+                continue
+            
+            if 'thumbnails' in stages:
+                # Other sizes and formats re-render at the current settings when next requested
+                register_derivatives(row['checksum'], result['derivatives'])
+                stale += drop_derivatives(row['checksum'], keep={path for path, _ in result['derivatives']})
+                _record(report, 'thumbnails', changed=True)
+            if 'metadata' in stages:
+                _record(report, 'metadata', changed=record_date_taken(row['id'], result['metadata'], overwrite=True))
+            if 'hash' in stages and row['id'] in verified:
+                if result['image_hash'] is None:
+                    _record(report, 'hash', row['id'], 'No perceptual hash computed')
+                else:
+                    previous = query_db('SELECT hash FROM image_hashes WHERE file_id = ?', (row['id'],), one=True)
+                    record_image_hash(row['id'], result['image_hash'])
+                    _record(report, 'hash', changed=previous is None or previous['hash'] != result['image_hash'])
+    
+    # Files go only once their rows are committed
+    if 'thumbnails' in stages:
+        remove_derivative_files(stale)
+        check_derivative_budget()
+
+def reprocess_texts(rows, stages, report, verified=()):
+    """text extraction and document signatures (hash) for the non-image files in a batch"""
+    documents = [row for row in rows
+                 if not row['filepath'].lower().endswith(IMAGE_EXTENSIONS) and os.path.exists(row['filepath'])]
+    
+    # Files whose new text was signed by the text stage
+    signed = set()
+    if 'text' in stages:
+        extractable = [row for row in documents if can_extract_text(row['filepath'])]
+        results = extract_texts_parallel([row['filepath'] for row in extractable])
+        extracted = [(row, result) for row, result in zip(extractable, results) if not result['error']]
+        for row, result in zip(extractable, results):
+            if result['error']:
+                _record(report, 'text', row['id'], result['error'])
+        
+        # Signatures are hashed before the transaction - it only holds the writes
+        prepared = prepare_document_signatures([(row['id'], result['text']) for row, result in extracted])
+        with transaction():
+            for row, result in extracted:
+                changed = result['text'] != (get_file_text(row['id']) or '')
+                store_file_text(row['id'], result['text'], result['extractor'])
+                signed.add(row['id'])
+                row['ocr_text'] = result['text']
+                _record(report, 'text', changed=changed)
+            record_document_signatures(prepared)
+            mark_related_dirty(signed)
+    
+    if 'hash' in stages:
+        unsigned = []
+        for row in documents:
+            if row['id'] not in verified:
+                continue
+            text = None if row['id'] in signed else get_file_text(row['id']) or row['ocr_text']
+            if text:
+                unsigned.append((row['id'], text))
+            _record(report, 'hash')
+        
+        prepared = prepare_document_signatures(unsigned)
+        with transaction():
+            record_document_signatures(prepared)
+
+def reprocess_files(stages, filters=None, checkpoint=None, move=True, pause=None, progress=None):
+    """
+    Re-run stages (see REPROCESS_STAGES) over the files selected by filters (category
+    prefix, filetype prefix, since/until upload date) in batches of REPROCESS_BATCH_SIZE.
+    Sleeps pause seconds (REPROCESS_PAUSE) between batches to leave room for live traffic.
+    Progress is saved to the checkpoint after every batch and a rerun with the same
+    checkpoint carries on from there; the checkpoint is removed once the run completes.
+    progress(report) is called after every batch.
+    Returns the report: total, processed, per-stage done/changed/failed, failures, seconds.
+    """
+    config = current_app.config
+    filters = filters or {}
+    batch_size = config.get('REPROCESS_BATCH_SIZE', 100)
+    pause = config.get('REPROCESS_PAUSE', 0) if pause is None else pause
+    stages = [stage for stage in REPROCESS_STAGES if stage in stages]
+    
+    saved = load_checkpoint(checkpoint)
+    if saved:
+        last_id = saved['last_id']
+        report = saved['report']
+        current_app.logger.info(f"Resuming reprocess after file {last_id}")
+    else:
+        last_id = 0
+        report = {'total': count_files(filters), 'processed': 0, 'seconds': 0.0, 'failures': [],
+                  'stages': {stage: {'done': 0, 'changed': 0, 'failed': 0} for stage in stages}}
+    
+    rules = get_category_rules() if 'category' in stages else None
+    started = time.monotonic() - report['seconds']
+    
+    while True:
+        rows = select_files(filters, last_id, batch_size)
+        if not rows:
+            break
+        
+        verified = verify_checksums(rows, report) if 'hash' in stages else set()
+        reprocess_images(rows, stages, report, verified)
+        reprocess_texts(rows, stages, report, verified)
+        
+        if rules:
+            counts = {'changed': 0, 'moved': 0, 'failed': 0}
+            reclassify_rows(rows, rules, counts, move)
+            category = report['stages']['category']
+            category['done'] += len(rows) - counts['failed']
+            category['changed'] += counts['changed'] - counts['failed']
+            category['failed'] += counts['failed']
+        
+        last_id = rows[-1]['id']
+        report['processed'] += len(rows)
+        report['seconds'] = time.monotonic() - started
+        save_checkpoint(checkpoint, last_id, report)
+        
+        if progress:
+            progress(report)
+        if pause:
+            time.sleep(pause)
+    
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    
+    current_app.logger.info(f"Reprocessed {report['processed']} files ({', '.join(stages)}) "
+                          f"in {report['seconds']:.0f}s: {report['stages']}")
+    return report
@@ -0,0 +1,224 @@
+"""
+/home/life/app/utils/util_search.py
+Version: 1.1.0
+Purpose: Full-text file search - SQLite FTS5 index kept in sync by triggers, bm25 ranking, snippets
+Created: 2026-10-18
+Updated: 2026-10-18 - Results carry filetype for thumbnails
+Updated: 2026-10-18 - Queries widened with related terms, expansion-only matches ranked lower
+"""
+
+import re
+import sqlite3
+from markupsafe import Markup, escape
+from flask import current_app
+from utils.util_db import query_db, execute_db, transaction
+from utils.util_relationships import expand_terms
+
+# Indexed columns and their bm25 weights (same order as the FTS table)
+FTS_COLUMNS = ('filename', 'title', 'description', 'keywords', 'ocr_text', 'tags')
+FTS_WEIGHTS = (3.0, 5.0, 2.0, 3.0, 1.0, 4.0)
+
+# Private-use markers for snippet() so highlighting survives HTML escaping
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+
+# Index rows for every file whose id is in {ids}; used in trigger bodies and rebuilds
+_FTS_INSERT_SQL = '''
+    INSERT INTO files_fts (rowid, filename, title, description, keywords, ocr_text, tags)
+    SELECT f.id, f.filename, m.title, m.description, m.keywords, m.ocr_text,
+           (SELECT GROUP_CONCAT(t.name, ' ')
+            FROM file_tags ft
+            JOIN tags t ON t.id = ft.tag_id
+            WHERE ft.file_id = f.id)
+    FROM files f
+    LEFT JOIN metadata m ON m.file_id = f.id
+    WHERE f.id IN {ids}
+'''
+
+_FTS_TRIGGERS = {
+    'files_fts_files_ai': ('AFTER INSERT ON files', '(NEW.id)'),
+    'files_fts_files_au': ('AFTER UPDATE OF filename ON files', '(NEW.id)'),
+    'files_fts_metadata_ai': ('AFTER INSERT ON metadata', '(NEW.file_id)'),
+    'files_fts_metadata_au': ('AFTER UPDATE OF title, description, keywords, ocr_text ON metadata', '(NEW.file_id)'),
+    'files_fts_metadata_ad': ('AFTER DELETE ON metadata', '(OLD.file_id)'),
+    'files_fts_file_tags_ai': ('AFTER INSERT ON file_tags', '(NEW.file_id)'),
+    'files_fts_file_tags_ad': ('AFTER DELETE ON file_tags', '(OLD.file_id)'),
+    'files_fts_tags_au': ('AFTER UPDATE OF name ON tags',
+                          '(SELECT file_id FROM file_tags WHERE tag_id = NEW.id)'),
+}
+
+def create_search_index(db):
+    """Create the FTS5 table and sync triggers, then index existing files (migration 2)"""
+    try:
+        db.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+                {', '.join(FTS_COLUMNS)},
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5 - search keeps using LIKE
+        current_app.logger.warning(f"FTS5 unavailable, file search will use LIKE: {str(e)}")
+        return
+    
+    for name, (event, ids) in _FTS_TRIGGERS.items():
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} {event}
+            BEGIN
+                DELETE FROM files_fts WHERE rowid IN {ids};
+                {_FTS_INSERT_SQL.format(ids=ids)};
+            END
+        ''')
+    
+    db.execute('''
+        CREATE TRIGGER IF NOT EXISTS files_fts_files_ad AFTER DELETE ON files
+        BEGIN
+            DELETE FROM files_fts WHERE rowid = OLD.id;
+        END
+    ''')
+    
+    db.execute('DELETE FROM files_fts')
+    db.execute(_FTS_INSERT_SQL.format(ids='(SELECT id FROM files)'))
+
+def rebuild_search_index():
+    """Re-index every file from scratch; returns the number of indexed files"""
+    with transaction():
+        execute_db('DELETE FROM files_fts')
+        execute_db(_FTS_INSERT_SQL.format(ids='(SELECT id FROM files)'))
+        execute_db("INSERT INTO files_fts (files_fts) VALUES ('optimize')")
+    
+    count = query_db('SELECT COUNT(*) as count FROM files_fts', one=True)['count']
+    current_app.logger.info(f"Search index rebuilt: {count} files")
+    
+    return count
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    
+    # Quote each word so FTS5 operators typed by users are taken literally
+    return ' '.join(f'"{word}"*' for word in words)
+
+def highlight_snippet(snippet):
+    """Escape a snippet() result and turn its markers into <mark> tags"""
+    if not snippet:
+        return None
+    
+    html = str(escape(snippet))
+    return Markup(html.replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>'))
+
+def build_expanded_query(text, match_query):
+    """
+    Widen a match query with related terms from the relationships index.
+    Returns None when expansion is off or nothing relates to the text.
+    """
+    if not current_app.config.get('SEARCH_EXPANSION', True):
+        return None
+    
+    try:
+        terms = expand_terms(text)
+    except Exception as e:
+        current_app.logger.warning(f"Search term expansion failed: {str(e)}")
+        return None
+    
+    if not terms:
+        return None
+    
+    # Related terms are whole phrases, not prefixes
+    return f'({match_query}) OR ' + ' OR '.join('"' + term.replace('"', '') + '"' for term in sorted(terms))
+
+def search_files(text, limit, offset=0):
+    """
+    Search non-deleted files, best matches first.
+    Files found only through related terms rank with their bm25 scaled by
+    SEARCH_EXPANSION_WEIGHT, so direct matches normally come first.
+    Returns: (list of result dicts, total match count)
+    """
+    match_query = build_match_query(text)
+    if not match_query:
+        return [], 0
+    
+    expanded_query = build_expanded_query(text, match_query)
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    
+    if expanded_query:
+        # bm25 is negative (lower is better), so a weight below 1 pushes a row down
+        rank = f'''bm25(files_fts, {weights}) * CASE
+                    WHEN files_fts.rowid IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?) THEN 1.0
+                    ELSE ? END'''
+        rank_args = (match_query, current_app.config.get('SEARCH_EXPANSION_WEIGHT', 0.5))
+    else:
+        rank = f'bm25(files_fts, {weights})'
+        rank_args = ()
+    
+    try:
+        rows = query_db(f'''
+            SELECT f.id, f.filename, f.filetype, f.size, f.upload_date,
+                   m.title, m.description, m.auto_category,
+                   snippet(files_fts, -1, ?, ?, '…', 12) as snippet
+            FROM files_fts
+            JOIN files f ON f.id = files_fts.rowid
+            LEFT JOIN metadata m ON f.id = m.file_id
+            WHERE files_fts MATCH ? AND f.deleted = 0
+            ORDER BY {rank}
+            LIMIT ? OFFSET ?
+        ''', (SNIPPET_START, SNIPPET_END, expanded_query or match_query) + rank_args + (limit, offset))
+        
+        total_count = query_db('''
+            SELECT COUNT(*) as count
+            FROM files_fts
+            JOIN files f ON f.id = files_fts.rowid
+            WHERE files_fts MATCH ? AND f.deleted = 0
+        ''', (expanded_query or match_query,), one=True)['count']
+        
+    except sqlite3.OperationalError as e:
+        current_app.logger.warning(f"Full-text search failed, falling back to LIKE: {str(e)}")
+        return _search_files_like(text, limit, offset)
+    
+    results = []
+    for row in rows:
+        result = dict(row)
+        result['snippet'] = highlight_snippet(result['snippet'])
+        results.append(result)
+    
+    return results, total_count
+
+def _search_files_like(text, limit, offset):
+    """Unindexed LIKE search, used when FTS5 is not available"""
+    where = '''
+        WHERE f.deleted = 0 AND (
+            f.filename LIKE ? OR
+            m.title LIKE ? OR
+            m.description LIKE ? OR
+            m.keywords LIKE ? OR
+            m.ocr_text LIKE ? OR
+            t.name LIKE ?
+        )
+    '''
+    joins = '''
+        FROM files f
+        LEFT JOIN metadata m ON f.id = m.file_id
+        LEFT JOIN file_tags ft ON f.id = ft.file_id
+        LEFT JOIN tags t ON ft.tag_id = t.id
+    '''
+    search_term = f'%{text}%'
+    
+    rows = query_db(f'''
+        SELECT DISTINCT f.id, f.filename, f.filetype, f.size, f.upload_date,
+               m.title, m.description, m.auto_category
+        {joins}
+        {where}
+        ORDER BY f.upload_date DESC
+        LIMIT ? OFFSET ?
+    ''', (search_term,) * 6 + (limit, offset))
+    
+    total_count = query_db(f'''
+        SELECT COUNT(DISTINCT f.id) as count
+        {joins}
+        {where}
+    ''', (search_term,) * 6, one=True)['count']
+    
+    return [dict(row) for row in rows], total_count
@@ -0,0 +1,415 @@
+"""
+/home/life/app/utils/util_similar.py
+Version: 1.1.0
+Purpose: Near-duplicate detection - perceptual hashes per image in an in-memory multi-index
+         Hamming index, and MinHash signatures with LSH buckets in SQLite for document text
+Created: 2026-10-18
+Updated: 2026-10-18 - MinHash/LSH near-duplicate documents
+"""
+
+import os
+import re
+import zlib
+import time
+import random
+import struct
+import hashlib
+import threading
+from functools import lru_cache
+from flask import current_app
+from utils.util_db import query_db, execute_db, execute_many, transaction, in_transaction
+
+# 64-bit hashes split into four 16-bit chunks, one lookup table per chunk
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# Per-process index: {'pid', 'index', 'watermark' (last image_hashes.id loaded)}
+_state = {'pid': None, 'index': None, 'watermark': 0}
+_state_lock = threading.Lock()
+
+def to_unsigned(value):
+    """Stored signed 64-bit hash back to its unsigned bit pattern"""
+    return value & ((1 << HASH_BITS) - 1)
+
+@lru_cache(maxsize=8)
+def _chunk_variants(radius):
+    """Every CHUNK_BITS-wide mask with at most radius bits set"""
+    masks = [0]
+    frontier = [0]
+    for _ in range(radius):
+        frontier = list({mask | (1 << bit) for mask in frontier for bit in range(CHUNK_BITS)
+                         if not mask & (1 << bit)})
+        masks.extend(frontier)
+    return tuple(masks)
+
+class HammingIndex:
+    """
+    Multi-index hashing: if two hashes differ in at most r bits, one of the CHUNKS chunks
+    differs in at most r // CHUNKS bits. A lookup probes each chunk table with every
+    value within that radius and checks full distances only for the few candidates.
+    """
+    
+    def __init__(self):
+        self.hashes = {}
+        self.tables = [{} for _ in range(CHUNKS)]
+    
+    def __len__(self):
+        return len(self.hashes)
+    
+    def add(self, file_id, value):
+        """Index a file's hash (unsigned); re-adding a file replaces its old hash"""
+        self.hashes[file_id] = value
+        for chunk, table in enumerate(self.tables):
+            table.setdefault((value >> (chunk * CHUNK_BITS)) & CHUNK_MASK, []).append((file_id, value))
+    
+    def search(self, value, max_distance):
+        """[(file_id, distance)] within max_distance bits, closest first"""
+        variants = _chunk_variants(max_distance // CHUNKS)
+        found = {}
+        for chunk, table in enumerate(self.tables):
+            key = (value >> (chunk * CHUNK_BITS)) & CHUNK_MASK
+            for mask in variants:
+                for file_id, other in table.get(key ^ mask, ()):
+                    # Entries left behind by a replaced hash are skipped
+                    if file_id in found or self.hashes.get(file_id) != other:
+                        continue
+                    distance = bin(value ^ other).count('1')
+                    if distance <= max_distance:
+                        found[file_id] = distance
+        
+        return sorted(found.items(), key=lambda item: (item[1], item[0]))
+
+def get_similarity_index():
+    """
+    This process's index, loaded on first use and topped up with hashes stored since.
+    Inside a transaction it is returned as is - rows seen there may still roll back, and
+    their ids would then be reused - so batch writers call this before opening theirs.
+    """
+    with _state_lock:
+        if _state['pid'] != os.getpid() or _state['index'] is None:
+            _state.update(pid=os.getpid(), index=HammingIndex(), watermark=0)
+        
+        if in_transaction():
+            return _state['index']
+        
+        started = time.perf_counter()
+        rows = query_db('SELECT id, file_id, hash FROM image_hashes WHERE id > ? ORDER BY id',
+                        (_state['watermark'],))
+        for row in rows:
+            _state['index'].add(row['file_id'], to_unsigned(row['hash']))
+        if rows:
+            _state['watermark'] = rows[-1]['id']
+            if len(rows) > 1000:
+                current_app.logger.info(f"Loaded {len(rows)} image hashes in "
+                                      f"{(time.perf_counter() - started) * 1000:.0f}ms")
+        
+        return _state['index']
+
+def find_similar_images(image_hash, max_distance=None, exclude_id=None):
+    """
+    Live files whose image hash is within max_distance bits (SIMILAR_MAX_DISTANCE)
+    of image_hash (signed or unsigned). Returns [{'file_id', 'distance'}], closest first.
+    """
+    if max_distance is None:
+        max_distance = current_app.config.get('SIMILAR_MAX_DISTANCE', 6)
+    
+    value = to_unsigned(image_hash)
+    index = get_similarity_index()
+    
+    # Hashes past the watermark (this transaction's own, or committed since the last top-up)
+    # are compared directly and override whatever the index holds for those files
+    recent = {}
+    if in_transaction():
+        recent = {row['file_id']: to_unsigned(row['hash']) for row in query_db(
+            'SELECT file_id, hash FROM image_hashes WHERE id > ?', (_state['watermark'],))}
+    
+    found = {file_id: distance for file_id, distance in index.search(value, max_distance)
+             if file_id not in recent}
+    for file_id, other in recent.items():
+        distance = bin(value ^ other).count('1')
+        if distance <= max_distance:
+            found[file_id] = distance
+    
+    matches = sorted(((file_id, distance) for file_id, distance in found.items() if file_id != exclude_id),
+                     key=lambda item: (item[1], item[0]))
+    if not matches:
+        return []
+    
+    # The index keeps deleted files; drop them here
+    placeholders = ','.join('?' * len(matches))
+    live = {row['id'] for row in query_db(
+        f'SELECT id FROM files WHERE deleted = 0 AND id IN ({placeholders})', [file_id for file_id, _ in matches])}
+    
+    return [{'file_id': file_id, 'distance': distance} for file_id, distance in matches if file_id in live]
+
+def record_image_hash(file_id, image_hash):
+    """
+    Store a file's hash and record the live files it nearly duplicates, replacing the
+    pairs found from any earlier hash. Pairs are stored once, lower file id first.
+    Joins the caller's transaction. Returns the near-duplicates found.
+    """
+    similar = find_similar_images(image_hash, exclude_id=file_id)
+    
+    execute_db('INSERT OR REPLACE INTO image_hashes (file_id, hash) VALUES (?, ?)', (file_id, image_hash))
+    execute_db('DELETE FROM image_duplicates WHERE file_id = ? OR similar_id = ?', (file_id, file_id))
+    execute_many('''
+        INSERT OR REPLACE INTO image_duplicates (file_id, similar_id, distance) VALUES (?, ?, ?)
+    ''', [(min(file_id, match['file_id']), max(file_id, match['file_id']), match['distance'])
+          for match in similar])
+    
+    if similar:
+        current_app.logger.info(f"File {file_id} is a near-duplicate of "
+                              f"{', '.join(str(match['file_id']) for match in similar)}")
+    
+    return similar
+
+def get_similar_files(file_id):
+    """Recorded near-duplicates of one file, in either direction, that are still live"""
+    rows = query_db('''
+        SELECT d.similar_id as file_id, d.distance FROM image_duplicates d
+        JOIN files f ON f.id = d.similar_id AND f.deleted = 0
+        WHERE d.file_id = ?
+        UNION
+        SELECT d.file_id, d.distance FROM image_duplicates d
+        JOIN files f ON f.id = d.file_id AND f.deleted = 0
+        WHERE d.similar_id = ?
+        ORDER BY distance
+    ''', (file_id, file_id))
+    
+    return [dict(row) for row in rows]
+
+def get_similar_report(limit=200):
+    """Most recent near-duplicate pairs where both files are live"""
+    rows = query_db('''
+        SELECT d.file_id, d.similar_id, d.distance, d.created_date,
+               f1.filename as filename, f1.upload_date as upload_date,
+               f2.filename as similar_filename, f2.upload_date as similar_upload_date
+        FROM image_duplicates d
+        JOIN files f1 ON f1.id = d.file_id AND f1.deleted = 0
+        JOIN files f2 ON f2.id = d.similar_id AND f2.deleted = 0
+        ORDER BY d.created_date DESC, d.distance
+        LIMIT ?
+    ''', (limit,))
+    
+    return [dict(row) for row in rows]
+
+# Document MinHash: 128 permutations in 16 LSH bands of 8 rows, so pairs above roughly
+# (1/16) ** (1/8) = 0.71 estimated Jaccard similarity share a bucket
+MINHASH_PERMUTATIONS = 128
+MINHASH_BANDS = 16
+MINHASH_ROWS = MINHASH_PERMUTATIONS // MINHASH_BANDS
+MINHASH_PRIME = (1 << 61) - 1
+SHINGLE_WORDS = 3
+
+# Fixed seed - stored signatures must stay comparable across processes and restarts
+_permutation_random = random.Random(20261018)
+MINHASH_PARAMS = [(_permutation_random.randrange(1, MINHASH_PRIME), _permutation_random.randrange(0, MINHASH_PRIME))
+                  for _ in range(MINHASH_PERMUTATIONS)]
+
+def text_shingles(text):
+    """32-bit hashes of the overlapping SHINGLE_WORDS-word runs in normalised text"""
+    limit = current_app.config.get('DOCUMENT_SIMILARITY_TEXT_LIMIT', 100000)
+    words = re.findall(r'\w+', text[:limit].lower())
+    if len(words) < SHINGLE_WORDS:
+        return {zlib.crc32(' '.join(words).encode())} if words else set()
+    
+    return {zlib.crc32(' '.join(words[i:i + SHINGLE_WORDS]).encode())
+            for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+def minhash_signature(shingles):
+    """MinHash signature: per permutation, the smallest permuted shingle hash"""
+    return [min((a * shingle + b) % MINHASH_PRIME for shingle in shingles) for a, b in MINHASH_PARAMS]
+
+def lsh_buckets(signature):
+    """(band, bucket) pairs - each band's rows hashed to a signed 64-bit key"""
+    buckets = []
+    for band in range(MINHASH_BANDS):
+        rows = signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<{MINHASH_ROWS}Q', *rows), digest_size=8).digest()
+        buckets.append((band, struct.unpack('<q', digest)[0]))
+    return buckets
+
+def _pack_signature(signature):
+    return struct.pack(f'<{MINHASH_PERMUTATIONS}Q', *signature)
+
+def _unpack_signature(blob):
+    return struct.unpack(f'<{MINHASH_PERMUTATIONS}Q', blob)
+
+def estimate_similarity(signature, other):
+    """Estimated Jaccard similarity of two documents' shingle sets"""
+    return sum(1 for x, y in zip(signature, other) if x == y) / MINHASH_PERMUTATIONS
+
+def compute_signature(text):
+    """
+    (MinHash signature, LSH buckets) of a document's text, or None when it has no words.
+    Pure computation - most of a second for a long document, so never run it while
+    holding the write lock.
+    """
+    shingles = text_shingles(text or '')
+    if not shingles:
+        return None
+    
+    signature = minhash_signature(shingles)
+    return signature, lsh_buckets(signature)
+
+def find_similar_documents(text=None, signature=None, min_similarity=None, exclude_id=None):
+    """
+    Live files whose text is probably the same document: candidates sharing an LSH
+    bucket, kept when the estimated similarity reaches DOCUMENT_SIMILARITY_THRESHOLD.
+    Returns [{'file_id', 'similarity'}], most similar first.
+    """
+    if signature is None:
+        computed = compute_signature(text)
+        if computed is None:
+            return []
+        signature = computed[0]
+    if min_similarity is None:
+        min_similarity = current_app.config.get('DOCUMENT_SIMILARITY_THRESHOLD', 0.8)
+    
+    buckets = lsh_buckets(signature)
+    rows = query_db(f'''
+        SELECT s.file_id, s.signature
+        FROM document_signatures s
+        JOIN files f ON f.id = s.file_id AND f.deleted = 0
+        WHERE s.file_id IN (
+            SELECT file_id FROM document_buckets
+            WHERE {' OR '.join(['(band = ? AND bucket = ?)'] * len(buckets))}
+        )
+    ''', [value for bucket in buckets for value in bucket])
+    
+    matches = []
+    for row in rows:
+        if row['file_id'] == exclude_id:
+            continue
+        similarity = estimate_similarity(signature, _unpack_signature(row['signature']))
+        if similarity >= min_similarity:
+            matches.append({'file_id': row['file_id'], 'similarity': round(similarity, 3)})
+    
+    return sorted(matches, key=lambda match: -match['similarity'])
+
+def prepare_document_signatures(documents):
+    """
+    Signatures, buckets and probable duplicates for [(file_id, text)], computed before
+    the caller opens the transaction that writes them with record_document_signatures.
+    Documents in the list are matched against each other by their new signatures
+    rather than against whatever is stored for them.
+    """
+    min_similarity = current_app.config.get('DOCUMENT_SIMILARITY_THRESHOLD', 0.8)
+    batch_ids = {file_id for file_id, _ in documents}
+    
+    prepared = []
+    for file_id, text in documents:
+        computed = compute_signature(text)
+        if computed is None:
+            prepared.append({'file_id': file_id, 'signature': None, 'buckets': [], 'similar': []})
+            continue
+        
+        signature, buckets = computed
+        similar = [match for match in find_similar_documents(signature=signature, exclude_id=file_id)
+                   if match['file_id'] not in batch_ids]
+        for other in prepared:
+            if other['signature'] is None or not set(buckets) & set(other['buckets']):
+                continue
+            similarity = estimate_similarity(signature, other['signature'])
+            if similarity >= min_similarity:
+                similar.append({'file_id': other['file_id'], 'similarity': round(similarity, 3)})
+        
+        prepared.append({'file_id': file_id, 'signature': signature, 'buckets': buckets,
+                         'similar': sorted(similar, key=lambda match: -match['similarity'])})
+    
+    return prepared
+
+def record_document_signatures(prepared):
+    """
+    Store prepared signatures and buckets and the probable duplicates found for them,
+    replacing each file's earlier signature and pairs. Pairs are stored once, lower file
+    id first. Only writes - joins the caller's transaction. Returns {file_id: matches}.
+    """
+    file_ids = [entry['file_id'] for entry in prepared]
+    execute_many('DELETE FROM document_buckets WHERE file_id = ?', [(file_id,) for file_id in file_ids])
+    execute_many('DELETE FROM document_signatures WHERE file_id = ?', [(file_id,) for file_id in file_ids])
+    execute_many('DELETE FROM document_duplicates WHERE file_id = ? OR similar_id = ?',
+                 [(file_id, file_id) for file_id in file_ids])
+    
+    signed = [entry for entry in prepared if entry['signature'] is not None]
+    execute_many('INSERT INTO document_signatures (file_id, signature) VALUES (?, ?)',
+                 [(entry['file_id'], _pack_signature(entry['signature'])) for entry in signed])
+    execute_many('INSERT OR IGNORE INTO document_buckets (band, bucket, file_id) VALUES (?, ?, ?)',
+                 [(band, bucket, entry['file_id']) for entry in signed for band, bucket in entry['buckets']])
+    execute_many('''
+        INSERT OR REPLACE INTO document_duplicates (file_id, similar_id, similarity) VALUES (?, ?, ?)
+    ''', [(min(entry['file_id'], match['file_id']), max(entry['file_id'], match['file_id']), match['similarity'])
+          for entry in signed for match in entry['similar']])
+    
+    for entry in signed:
+        if entry['similar']:
+            current_app.logger.info(f"File {entry['file_id']} is probably the same document as "
+                                  f"{', '.join(str(match['file_id']) for match in entry['similar'])}")
+    
+    return {entry['file_id']: entry['similar'] for entry in prepared}
+
+def sign_document(file_id, text):
+    """Sign one document in its own short transaction; returns the probable duplicates found"""
+    prepared = prepare_document_signatures([(file_id, text)])
+    with transaction():
+        return record_document_signatures(prepared)[file_id]
+
+def get_similar_documents(file_id):
+    """Recorded probable duplicates of one document, in either direction, that are still live"""
+    rows = query_db('''
+        SELECT d.similar_id as file_id, d.similarity FROM document_duplicates d
+        JOIN files f ON f.id = d.similar_id AND f.deleted = 0
+        WHERE d.file_id = ?
+        UNION
+        SELECT d.file_id, d.similarity FROM document_duplicates d
+        JOIN files f ON f.id = d.file_id AND f.deleted = 0
+        WHERE d.similar_id = ?
+        ORDER BY similarity DESC
+    ''', (file_id, file_id))
+    
+    return [dict(row) for row in rows]
+
+def get_similar_documents_report(category_prefix='documents/', limit=200):
+    """Most recent probable-duplicate document pairs in categories under category_prefix"""
+    rows = query_db('''
+        SELECT d.file_id, d.similar_id, d.similarity, d.created_date,
+               f1.filename as filename, f1.upload_date as upload_date, m1.auto_category as category,
+               f2.filename as similar_filename, f2.upload_date as similar_upload_date,
+               m2.auto_category as similar_category
+        FROM document_duplicates d
+        JOIN files f1 ON f1.id = d.file_id AND f1.deleted = 0
+        JOIN files f2 ON f2.id = d.similar_id AND f2.deleted = 0
+        JOIN metadata m1 ON m1.file_id = d.file_id
+        JOIN metadata m2 ON m2.file_id = d.similar_id
+        WHERE m1.auto_category LIKE ? OR m2.auto_category LIKE ?
+        ORDER BY d.created_date DESC, d.similarity DESC
+        LIMIT ?
+    ''', (category_prefix + '%', category_prefix + '%', limit))
+    
+    return [dict(row) for row in rows]
+
+def index_documents(reindex=False):
+    """
+    Sign every live file with text in metadata.ocr_text (only unsigned ones unless reindex),
+    recording probable duplicates as it goes. Returns (signed, with duplicates).
+    """
+    rows = query_db(f'''
+        SELECT f.id, m.ocr_text FROM files f
+        JOIN metadata m ON m.file_id = f.id
+        WHERE f.deleted = 0 AND m.ocr_text IS NOT NULL AND m.ocr_text != ''
+        {'' if reindex else 'AND f.id NOT IN (SELECT file_id FROM document_signatures)'}
+        ORDER BY f.id
+    ''')
+    
+    signed, duplicates = 0, 0
+    for row in rows:
+        # Hashed before the write lock is taken - only the inserts hold it
+        if sign_document(row['id'], row['ocr_text']):
+            duplicates += 1
+        signed += 1
+    
+    current_app.logger.info(f"Indexed {signed} documents, {duplicates} with probable duplicates")
+    return signed, duplicates
+
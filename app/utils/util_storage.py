@@ -1,17 +1,92 @@
 """
 util_storage.py
 Date: 2025-06-18
-Version: 1.0.01
+Version: 1.3.00
 Purpose: File storage operations - validation, checksums, categorization, backups fixed
+Updated: 2026-10-18 - Streaming upload staging that hashes and sniffs MIME type while receiving
+Updated: 2026-10-18 - Optional content-addressed object store with hardlinked category paths
+Updated: 2026-10-18 - Categorisation moved to the configurable rule engine, relocate_file for reclassify
 """
 
 import os
+import time
 import hashlib
 import shutil
+import tempfile
 import magic
 import subprocess
 from datetime import datetime
-from flask import current_app
+from flask import current_app, Request
+from werkzeug.utils import secure_filename
+
+# Bytes kept from the start of each upload for MIME sniffing
+UPLOAD_HEAD_SIZE = 8192
+
+class StagedUpload:
+    """
+    Upload stream written straight to a staging file on the DATA_DIR filesystem.
+    The checksum and leading bytes are captured as data arrives, so the file never
+    has to be re-read and can be moved into storage with a rename.
+    """
+    
+    def __init__(self, staging_dir, suffix='', algorithm='md5'):
+        fd, self.path = tempfile.mkstemp(dir=staging_dir, prefix='upload_', suffix=suffix)
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.new(algorithm)
+        self.head = b''
+        self.size = 0
+    
+    def write(self, data):
+        if len(self.head) < UPLOAD_HEAD_SIZE:
+            self.head += bytes(data[:UPLOAD_HEAD_SIZE - len(self.head)])
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+    
+    def __getattr__(self, name):
+        # seek/read/tell/flush etc. used by Werkzeug and FileStorage
+        return getattr(self._file, name)
+    
+    @property
+    def checksum(self):
+        return self._hash.hexdigest()
+    
+    def finish(self):
+        """Flush and close the staging file, leaving it on disk; returns its path"""
+        if not self._file.closed:
+            self._file.close()
+        return self.path
+    
+    def discard(self):
+        """Close and remove the staging file if it was never moved into storage"""
+        self.finish()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class StagingRequest(Request):
+    """Request class whose multipart file parts stream into StagedUpload files"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        staging_dir = get_staging_dir()
+        suffix = os.path.splitext(secure_filename(filename or ''))[1].lower()
+        
+        staged = StagedUpload(staging_dir, suffix)
+        self.__dict__.setdefault('_staged_uploads', []).append(staged)
+        return staged
+    
+    def close(self):
+        """Remove staged files the view did not move into storage"""
+        try:
+            super().close()
+        finally:
+            for staged in self.__dict__.pop('_staged_uploads', []):
+                staged.discard()
+
+def get_staging_dir():
+    """Staging directory on the same filesystem as DATA_DIR so moves are renames"""
+    staging_dir = os.path.join(current_app.config['DATA_DIR'], '.staging')
+    os.makedirs(staging_dir, exist_ok=True)
+    return staging_dir
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
@@ -54,55 +129,35 @@ def get_file_type(filepath):
         
     except Exception as e:
         current_app.logger.error(f"Failed to get file type: {str(e)}")
-        # Fallback to extension
-        ext = filepath.rsplit('.', 1)[1].lower() if '.' in filepath else 'unknown'
-        return f'application/{ext}'
+        return get_file_type_from_extension(filepath)
 
-def get_file_category(filename, filetype=None):
-    """Determine file category based on name and type"""
-    filename_lower = filename.lower()
-    
-    # Check by extension first
-    if filename_lower.endswith(('.pdf', '.doc', '.docx', '.txt', '.odt')):
-        category = 'documents'
-    elif filename_lower.endswith(('.jpg', '.jpeg', '.png', '.gif', '.heic', '.bmp')):
-        category = 'images'
-    elif filename_lower.endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm')):
-        category = 'videos'
-    else:
-        category = 'documents'  # Default
-    
-    # Refine by content/keywords
-    if category == 'documents':
-        # Check for specific document types
-        if any(word in filename_lower for word in ['invoice', 'rechnung', 'bill', 'receipt']):
-            return 'documents/financial'
-        elif any(word in filename_lower for word in ['medical', 'doctor', 'prescription', 'gesundheit']):
-            return 'documents/medical'
-        elif any(word in filename_lower for word in ['contract', 'legal', 'vertrag', 'testament']):
-            return 'documents/legal'
-        else:
-            return 'documents/personal'
-    
-    elif category == 'images':
-        if any(word in filename_lower for word in ['passport', 'id', 'license', 'ausweis']):
-            return 'images/documents'
-        elif any(word in filename_lower for word in ['family', 'birthday', 'wedding']):
-            return 'images/family'
+def get_file_type_from_buffer(head, filename):
+    """Get MIME type from the first bytes of a file using python-magic"""
+    try:
+        mime = magic.Magic(mime=True)
+        return mime.from_buffer(head)
         
-        else:
-            return 'images/events'
-    
-    elif category == 'videos':
-        if any(word in filename_lower for word in ['family', 'birthday', 'christmas']):
-            return 'videos/family'
-        else:
-            return 'videos/events'
+    except Exception as e:
+        current_app.logger.error(f"Failed to get file type: {str(e)}")
+        return get_file_type_from_extension(filename)
+
+def get_file_type_from_extension(filename):
+    """Fallback MIME type guess from the file extension"""
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'unknown'
+    return f'application/{ext}'
+
+def get_file_category(filename, filetype=None, text=None):
+    """Determine file category from name, MIME type and extracted text (see util_categories)"""
+    from utils.util_categories import categorize
     
-    return f'{category}/personal'
+    return categorize(filename, filetype, text)
 
-def move_to_storage(temp_path, category, filename):
-    """Move file from temp to permanent storage"""
+def move_to_storage(temp_path, category, filename, checksum=None):
+    """
+    Move file from temp to permanent storage.
+    With STORAGE_CAS the bytes live once in the content-addressed object store and the
+    category path is a hardlink to them; content already stored is never written again.
+    """
     try:
         # Build storage path
         storage_base = current_app.config['DATA_DIR']
@@ -111,23 +166,23 @@ def move_to_storage(temp_path, category, filename):
         # Create directory if needed
         os.makedirs(category_path, exist_ok=True)
         
-        # Final path
-        final_path = os.path.join(category_path, filename)
-        
-        # Handle duplicate filenames
-        if os.path.exists(final_path):
-            base, ext = os.path.splitext(filename)
-            counter = 1
-            while os.path.exists(final_path):
-                filename = f"{base}_{counter}{ext}"
-                final_path = os.path.join(category_path, filename)
-                counter += 1
-        
-        # Move file
-        shutil.move(temp_path, final_path)
-        
-        # Set permissions
-        os.chmod(final_path, 0o644)
+        if current_app.config.get('STORAGE_CAS', False) and checksum:
+            object_path = get_object_path(checksum)
+            if os.path.exists(object_path):
+                # Same bytes already on disk - just add another name for them
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                shutil.move(temp_path, object_path)
+                os.chmod(object_path, 0o644)
+            
+            final_path = _create_unique(category_path, filename,
+                                        lambda path: _link_or_symlink(object_path, path))
+        else:
+            final_path = _place_file(temp_path, category_path, filename)
+            
+            # Set permissions
+            os.chmod(final_path, 0o644)
         
         if current_app.config['DEBUG']:
             current_app.logger.debug(f"Moved file: {temp_path} -> {final_path}")
@@ -138,6 +193,123 @@ def move_to_storage(temp_path, category, filename):
         current_app.logger.error(f"Failed to move file to storage: {str(e)}")
         return temp_path
 
+def relocate_file(filepath, category):
+    """Move an archived file into another category directory; returns the new path"""
+    category_path = os.path.join(current_app.config['DATA_DIR'], category)
+    os.makedirs(category_path, exist_ok=True)
+    return _place_file(filepath, category_path, os.path.basename(filepath))
+
+def _place_file(source, directory, filename):
+    """Move source to a free name in directory without ever replacing an existing file"""
+    try:
+        # Hardlink claims the name atomically, so concurrent uploads cannot clobber each other
+        final_path = _create_unique(directory, filename, lambda path: os.link(source, path))
+        os.remove(source)
+    except OSError:
+        # Different filesystem or no hardlink support
+        final_path = _create_unique(directory, filename, lambda path: _move_if_absent(source, path))
+    return final_path
+
+def _create_unique(directory, filename, create):
+    """Call create(path) with filename, then name_1, name_2... until it does not raise FileExistsError"""
+    base, ext = os.path.splitext(filename)
+    counter = 0
+    while True:
+        path = os.path.join(directory, f"{base}_{counter}{ext}" if counter else filename)
+        try:
+            create(path)
+            return path
+        except FileExistsError:
+            counter += 1
+
+def _move_if_absent(source, path):
+    if os.path.lexists(path):
+        raise FileExistsError(path)
+    shutil.move(source, path)
+
+def _link_or_symlink(object_path, path):
+    """Hardlink to an object; a symlink where the filesystem cannot hardlink"""
+    try:
+        os.link(object_path, path)
+    except FileExistsError:
+        raise
+    except OSError:
+        os.symlink(object_path, path)
+
+def get_object_dir():
+    """Root of the content-addressed object store"""
+    return os.path.join(current_app.config['DATA_DIR'], '.objects')
+
+def get_object_path(checksum):
+    """Object location sharded as ab/cd/<checksum>, so no directory holds more than a handful of files"""
+    return os.path.join(get_object_dir(), checksum[:2], checksum[2:4], checksum)
+
+def store_object(path, checksum):
+    """
+    Adopt an existing archive file into the object store.
+    New content gets an object entry linked to the file; content the store already
+    has replaces the file's own copy with a link, freeing the duplicate bytes - only
+    once the file is hashed and found to hold exactly those bytes.
+    Returns: 'added', 'deduplicated', 'present' or 'mismatch'
+    """
+    object_path = get_object_path(checksum)
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    
+    try:
+        os.link(path, object_path)
+        return 'added'
+    except FileExistsError:
+        pass
+    
+    if os.path.samefile(path, object_path):
+        return 'present'
+    
+    # The file is about to be replaced - never on the strength of its row's checksum alone
+    if calculate_checksum(path) != checksum:
+        current_app.logger.warning(f"Not linking {path} to object {checksum}: its content differs")
+        return 'mismatch'
+    
+    # Link beside the file, then rename over it - the file never disappears
+    temp_link = f"{path}.cas-{os.getpid()}"
+    os.link(object_path, temp_link)
+    os.replace(temp_link, path)
+    return 'deduplicated'
+
+def collect_unreferenced_objects(grace=None):
+    """
+    Remove objects no archive path links to any more (only the store's own name left)
+    and whose checksum no file row uses. Objects whose links changed in the last grace
+    seconds (OBJECT_GC_GRACE) are kept - an upload's object exists briefly before its
+    category link and file row do. Returns (count, bytes) freed.
+    """
+    from utils.util_db import query_db
+    
+    object_dir = get_object_dir()
+    if not os.path.isdir(object_dir):
+        return 0, 0
+    
+    if grace is None:
+        grace = current_app.config.get('OBJECT_GC_GRACE', 3600)
+    # ctime moves on every link, unlink, rename and chmod of the inode
+    cutoff = time.time() - grace
+    known = {row['checksum'] for row in query_db('SELECT checksum FROM files WHERE checksum IS NOT NULL')}
+    
+    removed, freed = 0, 0
+    for root, dirs, files in os.walk(object_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            # Symlinked views do not raise st_nlink, so the DB check guards those
+            if stat.st_nlink == 1 and name not in known and stat.st_ctime < cutoff:
+                os.remove(path)
+                removed += 1
+                freed += stat.st_size
+    
+    if removed:
+        current_app.logger.info(f"Removed {removed} unreferenced objects ({freed} bytes)")
+    
+    return removed, freed
+
 def get_file_size_formatted(size_bytes):
     """Format file size in human readable format"""
     for unit in ['B', 'KB', 'MB', 'GB']:
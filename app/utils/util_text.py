@@ -0,0 +1,389 @@
+"""
+/home/life/app/utils/util_text.py
+Version: 1.0.0
+Purpose: Text extraction - plain text, OpenDocument, Word and PDF text streams with the standard
+         library, optional OCR, run in a bounded process pool with per-file timeouts
+Created: 2026-10-18
+"""
+
+import os
+import re
+import mmap
+import time
+import zlib
+import base64
+import signal
+import codecs
+import zipfile
+import threading
+import xml.etree.ElementTree as ET
+from flask import current_app
+from utils.util_db import query_db, execute_db
+from utils.util_pool import map_in_pool
+
+# Optional OCR for images - used when TEXT_OCR is on and pytesseract/tesseract are installed
+try:
+    import pytesseract
+    from PIL import Image
+    OCR_SUPPORT = True
+except ImportError:
+    OCR_SUPPORT = False
+
+# Largest decompressed zip member or PDF stream read, so a bomb cannot exhaust a worker
+MAX_PART_BYTES = 64 * 1024 * 1024
+
+OCR_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff')
+
+# Tokens or elements parsed between deadline checks
+DEADLINE_CHECK_EVERY = 4096
+
+DOCX_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+ODF_TEXT_NS = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}'
+
+# This thread's extraction deadline (time.monotonic()), set by run_text_extraction
+_deadline = threading.local()
+
+def _check_deadline():
+    """Raise TimeoutError once the current extraction has run past its deadline"""
+    deadline = getattr(_deadline, 'at', None)
+    if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError
+
+def _read_zip_part(path, name):
+    """One member of a zip container, refusing members that inflate past MAX_PART_BYTES"""
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name)
+        if info.file_size > MAX_PART_BYTES:
+            raise ValueError(f"{name} is {info.file_size} bytes uncompressed")
+        with archive.open(info) as part:
+            return ET.parse(part).getroot()
+
+def extract_plain_text(path, limit):
+    """Plain text as UTF-8 (with or without BOM), UTF-16 with BOM, else Windows-1252"""
+    with open(path, 'rb') as f:
+        data = f.read(limit * 4)
+    
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return data.decode('utf-16', errors='replace')
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the read limit is still UTF-8
+        if e.start >= len(data) - 3:
+            return data[:e.start].decode('utf-8-sig')
+        return data.decode('cp1252', errors='replace')
+
+def extract_docx_text(path, limit):
+    """Body text of a Word document: w:t runs, tabs and breaks, one line per paragraph"""
+    parts = []
+    for index, element in enumerate(_read_zip_part(path, 'word/document.xml').iter()):
+        if not index % DEADLINE_CHECK_EVERY:
+            _check_deadline()
+        if element.tag == f'{DOCX_NS}t':
+            parts.append(element.text or '')
+        elif element.tag == f'{DOCX_NS}tab':
+            parts.append('\t')
+        elif element.tag in (f'{DOCX_NS}br', f'{DOCX_NS}cr', f'{DOCX_NS}p'):
+            # iter() is document order, so a paragraph's break lands before its text
+            parts.append('\n')
+    
+    return ''.join(parts)
+
+def extract_odt_text(path, limit):
+    """Text of an OpenDocument file, one line per paragraph or heading"""
+    parts = []
+    visited = 0
+    
+    def walk(element):
+        nonlocal visited
+        visited += 1
+        if not visited % DEADLINE_CHECK_EVERY:
+            _check_deadline()
+        if element.tag == f'{ODF_TEXT_NS}s':
+            parts.append(' ' * int(element.get(f'{ODF_TEXT_NS}c', 1)))
+        elif element.tag == f'{ODF_TEXT_NS}tab':
+            parts.append('\t')
+        elif element.tag == f'{ODF_TEXT_NS}line-break':
+            parts.append('\n')
+        elif element.text:
+            parts.append(element.text)
+        
+        for child in element:
+            walk(child)
+            if child.tail:
+                parts.append(child.tail)
+        
+        if element.tag in (f'{ODF_TEXT_NS}p', f'{ODF_TEXT_NS}h'):
+            parts.append('\n')
+    
+    walk(_read_zip_part(path, 'content.xml'))
+    return ''.join(parts)
+
+# PDF content stream tokens: literal strings (one level of nested parentheses),
+# hex strings, array brackets, names, comments and bare words (numbers and operators)
+_PDF_TOKEN_RE = re.compile(rb'''
+    \((?:\\.|[^\\()]|\((?:\\.|[^\\()])*\))*\)
+  | <[0-9A-Fa-f\s]*>
+  | [\[\]]
+  | /[^\s()<>\[\]{}/%]*
+  | %[^\r\n]*
+  | [^\s()<>\[\]{}/%]+
+''', re.S | re.X)
+
+_PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+_PDF_ESCAPE_RE = re.compile(rb'\\([0-7]{1,3}|\r\n|[\r\n]|.)', re.S)
+_PDF_FILTER_RE = re.compile(rb'/Filter\s*(\[[^\]]*\]|/\w+)')
+_PDF_STREAM_RE = re.compile(rb'(?<!end)stream\r?\n')
+
+# Streams that never hold page text
+_PDF_SKIP_RE = re.compile(rb'/Subtype\s*/Image|/Type\s*/(?:ObjStm|XRef|Metadata)|/Length[123]\b')
+
+def _pdf_unescape(match):
+    escape = match.group(1)
+    if escape[:1].isdigit():
+        return bytes([int(escape, 8) & 0xff])
+    if escape in (b'\r\n', b'\r', b'\n'):
+        return b''
+    return _PDF_ESCAPES.get(escape, escape)
+
+def _pdf_string(token):
+    """Decode a literal or hex string token; None when it is not readable text"""
+    if token.startswith(b'('):
+        raw = _PDF_ESCAPE_RE.sub(_pdf_unescape, token[1:-1])
+    else:
+        digits = re.sub(rb'\s', b'', token[1:-1])
+        raw = bytes.fromhex((digits + b'0' * (len(digits) % 2)).decode())
+    
+    if raw.startswith(codecs.BOM_UTF16_BE):
+        text = raw[2:].decode('utf-16-be', errors='replace')
+    else:
+        text = raw.decode('cp1252', errors='replace')
+    
+    # Two-byte glyph ids from embedded CID fonts decode to control characters
+    printable = sum(1 for char in text if char.isprintable() or char.isspace())
+    return text if printable * 2 >= len(text) else None
+
+def _pdf_stream_text(content):
+    """Text shown by Tj/TJ/'/\" operators in one content stream, a line per text line"""
+    parts = []
+    operands = []
+    arrays = []
+    
+    for index, match in enumerate(_PDF_TOKEN_RE.finditer(content)):
+        if not index % DEADLINE_CHECK_EVERY:
+            _check_deadline()
+        token = match.group()
+        first = token[:1]
+        if first in (b'(', b'<'):
+            operands.append(_pdf_string(token))
+        elif token == b'[':
+            arrays.append(operands)
+            operands = []
+        elif token == b']':
+            array = operands
+            operands = arrays.pop() if arrays else []
+            operands.append(array)
+        elif first in (b'/', b'%'):
+            operands.append(None)
+        elif first in b'+-.0123456789':
+            try:
+                operands.append(float(token))
+            except ValueError:
+                operands.append(None)
+        else:
+            if token in (b'Tj', b"'", b'"') and operands and isinstance(operands[-1], str):
+                if token != b'Tj':
+                    parts.append('\n')
+                parts.append(operands[-1])
+            elif token == b'TJ' and operands and isinstance(operands[-1], list):
+                for item in operands[-1]:
+                    if isinstance(item, str):
+                        parts.append(item)
+                    elif isinstance(item, float) and item < -200:
+                        # A wide negative kern is how many producers set a word space
+                        parts.append(' ')
+            elif token in (b'T*', b'ET'):
+                parts.append('\n')
+            elif token in (b'Td', b'TD') and len(operands) >= 2:
+                parts.append('\n' if operands[-1] not in (0, None) else ' ')
+            operands = []
+            arrays = []
+    
+    return ''.join(parts)
+
+def _pdf_decode_stream(header, data):
+    """Undo a stream's filters; None for streams using filters other than Flate/ASCII85"""
+    match = _PDF_FILTER_RE.search(header)
+    filters = re.findall(rb'/(\w+)', match.group(1)) if match else []
+    
+    for name in filters:
+        if name in (b'FlateDecode', b'Fl'):
+            inflater = zlib.decompressobj()
+            try:
+                data = inflater.decompress(data, MAX_PART_BYTES)
+            except zlib.error:
+                # Truncated or padded streams still give back what inflated cleanly
+                data = b''
+        elif name in (b'ASCII85Decode', b'A85'):
+            data = base64.a85decode(data.strip().removeprefix(b'<~').removesuffix(b'~>'),
+                                    adobe=False, ignorechars=b' \t\r\n')
+        else:
+            return None
+    
+    return data
+
+def extract_pdf_text(path, limit):
+    """
+    Text from a PDF's content streams, without a PDF library: every Flate/ASCII85 stream
+    is decoded and its text operators read. Good for producer-generated PDFs; scans and
+    CID-font documents without a readable encoding give little or nothing.
+    """
+    if os.path.getsize(path) == 0:
+        return ''
+    
+    parts = []
+    length = 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data.find(b'/Encrypt') != -1:
+            raise ValueError('PDF is encrypted')
+        
+        for match in _PDF_STREAM_RE.finditer(data):
+            _check_deadline()
+            start = match.end()
+            end = data.find(b'endstream', start)
+            if end == -1:
+                break
+            header = data[max(0, data.rfind(b'obj', 0, match.start())):match.start()]
+            if _PDF_SKIP_RE.search(header):
+                continue
+            
+            content = _pdf_decode_stream(header, data[start:end])
+            if not content or b'BT' not in content:
+                continue
+            
+            text = _pdf_stream_text(content)
+            parts.append(text)
+            length += len(text)
+            if length >= limit:
+                break
+    
+    return '\n'.join(parts)
+
+def extract_image_text(path, limit, lang='eng'):
+    """OCR an image with tesseract, which is killed if it runs past the extraction deadline"""
+    deadline = getattr(_deadline, 'at', None)
+    timeout = max(1, deadline - time.monotonic()) if deadline is not None else 0
+    with Image.open(path) as img:
+        try:
+            return pytesseract.image_to_string(img, lang=lang, timeout=timeout)
+        except RuntimeError as e:
+            # pytesseract's own timeout
+            if 'timeout' in str(e).lower():
+                raise TimeoutError from e
+            raise
+
+# Extension -> extractor(path, limit); OCR_EXTENSIONS map to extract_image_text when OCR is on
+TEXT_EXTRACTORS = {
+    '.txt': extract_plain_text,
+    '.md': extract_plain_text,
+    '.csv': extract_plain_text,
+    '.docx': extract_docx_text,
+    '.odt': extract_odt_text,
+    '.pdf': extract_pdf_text,
+}
+
+def get_text_extractor(filepath, ocr=False):
+    """Extractor for a file by extension, or None when its text cannot be read"""
+    ext = os.path.splitext(filepath)[1].lower()
+    if ocr and OCR_SUPPORT and ext in OCR_EXTENSIONS:
+        return extract_image_text
+    return TEXT_EXTRACTORS.get(ext)
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError
+
+def run_text_extraction(filepath, limit, timeout=None, ocr_lang=None):
+    """
+    Extract one file's text; runs in a pool worker, or inline in a job thread. Parsers
+    check a deadline timeout seconds away between units of work, which holds in any
+    thread; in a worker's main thread an alarm also interrupts code that never gets back
+    to a check. Returns: {'source', 'text', 'extractor', 'error', 'ms'}
+    """
+    result = {'source': filepath, 'text': '', 'extractor': None, 'error': None}
+    started = time.perf_counter()
+    
+    extractor = get_text_extractor(filepath, ocr=ocr_lang is not None)
+    alarm = bool(timeout) and hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+    
+    try:
+        if extractor is None:
+            raise ValueError('No text extractor for this file type')
+        result['extractor'] = extractor.__name__.replace('extract_', '').replace('_text', '')
+        
+        _deadline.at = time.monotonic() + timeout if timeout else None
+        if alarm:
+            previous = signal.signal(signal.SIGALRM, _raise_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            if extractor is extract_image_text:
+                text = extractor(filepath, limit, lang=ocr_lang)
+            else:
+                text = extractor(filepath, limit)
+        finally:
+            _deadline.at = None
+            if alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous)
+        
+        # Collapse runs of blanks but keep line structure for snippets
+        text = re.sub(r'[ \t\r\f\v]+', ' ', text[:limit])
+        result['text'] = re.sub(r' ?\n[\s]*', '\n', text).strip()
+    
+    except TimeoutError:
+        result['error'] = f'Timed out after {timeout}s'
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    
+    result['ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+def extract_texts_parallel(filepaths):
+    """
+    Run run_text_extraction over several files across TEXT_EXTRACT_WORKERS processes.
+    Each file gets TEXT_EXTRACT_TIMEOUT seconds, enforced inside the worker; a worker that
+    is stuck in C code past the batch deadline is killed and its files come back as errors.
+    Returns: list of result dicts in filepaths order
+    """
+    config = current_app.config
+    limit = config.get('TEXT_EXTRACT_LIMIT', 1000000)
+    timeout = config.get('TEXT_EXTRACT_TIMEOUT', 60)
+    ocr_lang = config.get('TEXT_OCR_LANG', 'eng') if config.get('TEXT_OCR', False) else None
+    
+    # The pool deadline leaves the worker's own alarm room to fire first
+    return map_in_pool('text', config.get('TEXT_EXTRACT_WORKERS', 2), run_text_extraction,
+                       [(path, limit, timeout, ocr_lang) for path in filepaths], timeout + 5,
+                       lambda task, error: {'source': task[0], 'text': '', 'extractor': None, 'error': error})
+
+def can_extract_text(filepath):
+    """True when extraction would read this file under the current config"""
+    return get_text_extractor(filepath, ocr=current_app.config.get('TEXT_OCR', False)) is not None
+
+def store_file_text(file_id, text, extractor):
+    """
+    Keep the full text zlib-compressed in file_texts and the first TEXT_SEARCH_LIMIT
+    characters in metadata.ocr_text, where search reads it. Joins the caller's transaction.
+    """
+    execute_db('''
+        INSERT OR REPLACE INTO file_texts (file_id, content, extractor, length, extracted_date)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (file_id, zlib.compress(text.encode('utf-8'), 6), extractor, len(text)))
+    
+    search_text = text[:current_app.config.get('TEXT_SEARCH_LIMIT', 100000)]
+    execute_db('UPDATE metadata SET ocr_text = ? WHERE file_id = ?', (search_text or None, file_id))
+
+def get_file_text(file_id):
+    """A file's full extracted text, or None when none has been extracted"""
+    row = query_db('SELECT content FROM file_texts WHERE file_id = ?', (file_id,), one=True)
+    if not row:
+        return None
+    return zlib.decompress(row['content']).decode('utf-8')
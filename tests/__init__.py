@@ -0,0 +1,6 @@
+"""
+/home/life/tests/__init__.py
+Version: 1.0.0
+Purpose: Test package initialization
+Created: 2026-10-18
+"""
@@ -0,0 +1,124 @@
+"""
+/home/life/tests/conftest.py
+Version: 1.0.0
+Purpose: pytest fixtures - a Life app on a throwaway DATA_DIR and database for every test
+Created: 2026-10-18
+"""
+
+import os
+import sys
+import types
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+sys.path.insert(0, APP_DIR)
+
+class TestingConfig:
+    """Deployment config.py is not in the repo; tests never read it, so never touch /home/life"""
+    DEBUG = False
+    TESTING = True
+    SECRET_KEY = 'testing'
+    ADMIN_PASSWORD = 'admin'
+    VIEW_PASSWORD = 'view'
+    ITEMS_PER_PAGE = 20
+    ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'heic', 'pdf', 'txt', 'docx', 'odt', 'mov', 'mp4'}
+    BIN_TYPES = {}
+    SHOPPING_LISTS = []
+
+    # Everything runs inline in the test thread
+    JOB_WORKERS = 0
+    IMAGE_PROCESS_WORKERS = 0
+    TEXT_EXTRACT_WORKERS = 0
+    ASSOCIATION_FLUSH_INTERVAL = 3600
+
+    @classmethod
+    def use_dir(cls, base):
+        cls.DB_PATH = os.path.join(base, 'db', 'life.db')
+        cls.LOG_DIR = os.path.join(base, 'logs')
+        cls.DATA_DIR = os.path.join(base, 'data')
+        cls.UPLOAD_FOLDER = os.path.join(base, 'data', 'uploads')
+        cls.BACKUP_DIR = os.path.join(base, 'backups')
+
+    @staticmethod
+    def init_app(app):
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+# life.py imports config and builds a module-level app on import
+config_module = types.ModuleType('config')
+config_module.config = {'testing': TestingConfig, 'development': TestingConfig}
+sys.modules['config'] = config_module
+os.environ['FLASK_ENV'] = 'testing'
+
+def _reset_process_state():
+    """Per-process caches keyed by pid would otherwise carry one test's rows into the next"""
+    from utils import util_similar, util_relationships, util_associations, util_ingest
+
+    with util_similar._state_lock:
+        util_similar._state.update(pid=None, index=None, watermark=0)
+    util_relationships.invalidate_expansion_index()
+    with util_associations._pending_lock:
+        util_associations._pending.clear()
+        # The flusher holds the app it started under - the next record starts one for this app
+        util_associations._flusher.update(pid=None, app=None, wake=None)
+    with util_ingest._upload_hashes_lock:
+        util_ingest._upload_hashes.clear()
+
+@pytest.fixture(scope='session')
+def life(tmp_path_factory):
+    TestingConfig.use_dir(str(tmp_path_factory.mktemp('life-import')))
+    import life
+    return life
+
+@pytest.fixture
+def app(life, tmp_path):
+    TestingConfig.use_dir(str(tmp_path))
+    handlers = list(life.app.logger.handlers)
+    app = life.create_app('testing')
+    _reset_process_state()
+    yield app
+
+    # Every app shares the 'life' logger - drop this one's log file handler
+    for handler in app.logger.handlers[:]:
+        if handler not in handlers:
+            app.logger.removeHandler(handler)
+            handler.close()
+
+@pytest.fixture
+def ctx(app):
+    """An application context on the test app"""
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def make_file(ctx):
+    """Insert a live file row with metadata (and tags); returns its id. Needs no file on disk."""
+    from utils.util_db import execute_db, transaction
+    from utils.util_ingest import add_file_tags
+    counter = [0]
+
+    def make_file(filename, category='documents/general', filetype='text/plain', title=None,
+                  description='', keywords='', ocr_text=None, tags='', filepath=None, upload_date=None):
+        counter[0] += 1
+        with transaction():
+            file_id = execute_db('''
+                INSERT INTO files (filename, filepath, filetype, size, checksum, upload_date)
+                VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ''', (filename, filepath or os.path.join(ctx.config['DATA_DIR'], filename), filetype, 1024,
+                  f'{counter[0]:032x}', upload_date))
+            execute_db('''
+                INSERT INTO metadata (file_id, title, description, keywords, ocr_text, auto_category)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (file_id, title or filename, description, keywords, ocr_text, category))
+            add_file_tags(file_id, tags)
+        return file_id
+
+    return make_file
+
+@pytest.fixture
+def client(app):
+    """Test client logged in as admin"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+        session['is_admin'] = True
+    return client
@@ -0,0 +1,85 @@
+"""
+/home/life/tests/test_associations.py
+Version: 1.0.0
+Purpose: Learned associations - buffered pair counts flushed as batched upserts
+Created: 2026-10-18
+"""
+
+import time
+import pytest
+from utils import util_associations
+from utils.util_db import query_db, execute_db
+from utils.util_associations import record_association, flush_associations
+
+def _strengths():
+    return {(row['file_id_1'], row['file_id_2']): round(row['strength'], 6)
+            for row in query_db('SELECT file_id_1, file_id_2, strength FROM learned_associations')}
+
+def test_new_pair_gets_initial_strength_plus_repeats(ctx):
+    record_association(5, 2)
+    assert _strengths() == {}
+
+    # Either order is the same pair
+    record_association(2, 5)
+    record_association(5, 2)
+    assert flush_associations() == 1
+    assert _strengths() == {(2, 5): 1.2}
+    assert not util_associations._pending
+
+def test_existing_pair_adds_an_increment_per_visit(ctx):
+    record_association(1, 2)
+    flush_associations()
+    for _ in range(3):
+        record_association(2, 1)
+    record_association(1, 3)
+    assert flush_associations() == 2
+    assert _strengths() == {(1, 2): 1.3, (1, 3): 1.0}
+
+def test_flushed_pairs_mark_both_files_dirty(ctx):
+    record_association(7, 9)
+    flush_associations()
+    assert sorted(row['file_id'] for row in query_db('SELECT file_id FROM related_dirty')) == [7, 9]
+    assert query_db("SELECT COUNT(*) as count FROM jobs WHERE job_type = 'refresh_related'", one=True)['count'] == 1
+
+def test_same_file_and_empty_flush_ignored(ctx):
+    record_association(4, 4)
+    assert flush_associations() == 0
+    assert _strengths() == {}
+
+def test_failed_flush_keeps_the_increments(ctx):
+    record_association(1, 2)
+    record_association(1, 2)
+    execute_db('ALTER TABLE learned_associations RENAME TO learned_associations_old')
+    assert flush_associations() == 0
+    assert util_associations._pending[(1, 2)][0] == 2
+
+    execute_db('ALTER TABLE learned_associations_old RENAME TO learned_associations')
+    record_association(1, 2)
+    assert flush_associations() == 1
+    assert _strengths() == {(1, 2): 1.2}
+
+def test_full_buffer_wakes_the_flusher(ctx):
+    ctx.config['ASSOCIATION_FLUSH_SIZE'] = 2
+    record_association(1, 2)
+    record_association(3, 4)
+
+    # Written by the flusher thread, not this one
+    deadline = time.monotonic() + 5
+    while len(_strengths()) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert set(_strengths()) == {(1, 2), (3, 4)}
+
+@pytest.mark.parametrize('order', [(1, 2), (2, 1)])
+def test_downloads_in_sequence_are_recorded(ctx, make_file, client, tmp_path, order):
+    ids = []
+    for name in ('a.txt', 'b.txt'):
+        path = tmp_path / name
+        path.write_text(name)
+        ids.append(make_file(name, filepath=str(path)))
+    first, second = (ids[index - 1] for index in order)
+
+    client.get(f'/files/download/{first}')
+    client.get(f'/files/download/{second}')
+    client.get(f'/files/download/{second}')
+    flush_associations()
+    assert _strengths() == {(min(ids), max(ids)): 1.0}
@@ -0,0 +1,75 @@
+"""
+/home/life/tests/test_browse.py
+Version: 1.0.0
+Purpose: Keyset browse cursors and trigger-maintained file counts
+Created: 2026-10-18
+"""
+
+from routes.bp_files import get_browse_page, encode_cursor, decode_cursor
+from utils.util_db import execute_db, get_file_counts, recount_files
+
+def _make_files(make_file, count=25):
+    """Files oldest first, two to each upload_date so ordering falls back to id"""
+    ids = []
+    for i in range(count):
+        ids.append(make_file(f'{i}.txt', category='documents/a' if i % 2 else 'documents/b',
+                             upload_date=f'2024-01-{1 + i // 2:02d} 10:00:00'))
+    return ids
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor({'upload_date': '2024-01-02 10:00:00', 'id': 7})) == ('2024-01-02 10:00:00', 7)
+    assert decode_cursor('garbage') is None
+
+def test_next_cursors_walk_every_file_once(ctx, make_file):
+    ids = _make_files(make_file)
+    seen = []
+    files, next_cursor, prev_cursor = get_browse_page(None, 10)
+    assert prev_cursor is None
+    while True:
+        seen.extend(f['id'] for f in files)
+        if not next_cursor:
+            break
+        files, next_cursor, prev_cursor = get_browse_page(None, 10, after=next_cursor)
+        assert prev_cursor
+    assert seen == list(reversed(ids))
+
+def test_previous_cursor_returns_the_page_before(ctx, make_file):
+    _make_files(make_file)
+    first, next_cursor, _ = get_browse_page(None, 10)
+    second, _, prev_cursor = get_browse_page(None, 10, after=next_cursor)
+    back, next_again, prev_again = get_browse_page(None, 10, before=prev_cursor)
+    assert [f['id'] for f in back] == [f['id'] for f in first]
+    assert prev_again is None
+    assert next_again == next_cursor
+
+def test_category_and_offset_fallback(ctx, make_file):
+    ids = _make_files(make_file)
+    odd = [file_id for i, file_id in enumerate(ids) if i % 2]
+    files, _, _ = get_browse_page('documents/a', 5, page=2)
+    assert [f['id'] for f in files] == list(reversed(odd))[5:10]
+
+def test_api_browse_pages_with_next_cursor(client, make_file):
+    ids = _make_files(make_file, 12)
+    page = client.get('/files/api/browse?limit=5').json
+    seen = [f['id'] for f in page['files']]
+    while page['next_cursor']:
+        page = client.get('/files/api/browse', query_string={'limit': 5, 'after': page['next_cursor']}).json
+        seen.extend(f['id'] for f in page['files'])
+    assert seen == list(reversed(ids))
+
+def test_counts_follow_inserts_deletes_and_moves(ctx, make_file):
+    ids = _make_files(make_file, 6)
+    assert get_file_counts() == (6, [{'auto_category': 'documents/a', 'count': 3},
+                                     {'auto_category': 'documents/b', 'count': 3}])
+
+    execute_db('UPDATE files SET deleted = 1 WHERE id = ?', (ids[0],))
+    execute_db("UPDATE metadata SET auto_category = 'documents/a' WHERE file_id = ?", (ids[2],))
+    execute_db('UPDATE files SET deleted = 0 WHERE id = ?', (ids[0],))
+    execute_db('DELETE FROM metadata WHERE file_id = ?', (ids[3],))
+    execute_db('DELETE FROM files WHERE id = ?', (ids[3],))
+
+    expected = get_file_counts()
+    assert expected == (5, [{'auto_category': 'documents/a', 'count': 3},
+                            {'auto_category': 'documents/b', 'count': 2}])
+    assert recount_files() == 5
+    assert get_file_counts() == expected
@@ -0,0 +1,76 @@
+"""
+/home/life/tests/test_categories.py
+Version: 1.0.0
+Purpose: Category rules - compiled matching, precedence, configured rules and bulk reclassify
+Created: 2026-10-18
+"""
+
+import os
+from utils.util_db import query_db
+from utils.util_categories import categorize, get_category_rules, reclassify_files
+
+def test_base_type_from_extension_then_mimetype(ctx):
+    assert categorize('notes.txt') == 'documents/personal'
+    assert categorize('clip.MOV') == 'videos/events'
+    assert categorize('scan', 'image/png') == 'images/events'
+    assert categorize('mystery.bin', 'application/octet-stream') == 'documents/personal'
+
+def test_earlier_rule_wins_within_a_field(ctx):
+    assert categorize('contract_invoice.pdf') == 'documents/financial'
+    assert categorize('Doctor_Bill.pdf') == 'documents/financial'
+    assert categorize('wedding_family.jpg') == 'images/family'
+
+def test_filename_beats_text(ctx):
+    assert categorize('contract.pdf', text='invoice number 42') == 'documents/legal'
+    assert categorize('scan.pdf', text='Invoice number 42') == 'documents/financial'
+    # Text keywords are whole words only
+    assert categorize('scan.pdf', text='billing address') == 'documents/personal'
+
+def test_rules_only_apply_to_their_type(ctx):
+    assert categorize('family.pdf') == 'documents/personal'
+    assert categorize('invoice.jpg') == 'images/events'
+
+def test_configured_rules_recompiled(ctx):
+    default = get_category_rules()
+    assert get_category_rules() is default
+
+    ctx.config['CATEGORY_RULES'] = [
+        {'category': 'documents/car', 'type': 'documents', 'keywords': ['mot'], 'fields': ['text']},
+        {'category': 'images/screens', 'mimetypes': ['image/png']},
+    ]
+    assert get_category_rules() is not default
+    assert categorize('scan.pdf', text='MOT certificate') == 'documents/car'
+    assert categorize('mot.pdf') == 'documents/personal'
+    assert categorize('shot.png', 'image/png') == 'images/screens'
+    assert categorize('shot.jpg', 'image/jpeg') == 'images/events'
+
+def test_reclassify_moves_changed_files(ctx, make_file):
+    base = ctx.config['DATA_DIR']
+    os.makedirs(os.path.join(base, 'documents/personal'))
+    path = os.path.join(base, 'documents/personal', 'invoice.pdf')
+    open(path, 'w').close()
+    changed = make_file('invoice.pdf', category='documents/personal', filepath=path)
+    unchanged = make_file('notes.txt', category='documents/personal')
+    missing = make_file('receipt.pdf', category='documents/personal', filepath='/no/such/receipt.pdf')
+
+    assert reclassify_files(dry_run=True) == {'checked': 3, 'changed': 2, 'moved': 0, 'failed': 0}
+    assert query_db('SELECT auto_category FROM metadata WHERE file_id = ?', (changed,), one=True)[0] == \
+        'documents/personal'
+
+    assert reclassify_files(batch_size=2) == {'checked': 3, 'changed': 2, 'moved': 1, 'failed': 0}
+    row = query_db('SELECT f.filepath, m.auto_category FROM files f JOIN metadata m ON m.file_id = f.id '
+                   'WHERE f.id = ?', (changed,), one=True)
+    assert tuple(row) == (os.path.join(base, 'documents/financial', 'invoice.pdf'), 'documents/financial')
+    assert os.path.exists(row['filepath']) and not os.path.exists(path)
+    # Recategorised even though there was no file to move
+    assert query_db('SELECT auto_category FROM metadata WHERE file_id = ?', (missing,), one=True)[0] == \
+        'documents/financial'
+    assert query_db('SELECT auto_category FROM metadata WHERE file_id = ?', (unchanged,), one=True)[0] == \
+        'documents/personal'
+
+    assert reclassify_files()['changed'] == 0
+
+def test_reclassify_command(ctx, make_file):
+    make_file('invoice.pdf', category='documents/personal', filepath='/no/such/invoice.pdf')
+    result = ctx.test_cli_runner().invoke(args=['reclassify', '--no-move'])
+    assert result.output.strip() == 'Checked 1, changed 1, moved 0, failed 0'
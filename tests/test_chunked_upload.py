@@ -0,0 +1,116 @@
+"""
+/home/life/tests/test_chunked_upload.py
+Version: 1.0.0
+Purpose: Resumable chunked uploads - offsets, conflicts, resume, finalize and expiry
+Created: 2026-10-18
+"""
+
+import os
+import hashlib
+import threading
+from utils import util_ingest
+from utils.util_db import query_db, execute_db
+from utils.util_ingest import (create_upload_session, append_upload_chunk, finalize_upload_session,
+                               cleanup_stale_uploads, get_chunk_path)
+
+DATA = os.urandom(250000)
+CHUNK = 100000
+
+def _start(client, size=len(DATA)):
+    response = client.post('/files/api/uploads', json={'filename': 'holiday.mov', 'size': size,
+                                                       'title': 'Holiday', 'tags': 'trip'})
+    assert response.status_code == 201
+    return response.json['id']
+
+def _patch(client, session_id, offset, data):
+    return client.patch(f'/files/api/uploads/{session_id}', data=data, headers={'Upload-Offset': str(offset)})
+
+def test_upload_in_chunks_and_finalize(app, client):
+    session_id = _start(client)
+    for offset in range(0, len(DATA), CHUNK):
+        response = _patch(client, session_id, offset, DATA[offset:offset + CHUNK])
+        assert response.status_code == 200
+        assert response.headers['Upload-Offset'] == str(min(offset + CHUNK, len(DATA)))
+
+    response = client.post(f'/files/api/uploads/{session_id}/finalize')
+    assert response.json['status'] == 'stored'
+
+    with app.app_context():
+        row = query_db('SELECT filepath, checksum FROM files WHERE id = ?', (response.json['file_id'],), one=True)
+        assert row['checksum'] == hashlib.md5(DATA).hexdigest()
+        with open(row['filepath'], 'rb') as f:
+            assert f.read() == DATA
+        assert query_db('SELECT COUNT(*) as count FROM upload_sessions', one=True)['count'] == 0
+
+def test_offset_conflicts_report_the_server_offset(client):
+    session_id = _start(client)
+    assert _patch(client, session_id, 0, DATA[:CHUNK]).status_code == 200
+
+    replay = _patch(client, session_id, 0, DATA[:CHUNK])
+    assert replay.status_code == 409
+    assert replay.headers['Upload-Offset'] == str(CHUNK)
+
+    ahead = _patch(client, session_id, 2 * CHUNK, DATA[2 * CHUNK:])
+    assert ahead.status_code == 409
+
+    overflow = _patch(client, session_id, CHUNK, DATA[CHUNK:] + b'extra')
+    assert overflow.status_code == 409
+    assert overflow.json['error'] == 'Chunk exceeds declared size'
+
+    assert client.post(f'/files/api/uploads/{session_id}/finalize').status_code == 409
+
+def test_resume_from_reported_offset(client):
+    session_id = _start(client)
+    _patch(client, session_id, 0, DATA[:CHUNK])
+
+    # Client lost track - HEAD/GET tells it where to carry on
+    offset = int(client.get(f'/files/api/uploads/{session_id}').headers['Upload-Offset'])
+    assert offset == CHUNK
+    assert _patch(client, session_id, offset, DATA[offset:]).status_code == 200
+    assert client.post(f'/files/api/uploads/{session_id}/finalize').json['status'] == 'stored'
+
+def test_resume_in_another_worker_rehashes(ctx):
+    session_id = create_upload_session('a.mov', len(DATA))
+    append_upload_chunk(session_id, 0, DATA[:CHUNK])
+    # Another process took the first chunk - this one has no running hash for it
+    util_ingest._upload_hashes.pop(session_id)
+    append_upload_chunk(session_id, CHUNK, DATA[CHUNK:])
+    assert session_id not in util_ingest._upload_hashes
+
+    file_id, status = finalize_upload_session(session_id)
+    assert status == 'stored'
+    assert query_db('SELECT checksum FROM files WHERE id = ?', (file_id,), one=True)['checksum'] == \
+        hashlib.md5(DATA).hexdigest()
+
+def test_concurrent_chunks_at_one_offset(ctx):
+    session_id = create_upload_session('a.mov', len(DATA))
+    results = []
+
+    def put():
+        with ctx.app_context():
+            results.append(append_upload_chunk(session_id, 0, DATA[:CHUNK]))
+
+    threads = [threading.Thread(target=put) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results, key=str) == [(CHUNK, 'Offset mismatch')] * 3 + [(CHUNK, None)]
+    assert util_ingest._upload_hashes[session_id][0] == CHUNK
+
+def test_discarded_session_rejects_chunks(client):
+    session_id = _start(client)
+    assert client.delete(f'/files/api/uploads/{session_id}').status_code == 204
+    assert _patch(client, session_id, 0, DATA[:CHUNK]).status_code == 404
+
+def test_stale_sessions_and_running_hashes_expire(ctx):
+    stale = create_upload_session('old.mov', 10)
+    live = create_upload_session('new.mov', 10)
+    execute_db("UPDATE upload_sessions SET updated_date = datetime('now', '-3 days') WHERE id = ?", (stale,))
+    # Finished by another worker: its row is gone but this process still holds a hash
+    util_ingest._upload_hashes['finished-elsewhere'] = (0, hashlib.md5())
+
+    assert cleanup_stale_uploads() == 1
+    assert not os.path.exists(get_chunk_path(stale))
+    assert sorted(util_ingest._upload_hashes) == [live]
@@ -0,0 +1,74 @@
+"""
+/home/life/tests/test_db_pool.py
+Version: 1.0.0
+Purpose: Pooled SQLite connections - reuse, pragmas, exhaustion and replaced pools
+Created: 2026-10-18
+"""
+
+import time
+import sqlite3
+import threading
+import pytest
+from utils import util_db
+from utils.util_db import get_db, query_db, get_pool_stats, _acquire_connection, _release_connection
+
+def test_connection_reused_across_app_contexts(app):
+    with app.app_context():
+        first = get_db()
+        assert get_db() is first
+    with app.app_context():
+        assert get_db() is first
+        stats = get_pool_stats()
+    assert stats['open'] == 1
+    assert stats['hits'] >= 1
+
+def test_connections_are_pragma_tuned(ctx):
+    assert query_db('PRAGMA journal_mode', one=True)[0] == 'wal'
+    assert query_db('PRAGMA synchronous', one=True)[0] == 1
+    assert query_db('PRAGMA temp_store', one=True)[0] == 2
+
+def test_exhausted_pool_times_out(ctx):
+    ctx.config['DB_POOL_SIZE'] = 1
+    ctx.config['DB_POOL_TIMEOUT'] = 0.1
+    ctx.config['DB_PATH'] = ctx.config['DB_PATH'] + '.small'
+    held = _acquire_connection()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            _acquire_connection()
+        assert get_pool_stats()['timeouts'] == 1
+    finally:
+        _release_connection(held)
+
+def test_waiting_request_gets_released_connection(ctx):
+    ctx.config['DB_POOL_SIZE'] = 1
+    ctx.config['DB_PATH'] = ctx.config['DB_PATH'] + '.small'
+    held = _acquire_connection()
+    
+    def release():
+        with ctx.app_context():
+            time.sleep(0.05)
+            _release_connection(held)
+    
+    threading.Thread(target=release).start()
+    assert _acquire_connection() is held
+    assert get_pool_stats()['waits'] == 1
+    _release_connection(held)
+
+def test_rollback_before_returning_to_pool(ctx):
+    conn = _acquire_connection()
+    conn.execute('BEGIN')
+    conn.execute("INSERT INTO settings (key, value) VALUES ('pool-test', '1')")
+    _release_connection(conn)
+    assert not conn.in_transaction
+    assert query_db("SELECT 1 FROM settings WHERE key = 'pool-test'", one=True) is None
+
+def test_connection_from_replaced_pool_is_closed(app):
+    with app.app_context():
+        conn = get_db()
+        old_pool = util_db._pool
+        assert conn.pool is old_pool
+        app.config['DB_PATH'] = app.config['DB_PATH'] + '.other'
+    assert util_db._pool is not old_pool
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+    assert util_db._pool['idle'].qsize() == 0
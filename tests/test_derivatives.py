@@ -0,0 +1,105 @@
+"""
+/home/life/tests/test_derivatives.py
+Version: 1.0.0
+Purpose: Derivative cache - thumbnail route, conditional requests, running total and LRU eviction
+Created: 2026-10-18
+"""
+
+import os
+from PIL import Image
+from utils.util_db import query_db, execute_db, transaction
+from utils.util_derivatives import (get_derivative_path, register_derivatives, drop_derivatives,
+                                    remove_derivative_files, get_cache_total, check_derivative_budget)
+
+def _photo(ctx, make_file, name='photo.jpg'):
+    path = os.path.join(ctx.config['DATA_DIR'], name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new('RGB', (1200, 900), 'orange').save(path, 'JPEG')
+    return make_file(name, filetype='image/jpeg', filepath=path)
+
+def _checksum(file_id):
+    return query_db('SELECT checksum FROM files WHERE id = ?', (file_id,), one=True)['checksum']
+
+def _cached(ctx, checksum, size_name, size):
+    """Write a fake derivative of size bytes and register it"""
+    path = get_derivative_path(checksum, size_name, 'jpeg')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    with transaction():
+        register_derivatives(checksum, [(path, size)])
+    return path
+
+def test_thumbnail_rendered_once_then_revalidated(ctx, make_file, client):
+    file_id = _photo(ctx, make_file)
+    checksum = _checksum(file_id)
+
+    response = client.get(f'/files/thumb/{file_id}/thumb?format=jpeg')
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+    assert response.headers['ETag'] == f'"{checksum}-thumb-jpeg"'
+    assert 'private' in response.headers['Cache-Control']
+    path = get_derivative_path(checksum, 'thumb', 'jpeg')
+    assert max(Image.open(path).size) == 200
+    assert query_db('SELECT bytes FROM derivative_cache WHERE path = ?', (path,), one=True)['bytes'] == \
+        os.path.getsize(path)
+
+    again = client.get(f'/files/thumb/{file_id}/thumb?format=jpeg',
+                       headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+def test_thumbnail_format_follows_accept(ctx, make_file, client):
+    file_id = _photo(ctx, make_file)
+    response = client.get(f'/files/thumb/{file_id}/medium', headers={'Accept': 'image/webp,*/*'})
+    assert response.mimetype in ('image/webp', 'image/jpeg')
+    assert 'Accept' in response.headers['Vary']
+    assert client.get(f'/files/thumb/{file_id}/medium', headers={'Accept': 'image/jpeg'}).mimetype == 'image/jpeg'
+
+def test_thumbnail_not_found(ctx, make_file, client):
+    photo = _photo(ctx, make_file)
+    note = make_file('note.txt')
+    assert client.get(f'/files/thumb/{photo}/huge').status_code == 404
+    assert client.get(f'/files/thumb/{note}/thumb').status_code == 404
+    execute_db('UPDATE files SET deleted = 1 WHERE id = ?', (photo,))
+    assert client.get(f'/files/thumb/{photo}/thumb').status_code == 404
+
+def test_running_total_tracks_registrations(ctx):
+    assert get_cache_total() == 0
+    _cached(ctx, 'a' * 32, 'thumb', 300)
+    _cached(ctx, 'b' * 32, 'thumb', 200)
+    assert get_cache_total() == 500
+
+    # Another process's render is picked up at the next recount
+    execute_db("INSERT INTO derivative_cache (path, checksum, bytes) VALUES ('/elsewhere', 'c', 1000)")
+    assert get_cache_total() == 500
+    ctx.config['DERIVATIVE_RECOUNT_EVERY'] = 2
+    assert get_cache_total() == 1500
+
+def test_budget_evicts_least_recently_used(ctx):
+    ctx.config['DERIVATIVE_CACHE_MAX_MB'] = 1000 / (1024 * 1024)
+    oldest = _cached(ctx, 'a' * 32, 'thumb', 100)
+    kept = _cached(ctx, 'b' * 32, 'thumb', 400)
+    newest = _cached(ctx, 'c' * 32, 'thumb', 600)
+    execute_db("UPDATE derivative_cache SET last_access = datetime('now', '-1 day') WHERE path IN (?, ?)",
+               (oldest, kept))
+
+    # 1100 bytes against a 1000 byte budget - evicted down to 900, passing over keep
+    assert check_derivative_budget(keep={kept}) == 2
+    assert not os.path.exists(oldest) and not os.path.exists(newest)
+    assert os.path.exists(kept)
+    assert [row['path'] for row in query_db('SELECT path FROM derivative_cache')] == [kept]
+    assert get_cache_total() == 400
+    assert check_derivative_budget() == 0
+
+def test_dropped_derivatives_removed_after_commit(ctx):
+    thumb = _cached(ctx, 'a' * 32, 'thumb', 100)
+    medium = _cached(ctx, 'a' * 32, 'medium', 100)
+
+    with transaction():
+        stale = drop_derivatives('a' * 32, keep={medium})
+        assert stale == [thumb]
+        # Still on disk until the caller has committed
+        assert os.path.exists(thumb)
+    remove_derivative_files(stale + ['/no/such/derivative'])
+
+    assert not os.path.exists(thumb) and os.path.exists(medium)
+    assert [row['path'] for row in query_db('SELECT path FROM derivative_cache')] == [medium]
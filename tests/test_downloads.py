@@ -0,0 +1,74 @@
+"""
+/home/life/tests/test_downloads.py
+Version: 1.0.0
+Purpose: Downloads - checksum ETags, conditional and range requests, X-Accel-Redirect offload
+Created: 2026-10-18
+"""
+
+import os
+
+DATA = bytes(range(256)) * 40
+
+def _stored(ctx, make_file, name='report.pdf'):
+    path = os.path.join(ctx.config['DATA_DIR'], 'documents', name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(DATA)
+    return make_file(name, filetype='application/pdf', filepath=path)
+
+def test_download_has_checksum_etag(ctx, make_file, client):
+    file_id = _stored(ctx, make_file)
+    response = client.get(f'/files/download/{file_id}')
+    assert response.status_code == 200 and response.data == DATA
+    assert response.headers['ETag'] == f'"{file_id:032x}"'
+    assert 'attachment' in response.headers['Content-Disposition']
+    assert {'private', 'no-cache'} <= {part.strip() for part in response.headers['Cache-Control'].split(',')}
+
+def test_revalidation_returns_304(ctx, make_file, client):
+    file_id = _stored(ctx, make_file)
+    etag = client.get(f'/files/download/{file_id}').headers['ETag']
+    response = client.get(f'/files/download/{file_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+    assert client.get(f'/files/download/{file_id}', headers={'If-None-Match': '"other"'}).status_code == 200
+
+def test_range_requests(ctx, make_file, client):
+    file_id = _stored(ctx, make_file)
+    response = client.get(f'/files/download/{file_id}', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == DATA[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(DATA)}'
+
+    tail = client.get(f'/files/download/{file_id}', headers={'Range': 'bytes=-10'})
+    assert tail.status_code == 206 and tail.data == DATA[-10:]
+
+    past_end = client.get(f'/files/download/{file_id}', headers={'Range': f'bytes={len(DATA)}-'})
+    assert past_end.status_code == 416
+
+def test_stale_if_range_sends_whole_file(ctx, make_file, client):
+    file_id = _stored(ctx, make_file)
+    etag = client.get(f'/files/download/{file_id}').headers['ETag']
+    fresh = client.get(f'/files/download/{file_id}', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert fresh.status_code == 206
+    stale = client.get(f'/files/download/{file_id}', headers={'Range': 'bytes=0-9', 'If-Range': '"changed"'})
+    assert stale.status_code == 200 and stale.data == DATA
+
+def test_accel_redirect_hands_off_to_nginx(ctx, make_file, client):
+    ctx.config['DOWNLOAD_ACCEL_REDIRECT'] = '/protected/'
+    file_id = _stored(ctx, make_file, 'annual report.pdf')
+    response = client.get(f'/files/download/{file_id}')
+    assert response.headers['X-Accel-Redirect'] == '/protected/documents/annual%20report.pdf'
+    assert response.data == b''
+    assert response.headers['ETag'] == f'"{file_id:032x}"'
+
+    # Files outside DATA_DIR cannot be served by the internal location
+    outside = os.path.join(os.path.dirname(ctx.config['DATA_DIR']), 'elsewhere.pdf')
+    with open(outside, 'wb') as f:
+        f.write(DATA)
+    other = make_file('elsewhere.pdf', filetype='application/pdf', filepath=outside)
+    response = client.get(f'/files/download/{other}')
+    assert 'X-Accel-Redirect' not in response.headers and response.data == DATA
+
+def test_missing_file_redirects_to_browse(ctx, make_file, client):
+    file_id = make_file('gone.pdf', filepath='/no/such/file.pdf')
+    assert client.get(f'/files/download/{file_id}').status_code == 302
+    assert client.get('/files/download/9999').status_code == 302
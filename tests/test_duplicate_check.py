@@ -0,0 +1,42 @@
+"""
+/home/life/tests/test_duplicate_check.py
+Version: 1.0.0
+Purpose: Hash-first duplicate handshake - known checksums are never uploaded again
+Created: 2026-10-18
+"""
+
+from utils.util_db import execute_db
+
+def _set_checksums(file_id, checksum, size=1024, deleted=0):
+    execute_db('UPDATE files SET checksum = ?, size = ?, deleted = ? WHERE id = ?', (checksum, size, deleted, file_id))
+
+def _existing(client, files):
+    response = client.post('/files/api/check-duplicates', json={'files': files})
+    assert response.status_code == 200
+    return response.json['existing']
+
+def test_known_checksums_reported(client, make_file):
+    _set_checksums(make_file('a.txt'), 'a' * 32, size=10)
+    _set_checksums(make_file('d.txt'), 'd' * 32, size=10, deleted=1)
+
+    assert _existing(client, [
+        {'checksum': 'A' * 32, 'size': 10},    # stored bytes, same size
+        {'checksum': 'd' * 32, 'size': 10},    # only in the deleted files
+        {'checksum': 'e' * 32, 'size': 10},    # never seen
+    ]) == ['a' * 32]
+
+def test_size_mismatch_is_not_a_duplicate(client, make_file):
+    _set_checksums(make_file('a.txt'), 'a' * 32, size=10)
+    assert _existing(client, [{'checksum': 'a' * 32, 'size': 11}]) == []
+    assert _existing(client, [{'checksum': 'a' * 32}]) == ['a' * 32]
+
+def test_malformed_entries_ignored(client, make_file):
+    _set_checksums(make_file('a.txt'), 'a' * 32)
+    assert _existing(client, ['a' * 32, {'checksum': "' OR 1=1 --"}, {'size': 3}]) == []
+    assert client.post('/files/api/check-duplicates', data='not json').json == {'existing': []}
+
+def test_chunked_upload_of_known_file_is_skipped(client, make_file):
+    file_id = make_file('movie.mov', filetype='video/quicktime')
+    _set_checksums(file_id, 'f' * 32)
+    response = client.post('/files/api/uploads', json={'filename': 'copy.mov', 'size': 1024, 'checksum': 'f' * 32})
+    assert response.json == {'status': 'duplicate', 'file_id': file_id}
@@ -0,0 +1,43 @@
+"""
+/home/life/tests/test_file_tags.py
+Version: 1.0.0
+Purpose: Batched tag hydration for browse and search pages
+Created: 2026-10-18
+"""
+
+from utils.util_db import query_db, get_query_stats, attach_file_tags
+
+def test_tags_attached_to_every_row(make_file):
+    tagged = make_file('a.txt', tags='tax, 2024')
+    untagged = make_file('b.txt')
+    rows = query_db('SELECT id, filename FROM files ORDER BY id')
+
+    files = attach_file_tags(rows)
+    assert [f['filename'] for f in files] == ['a.txt', 'b.txt']
+    assert sorted(files[0]['tags']) == ['2024', 'tax']
+    assert files[1]['tags'] == []
+    assert [f['id'] for f in files] == [tagged, untagged]
+
+def test_one_tag_query_per_page(make_file):
+    for i in range(30):
+        make_file(f'{i}.txt', tags=f'tag{i}, shared')
+
+    rows = query_db('SELECT id FROM files')
+    before = get_query_stats()['count']
+    attach_file_tags(rows)
+    assert get_query_stats()['count'] == before + 1
+
+def test_large_pages_are_chunked(make_file):
+    for i in range(501):
+        make_file(f'{i}.txt', tags='bulk')
+    files = attach_file_tags(query_db('SELECT id FROM files'))
+    assert len(files) == 501
+    assert all(f['tags'] == ['bulk'] for f in files)
+
+def test_empty_page():
+    assert attach_file_tags([]) == []
+
+def test_browse_and_search_show_tags(client, make_file):
+    make_file('lease.pdf', tags='apartment')
+    assert b'apartment' in client.get('/files/browse').data
+    assert b'apartment' in client.get('/files/search?q=lease').data
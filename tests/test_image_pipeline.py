@@ -0,0 +1,108 @@
+"""
+/home/life/tests/test_image_pipeline.py
+Version: 1.0.0
+Purpose: Single-decode image pipeline - derivatives, metadata, draft decode, timings and atomic writes
+Created: 2026-10-18
+"""
+
+import os
+import hashlib
+import pytest
+from PIL import Image
+from utils.util_image import run_image_pipeline, compute_dhash, get_image_metadata, save_derivative
+
+def _photo(tmp_path, name='photo.jpg', size=(2000, 1500)):
+    path = str(tmp_path / name)
+    img = Image.new('RGB', size)
+    # A gradient so the hash and the resampling have something to work on
+    img.putdata([(x * 255 // size[0], y * 255 // size[1], 128) for y in range(size[1]) for x in range(size[0])])
+    img.save(path, 'JPEG', quality=90)
+    return path
+
+def _md5(path):
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+def test_every_output_from_one_decode(tmp_path):
+    path = _photo(tmp_path)
+    before = _md5(path)
+    small = str(tmp_path / 'cache' / 'small.jpg')
+    large = str(tmp_path / 'cache' / 'large.webp')
+
+    # Listed smallest first - rendered largest first regardless
+    result = run_image_pipeline(path, [(small, 200, 'JPEG', 80), (large, 800, 'WEBP', 80)], image_hash=True)
+    assert result['error'] is None
+    assert [derivative for derivative, _ in result['derivatives']] == [large, small]
+    assert all(size == os.path.getsize(derivative) for derivative, size in result['derivatives'])
+    assert Image.open(large).size == (800, 600)
+    assert Image.open(small).size == (200, 150)
+
+    # Metadata is the original's, not the draft-decoded size
+    assert (result['metadata']['width'], result['metadata']['height']) == (2000, 1500)
+    assert set(result['timings']) == {'open', 'decode', 'hash', 'render'}
+    assert isinstance(result['image_hash'], int)
+    assert _md5(path) == before
+
+def test_jpeg_decoded_at_reduced_scale(tmp_path, monkeypatch):
+    path = _photo(tmp_path)
+    decoded = []
+    original_load = Image.Image.load
+
+    def load(img):
+        pixels = original_load(img)
+        decoded.append(img.size)
+        return pixels
+
+    monkeypatch.setattr(Image.Image, 'load', load)
+    run_image_pipeline(path, [(str(tmp_path / 'thumb.jpg'), 200, 'JPEG', 80)])
+    # Draft picks the smallest 1/2, 1/4, 1/8 scale that still covers 200px
+    assert decoded[0] == (250, 188)
+
+def test_header_only_when_nothing_requested(tmp_path):
+    result = run_image_pipeline(_photo(tmp_path), [])
+    assert result['derivatives'] == [] and result['image_hash'] is None
+    assert set(result['timings']) == {'open'}
+    assert result['metadata']['format'] == 'JPEG'
+
+def test_errors_are_returned_not_raised(tmp_path):
+    missing = run_image_pipeline(str(tmp_path / 'missing.jpg'), [], image_hash=True)
+    assert missing['error'] and missing['derivatives'] == []
+
+    broken = tmp_path / 'broken.jpg'
+    broken.write_bytes(b'not an image')
+    assert run_image_pipeline(str(broken), [])['error']
+
+def test_hash_is_orientation_independent(tmp_path):
+    upright = Image.open(_photo(tmp_path, size=(400, 300)))
+    upright.load()
+
+    # The same picture stored rotated, with EXIF saying how to show it upright
+    stored = upright.transpose(Image.Transpose.ROTATE_90)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    path = str(tmp_path / 'rotated.jpg')
+    stored.save(path, 'JPEG', quality=90, exif=exif.tobytes())
+
+    rotated = Image.open(path)
+    rotated.load()
+    assert bin(compute_dhash(upright) ^ compute_dhash(rotated)).count('1') <= 4
+    assert -(1 << 63) <= compute_dhash(rotated) < 1 << 63
+
+def test_metadata_from_header(ctx, tmp_path):
+    metadata = get_image_metadata(_photo(tmp_path, size=(64, 48)))
+    assert (metadata['width'], metadata['height'], metadata['mode']) == (64, 48, 'RGB')
+    assert get_image_metadata(str(tmp_path / 'missing.jpg')) == {}
+
+def test_derivative_written_atomically(tmp_path):
+    path = str(tmp_path / 'cache' / 'thumb.jpg')
+    img = Image.new('RGBA', (40, 20), 'red')
+    assert save_derivative(img, path, 'JPEG', 80) == os.path.getsize(path)
+    # Converted for JPEG, readable by the web server, no temp files left beside it
+    assert Image.open(path).mode == 'RGB'
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    assert os.listdir(tmp_path / 'cache') == ['thumb.jpg']
+
+    # A failed save leaves neither a partial file nor its temp file
+    with pytest.raises(KeyError):
+        save_derivative(img, str(tmp_path / 'cache' / 'bad.xyz'), 'NOSUCHFORMAT', 80)
+    assert os.listdir(tmp_path / 'cache') == ['thumb.jpg']
@@ -0,0 +1,137 @@
+"""
+/home/life/tests/test_import.py
+Version: 1.0.0
+Purpose: Bulk import - tree scan, dedupe, batched inserts, checkpoint resume and dry runs
+Created: 2026-10-18
+"""
+
+import os
+import pytest
+from utils.util_db import query_db, execute_db
+from utils.util_import import import_tree, scan_tree, load_checkpoint, append_checkpoint, get_checkpoint_path
+
+def _tree(root, files):
+    for name, data in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(data)
+    return str(root)
+
+FILES = {
+    'notes/a.txt': 'alpha',
+    'notes/b.txt': 'bravo',
+    'notes/copy of a.txt': 'alpha',
+    'old/invoice.pdf': 'invoice text',
+    'old/deep/c.txt': 'charlie',
+    'old/.hidden.txt': 'hidden',
+    '.cache/d.txt': 'delta',
+    'old/programme.exe': 'not allowed',
+}
+
+def _imported():
+    return sorted(row['filename'] for row in query_db('SELECT filename FROM files'))
+
+def _staging_empty(ctx):
+    staging = os.path.join(ctx.config['DATA_DIR'], '.staging')
+    return not os.path.isdir(staging) or not os.listdir(staging)
+
+def test_scan_skips_hidden_and_disallowed(ctx, tmp_path):
+    root = _tree(tmp_path / 'src', FILES)
+    found = [os.path.relpath(path, root) for path in scan_tree(root)]
+    assert sorted(found) == ['notes/a.txt', 'notes/b.txt', 'notes/copy of a.txt', 'old/deep/c.txt', 'old/invoice.pdf']
+    # Directories are visited in name order, each one's files before its subdirectories
+    assert [os.path.dirname(path) for path in found] == ['notes'] * 3 + ['old', 'old/deep']
+
+def test_import_dedupes_and_queues_jobs(ctx, tmp_path):
+    ctx.config['IMPORT_BATCH_SIZE'] = 2
+    root = _tree(tmp_path / 'src', FILES)
+    checkpoint = str(tmp_path / 'checkpoint.txt')
+
+    counts = import_tree(root, tags='family, scans', checkpoint=checkpoint)
+    assert {key: counts[key] for key in ('scanned', 'skipped', 'imported', 'duplicates', 'failed')} == \
+        {'scanned': 5, 'skipped': 0, 'imported': 4, 'duplicates': 1, 'failed': 0}
+    # Whichever copy of 'alpha' came first is kept
+    assert _imported() in (['a.txt', 'b.txt', 'c.txt', 'invoice.pdf'], ['b.txt', 'c.txt', 'copy of a.txt', 'invoice.pdf'])
+
+    row = query_db("SELECT f.filepath, m.auto_category FROM files f "
+                   "JOIN metadata m ON m.file_id = f.id WHERE f.filename = 'invoice.pdf'", one=True)
+    assert row['filepath'].startswith(os.path.join(ctx.config['DATA_DIR'], row['auto_category']))
+    assert query_db('SELECT COUNT(*) FROM file_tags', one=True)[0] == 8
+    assert query_db("SELECT COUNT(*) FROM jobs WHERE job_type = 'extract_text'", one=True)[0] == 4
+    assert len(load_checkpoint(checkpoint)) == 5
+    assert _staging_empty(ctx)
+
+def test_files_already_archived_are_skipped(ctx, make_file, tmp_path):
+    root = _tree(tmp_path / 'src', {'a.txt': 'alpha', 'b.txt': 'bravo'})
+    file_id = make_file('earlier.txt')
+    execute_db('UPDATE files SET checksum = ? WHERE id = ?', ('2c1743a391305fbf367df8e4f069f9f9', file_id))
+
+    counts = import_tree(root)
+    assert (counts['imported'], counts['duplicates']) == (1, 1)
+    assert _imported() == ['b.txt', 'earlier.txt']
+
+def test_deleted_files_count_as_duplicates(ctx, make_file, tmp_path):
+    ctx.config['IMPORT_BATCH_SIZE'] = 10
+    root = _tree(tmp_path / 'src', {'a.txt': 'alpha', 'b.txt': 'bravo', 'c.txt': 'charlie'})
+    file_id = make_file('binned.txt')
+    # checksum is unique across deleted rows too - inserting 'alpha' again would fail the whole batch
+    execute_db('UPDATE files SET checksum = ?, deleted = 1 WHERE id = ?', ('2c1743a391305fbf367df8e4f069f9f9', file_id))
+    checkpoint = str(tmp_path / 'checkpoint.txt')
+
+    counts = import_tree(root, checkpoint=checkpoint)
+    assert (counts['imported'], counts['duplicates'], counts['restorable'], counts['failed']) == (2, 1, 1, 0)
+    assert _imported() == ['b.txt', 'binned.txt', 'c.txt']
+    assert len(load_checkpoint(checkpoint)) == 3
+
+def test_interrupted_import_resumes_from_checkpoint(ctx, tmp_path):
+    ctx.config['IMPORT_BATCH_SIZE'] = 2
+    root = _tree(tmp_path / 'src', {f'{i:02}.txt': f'file {i}' for i in range(7)})
+    checkpoint = str(tmp_path / 'checkpoint.txt')
+
+    def stop(counts):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        import_tree(root, checkpoint=checkpoint, progress=stop)
+    first = _imported()
+    assert len(first) == 2
+    assert sorted(os.path.basename(source) for source in load_checkpoint(checkpoint)) == first
+    # The batch hashing ahead was staged and then dropped
+    assert _staging_empty(ctx)
+
+    counts = import_tree(root, checkpoint=checkpoint)
+    assert (counts['scanned'], counts['skipped'], counts['imported'], counts['duplicates']) == (7, 2, 5, 0)
+    assert _imported() == [f'{i:02}.txt' for i in range(7)]
+
+def test_dry_run_stores_nothing(ctx, tmp_path):
+    root = _tree(tmp_path / 'src', FILES)
+    counts = import_tree(root, dry_run=True)
+    assert (counts['imported'], counts['duplicates'], counts['bytes']) == (4, 1, 29)
+    assert sum(counts['categories'].values()) == 4
+    assert _imported() == []
+    assert _staging_empty(ctx)
+
+def test_link_mode_shares_the_source_inode(ctx, tmp_path):
+    root = _tree(tmp_path / 'src', {'a.txt': 'alpha'})
+    import_tree(root, link=True)
+    stored = query_db('SELECT filepath FROM files', one=True)['filepath']
+    assert os.path.samefile(stored, os.path.join(root, 'a.txt'))
+
+def test_checkpoint_round_trip(ctx, tmp_path):
+    path = str(tmp_path / 'sub' / 'checkpoint.txt')
+    assert load_checkpoint(path) == set()
+    append_checkpoint(path, ['/a', '/b\udcff'])
+    append_checkpoint(path, [])
+    assert load_checkpoint(path) == {'/a', '/b\udcff'}
+    assert get_checkpoint_path('/some/tree') == get_checkpoint_path('/some/tree/')
+    assert get_checkpoint_path('/some/tree').startswith(os.path.join(ctx.config['DATA_DIR'], '.imports'))
+
+def test_import_files_command(ctx, tmp_path):
+    root = _tree(tmp_path / 'src', {'a.txt': 'alpha', 'b.txt': 'alpha'})
+    runner = ctx.test_cli_runner()
+    result = runner.invoke(args=['import-files', root, '--tags', 'old'])
+    assert result.output.splitlines()[-1] == 'Imported 1 files (1 duplicates, 0 failed)'
+    # Rerun resumes from the default checkpoint - nothing left to do
+    result = runner.invoke(args=['import-files', root])
+    assert result.output.splitlines()[-1] == 'Imported 0 files (0 duplicates, 0 failed)'
@@ -0,0 +1,116 @@
+"""
+/home/life/tests/test_jobs.py
+Version: 1.0.0
+Purpose: Durable job queue - claiming, retry with exponential backoff, failure and stale recovery
+Created: 2026-10-18
+"""
+
+import pytest
+from utils import util_jobs
+from utils.util_db import query_db, execute_db
+from utils.util_jobs import (enqueue_job, claim_jobs, claim_job, run_job, requeue_stale_jobs,
+                             retry_failed_jobs, work_jobs, enqueue_file_jobs)
+
+@pytest.fixture
+def handler(monkeypatch):
+    """A 'test' job type whose handler fails while calls['fail'] is set"""
+    calls = {'files': [], 'fail': False}
+
+    def job_test(file_id):
+        calls['files'].append(file_id)
+        if calls['fail']:
+            raise RuntimeError('handler failed')
+
+    monkeypatch.setitem(util_jobs.JOB_HANDLERS, 'test', job_test)
+    return calls
+
+def _job(job_id):
+    return query_db('''
+        SELECT status, attempts, last_error,
+               CAST(strftime('%s', run_after) AS INTEGER) - CAST(strftime('%s', 'now') AS INTEGER) as wait
+        FROM jobs WHERE id = ?
+    ''', (job_id,), one=True)
+
+def _status(file_id):
+    return query_db('SELECT processing_status FROM files WHERE id = ?', (file_id,), one=True)['processing_status']
+
+def test_enqueue_marks_file_pending_and_success_ready(ctx, make_file, handler):
+    file_id = make_file('a.txt')
+    job_id = enqueue_job('test', file_id)
+    assert _status(file_id) == 'pending'
+
+    job = claim_job()
+    assert job['id'] == job_id and job['attempts'] == 1
+    assert _job(job_id)['status'] == 'running'
+    assert claim_job() is None
+
+    run_job(job)
+    assert handler['files'] == [file_id]
+    assert _job(job_id)['status'] == 'done'
+    assert _status(file_id) == 'ready'
+
+def test_failures_back_off_exponentially_then_fail(ctx, make_file, handler):
+    ctx.config['JOB_RETRY_DELAY'] = 30
+    handler['fail'] = True
+    file_id = make_file('a.txt')
+    job_id = enqueue_job('test', file_id)
+
+    for attempt, delay in ((1, 30), (2, 60)):
+        run_job(claim_job())
+        job = _job(job_id)
+        assert (job['status'], job['attempts'], job['last_error']) == ('pending', attempt, 'handler failed')
+        assert delay - 2 <= job['wait'] <= delay
+        # Not runnable until the backoff has passed
+        assert claim_job() is None
+        execute_db("UPDATE jobs SET run_after = datetime('now', '-1 second') WHERE id = ?", (job_id,))
+
+    run_job(claim_job())
+    assert _job(job_id)['status'] == 'failed'
+    assert _status(file_id) == 'failed'
+
+    assert retry_failed_jobs() == 1
+    assert (_job(job_id)['status'], _job(job_id)['attempts']) == ('pending', 0)
+    assert _status(file_id) == 'pending'
+
+def test_unknown_job_type_is_retried_not_lost(ctx):
+    job_id = enqueue_job('no_such_job')
+    run_job(claim_job())
+    assert _job(job_id)['last_error'] == 'Unknown job type: no_such_job'
+
+def test_claim_jobs_takes_oldest_of_one_type(ctx):
+    first = enqueue_job('test')
+    enqueue_job('other')
+    second = enqueue_job('test')
+    enqueue_job('test', delay=3600)
+    assert [job['id'] for job in claim_jobs(5, 'test')] == [first, second]
+
+def test_stale_running_jobs_requeued_or_failed(ctx, make_file):
+    retryable = make_file('a.txt')
+    exhausted = make_file('b.txt')
+    retry_id = enqueue_job('test', retryable)
+    fail_id = enqueue_job('test', exhausted)
+    claim_jobs(2)
+    execute_db("UPDATE jobs SET started_date = datetime('now', '-1 hour')")
+    execute_db('UPDATE jobs SET attempts = max_attempts WHERE id = ?', (fail_id,))
+
+    requeue_stale_jobs()
+    assert (_job(retry_id)['status'], _job(retry_id)['last_error']) == ('pending', 'Worker timed out')
+    assert _job(fail_id)['status'] == 'failed'
+    assert _status(retryable) == 'pending'
+    assert _status(exhausted) == 'failed'
+
+def test_work_jobs_drains_the_queue(app, handler):
+    with app.app_context():
+        for _ in range(3):
+            enqueue_job('test')
+    assert work_jobs(app, drain=True) == 3
+    with app.app_context():
+        assert query_db("SELECT COUNT(*) as count FROM jobs WHERE status = 'done'", one=True)['count'] == 3
+
+def test_uploaded_files_get_their_jobs(ctx, make_file):
+    photo = make_file('a.jpg', filetype='image/jpeg')
+    note = make_file('b.txt')
+    assert enqueue_file_jobs(photo, '/x/a.jpg') == 1
+    assert enqueue_file_jobs(note, '/x/b.txt') == 1
+    assert [tuple(row) for row in query_db('SELECT job_type, file_id FROM jobs ORDER BY id')] == \
+        [('process_image', photo), ('extract_text', note)]
@@ -0,0 +1,59 @@
+"""
+/home/life/tests/test_migrations.py
+Version: 1.0.0
+Purpose: Versioned schema migrations - applied once, in order, and rolled back on failure
+Created: 2026-10-18
+"""
+
+import sqlite3
+import pytest
+from contextlib import closing
+from utils import util_migrations
+from utils.util_migrations import MIGRATIONS, get_schema_version, run_migrations, _split_sql
+
+def _tables(db):
+    return {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+def test_fresh_database_is_fully_migrated(ctx):
+    with closing(sqlite3.connect(ctx.config['DB_PATH'])) as db:
+        assert get_schema_version(db) == MIGRATIONS[-1][0]
+        versions = [row[0] for row in db.execute('SELECT version FROM schema_version ORDER BY version')]
+        assert versions == [version for version, _, _ in MIGRATIONS]
+        assert {'files', 'metadata', 'jobs', 'files_fts', 'derivative_cache'} <= _tables(db)
+
+def test_current_schema_is_left_alone(ctx):
+    with closing(sqlite3.connect(ctx.config['DB_PATH'])) as db:
+        assert run_migrations(db) == MIGRATIONS[-1][0]
+        assert db.execute('SELECT COUNT(*) FROM schema_version').fetchone()[0] == len(MIGRATIONS)
+
+def test_failed_migration_rolls_back(ctx, monkeypatch):
+    def migration_broken(db):
+        for statement in _split_sql('''
+            CREATE TABLE half_done (id INTEGER PRIMARY KEY);
+            CREATE TRIGGER half_done_ai AFTER INSERT ON half_done BEGIN
+                UPDATE half_done SET id = id;
+            END;
+            INSERT INTO half_done (id) VALUES (1);
+        '''):
+            db.execute(statement)
+        raise RuntimeError('migration failed')
+
+    latest = MIGRATIONS[-1][0]
+    monkeypatch.setattr(util_migrations, 'MIGRATIONS', MIGRATIONS + [(latest + 1, 'Broken', migration_broken)])
+
+    with closing(sqlite3.connect(ctx.config['DB_PATH'])) as db:
+        with pytest.raises(RuntimeError):
+            run_migrations(db)
+        assert get_schema_version(db) == latest
+        assert 'half_done' not in _tables(db)
+
+def test_split_sql_keeps_trigger_bodies_whole():
+    statements = list(_split_sql('''
+        CREATE TABLE a (v TEXT DEFAULT 'x;y');
+        CREATE TRIGGER a_ai AFTER INSERT ON a BEGIN
+            INSERT INTO a (v) VALUES ('one;');
+            SELECT 1;
+        END;
+    '''))
+    assert len(statements) == 2
+    assert statements[1].startswith('CREATE TRIGGER') and statements[1].endswith('END;')
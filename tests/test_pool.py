@@ -0,0 +1,95 @@
+"""
+/home/life/tests/test_pool.py
+Version: 1.0.0
+Purpose: Shared process pools - start method, ordering, timeouts, crashed workers and resizing
+Created: 2026-10-18
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+from PIL import Image
+from utils import util_pool
+from utils.util_pool import get_pool_context, map_in_pool
+from utils.util_image import process_images_parallel
+
+def work(value):
+    """Pool task: 'hang' sleeps past any test timeout, 'crash' kills its worker, 'raise' raises"""
+    if value == 'hang':
+        time.sleep(30)
+    if value == 'crash':
+        os._exit(1)
+    if value == 'raise':
+        raise ValueError('bad input')
+    return value, os.getpid()
+
+def failed(task, error):
+    return task[0], error
+
+def test_pools_do_not_fork(ctx):
+    expected = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    assert get_pool_context().get_start_method() == expected
+    ctx.config['POOL_START_METHOD'] = 'no-such-method'
+    assert get_pool_context().get_start_method() == 'spawn'
+
+def test_inline_when_no_workers(ctx):
+    assert map_in_pool('test', 0, work, [('a',), ('b',)], 5, failed) == [('a', os.getpid()), ('b', os.getpid())]
+
+def test_results_in_task_order(ctx):
+    results = map_in_pool('test', 2, work, [(str(i),) for i in range(6)], 10, failed)
+    assert [value for value, _ in results] == [str(i) for i in range(6)]
+    assert os.getpid() not in {pid for _, pid in results}
+
+def test_stuck_batch_does_not_kill_another_batchs_work(ctx):
+    # Warm the pool so both batches share it
+    map_in_pool('test', 2, work, [('warm',)], 10, failed)
+    results = {}
+
+    def batch(name, tasks, timeout):
+        with ctx.app_context():
+            results[name] = map_in_pool('test', 2, work, tasks, timeout, failed)
+
+    threads = [threading.Thread(target=batch, args=('stuck', [('hang',)], 1)),
+               threading.Thread(target=batch, args=('other', [(str(i),) for i in range(4)], 10))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results['stuck'] == [('hang', 'Timed out after 1s')]
+    assert [value for value, _ in results['other']] == ['0', '1', '2', '3']
+    # The retired pool is torn down once both batches are out of it
+    assert not util_pool._in_use and not util_pool._retired
+
+def test_crashed_worker_gets_a_fresh_pool(ctx):
+    crashed = map_in_pool('test', 2, work, [('crash',)], 10, failed)
+    assert crashed[0][1].startswith('Worker failed')
+    assert not util_pool._in_use
+    assert map_in_pool('test', 2, work, [('again',)], 10, failed)[0][0] == 'again'
+
+def test_task_exception_keeps_the_pool(ctx):
+    results = map_in_pool('test', 2, work, [('raise',), ('fine',)], 10, failed)
+    assert results[0] == ('raise', 'Task failed: bad input') and results[1][0] == 'fine'
+    executor = util_pool._pools['test']['executor']
+    map_in_pool('test', 2, work, [('again',)], 10, failed)
+    assert util_pool._pools['test']['executor'] is executor
+
+def test_resized_pool_is_shut_down(ctx):
+    map_in_pool('test', 2, work, [('two',)], 10, failed)
+    old = util_pool._pools['test']['executor']
+    assert map_in_pool('test', 3, work, [('three',)], 10, failed)[0][0] == 'three'
+    assert util_pool._pools['test']['executor'] is not old
+    assert old._shutdown_thread
+    assert not util_pool._in_use and not util_pool._retired
+
+def test_image_batches_run_in_the_pool(ctx, tmp_path):
+    ctx.config['IMAGE_PROCESS_WORKERS'] = 2
+    path = str(tmp_path / 'photo.jpg')
+    Image.new('RGB', (640, 480), 'green').save(path)
+    missing = str(tmp_path / 'missing.jpg')
+
+    photo, gone = process_images_parallel([(path, [], True), (missing, [], True)])
+    assert photo['error'] is None and photo['metadata']['width'] == 640
+    assert photo['image_hash'] is not None
+    assert gone['source'] == missing and gone['error']
@@ -0,0 +1,46 @@
+"""
+/home/life/tests/test_query_stats.py
+Version: 1.0.0
+Purpose: Per-request query instrumentation and the repeated-statement (N+1) warning
+Created: 2026-10-18
+"""
+
+import logging
+from flask import g
+from utils.util_db import query_db, execute_db, get_query_stats, report_query_stats, _normalize_query
+
+def test_literals_normalised_so_repeats_group():
+    assert _normalize_query("SELECT * FROM files WHERE id = 12") == \
+        _normalize_query("SELECT *  FROM files\n WHERE id = 7")
+    assert _normalize_query("SELECT 'it''s'") == 'SELECT ?'
+
+def test_statements_counted_per_request(app):
+    with app.test_request_context('/files/browse'):
+        for file_id in range(3):
+            query_db('SELECT * FROM files WHERE id = ?', (file_id,))
+        execute_db("INSERT INTO settings (key, value) VALUES ('stats-test', '1')")
+
+        stats = get_query_stats()
+        assert stats['count'] == 4
+        assert stats['statements']['SELECT * FROM files WHERE id = ?'] == 3
+        assert stats['rows'] == 1
+        assert len(stats['slowest']) == 4
+
+def test_repeated_statement_logged_and_stats_cleared(app, caplog):
+    app.config['DB_REPEAT_QUERY_THRESHOLD'] = 2
+    with app.test_request_context('/files/browse'):
+        for file_id in range(3):
+            query_db('SELECT * FROM files WHERE id = ?', (file_id,))
+        with caplog.at_level(logging.WARNING, logger=app.logger.name):
+            report_query_stats()
+        assert 'db_stats' not in g
+
+    warnings = [record.getMessage() for record in caplog.records if 'Possible N+1' in record.getMessage()]
+    assert warnings == ['Possible N+1 in files.browse: statement ran 3 times: SELECT * FROM files WHERE id = ?']
+
+def test_requests_report_their_own_stats(client, app, caplog):
+    app.config['DB_REPEAT_QUERY_THRESHOLD'] = 10000
+    app.config['DB_SLOW_REQUEST_MS'] = 0
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        assert client.get('/files/browse').status_code == 200
+    assert any('Slow DB work in files.browse' in record.getMessage() for record in caplog.records)
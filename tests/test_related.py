@@ -0,0 +1,84 @@
+"""
+/home/life/tests/test_related.py
+Version: 1.0.0
+Purpose: Related files - dirty marking, neighbour refresh from associations and tags, lookups
+Created: 2026-10-18
+"""
+
+from utils.util_db import query_db, execute_db
+from utils.util_related import (mark_related_dirty, refresh_related_files, rebuild_related_files,
+                                compute_neighbours, get_related_files)
+
+def _files(make_file, *names, **fields):
+    return [make_file(name, title=name.split('.')[0], **fields) for name in names]
+
+def _associate(file_id_1, file_id_2, strength):
+    execute_db('INSERT INTO learned_associations (file_id_1, file_id_2, strength, last_accessed) '
+               'VALUES (?, ?, ?, CURRENT_TIMESTAMP)', (file_id_1, file_id_2, strength))
+
+def _neighbours(file_id):
+    return [row['neighbour_id'] for row in query_db(
+        'SELECT neighbour_id FROM file_neighbours WHERE file_id = ? ORDER BY score DESC', (file_id,))]
+
+def test_associations_rank_first(ctx, make_file):
+    a, b, c = _files(make_file, 'alpha.txt', 'bravo.txt', 'charlie.txt')
+    _associate(a, c, 5.0)
+    _associate(a, b, 1.0)
+    rebuild_related_files()
+    assert _neighbours(a)[:2] == [c, b]
+    # Stored under both files
+    assert _neighbours(c)[0] == a
+
+def test_stale_associations_decay(ctx, make_file):
+    a, b, c = _files(make_file, 'alpha.txt', 'bravo.txt', 'charlie.txt')
+    _associate(a, b, 4.0)
+    _associate(a, c, 3.0)
+    execute_db("UPDATE learned_associations SET last_accessed = datetime('now', '-60 days') WHERE file_id_2 = ?", (b,))
+    assert [other for other, _ in compute_neighbours(a)][:2] == [c, b]
+
+def test_shared_rare_tags_relate_files(ctx, make_file):
+    a, b = _files(make_file, 'alpha.txt', 'bravo.txt', tags='zebra')
+    c, = _files(make_file, 'charlie.txt', tags='other')
+    scores = dict(compute_neighbours(a))
+    assert scores[b] > scores.get(c, 0)
+
+def test_new_file_offered_to_existing_lists(ctx, make_file):
+    ctx.config['RELATED_TOP_K'] = 2
+    a, b, c = _files(make_file, 'alpha.txt', 'bravo.txt', 'charlie.txt')
+    _associate(a, b, 1.0)
+    _associate(a, c, 1.0)
+    rebuild_related_files()
+
+    d, = _files(make_file, 'delta.txt')
+    _associate(a, d, 9.0)
+    mark_related_dirty([d])
+    assert refresh_related_files() == 1
+    # a was not recomputed, but d's score beats its weakest neighbour and a keeps top_k
+    assert _neighbours(a)[0] == d
+    assert len(_neighbours(a)) == 2
+
+def test_lookup_excludes_inputs_and_deleted(ctx, make_file):
+    a, b, c = _files(make_file, 'alpha.txt', 'bravo.txt', 'charlie.txt')
+    _associate(a, b, 2.0)
+    _associate(a, c, 1.0)
+    _associate(b, c, 1.0)
+    rebuild_related_files()
+
+    assert [row['id'] for row in get_related_files([a])][:2] == [b, c]
+    assert b not in [row['id'] for row in get_related_files([a, b])]
+    execute_db('UPDATE files SET deleted = 1 WHERE id = ?', (b,))
+    assert b not in [row['id'] for row in get_related_files([a])]
+    assert get_related_files([]) == []
+
+def test_refresh_in_batches(ctx, make_file):
+    ids = _files(make_file, 'alpha.txt', 'bravo.txt', 'charlie.txt')
+    execute_db('DELETE FROM related_dirty')
+    execute_db('DELETE FROM jobs')
+    mark_related_dirty(ids + [None])
+    assert query_db("SELECT COUNT(*) as count FROM jobs WHERE job_type = 'refresh_related'", one=True)['count'] == 1
+
+    # A full batch queues a follow-up job for the rest
+    assert refresh_related_files(limit=2) == 2
+    assert query_db("SELECT COUNT(*) as count FROM jobs WHERE job_type = 'refresh_related'", one=True)['count'] == 2
+    assert refresh_related_files(limit=2) == 1
+    assert refresh_related_files() == 0
@@ -0,0 +1,81 @@
+"""
+/home/life/tests/test_relationships.py
+Version: 1.0.0
+Purpose: Relationship expansion index - bidirectional lookups, reloads and the admin API
+Created: 2026-10-18
+"""
+
+from utils import util_relationships
+from utils.util_db import execute_db
+from utils.util_relationships import (get_expansion_index, invalidate_expansion_index, expand_terms,
+                                      find_terms, save_relationship, delete_relationship)
+
+def _reset(ctx):
+    execute_db('DELETE FROM relationships')
+    invalidate_expansion_index()
+
+def test_expansion_works_both_ways(ctx):
+    _reset(ctx)
+    save_relationship('Car', ['insurance', 'MOT test', 'car'])
+    assert expand_terms('renew the car') == {'insurance', 'mot test'}
+    # A related term pulls in its parent
+    assert expand_terms('annual MOT test certificate') == {'car'}
+    assert expand_terms('nothing relevant') == set()
+
+def test_multi_word_terms_found(ctx):
+    _reset(ctx)
+    save_relationship('council tax', ['bins'])
+    assert find_terms('Council-Tax bill') == {'council tax'}
+    assert get_expansion_index()['max_words'] == 2
+
+def test_save_replaces_and_delete_removes(ctx):
+    _reset(ctx)
+    relationship_id = save_relationship('car', ['insurance'])
+    assert save_relationship(' CAR ', ['tyres']) == relationship_id
+    assert expand_terms('car') == {'tyres'}
+    assert delete_relationship(relationship_id)
+    assert expand_terms('car') == set()
+    assert not delete_relationship(relationship_id)
+    assert save_relationship('  ', ['x']) is None
+
+def test_readers_keep_the_index_they_fetched(ctx):
+    _reset(ctx)
+    save_relationship('car', ['insurance'])
+    before = get_expansion_index()
+    save_relationship('car', ['tyres'])
+    after = get_expansion_index()
+
+    # Swapped, not edited: a lookup in flight still sees one consistent index
+    assert before is not after
+    assert before['terms'] == {'car': frozenset({'insurance'})}
+    assert after['terms'] == {'car': frozenset({'tyres'})}
+
+def test_other_processes_edits_noticed_after_check_interval(ctx):
+    _reset(ctx)
+    save_relationship('car', ['insurance'])
+    get_expansion_index()
+
+    # Written by another process: the table and version change, this cache does not know
+    execute_db('''UPDATE relationships SET related_terms = '["tyres"]' ''')
+    util_relationships._bump_version()
+    assert expand_terms('car') == {'insurance'}
+
+    ctx.config['RELATIONSHIPS_RELOAD_CHECK'] = 0
+    assert expand_terms('car') == {'tyres'}
+
+def test_invalid_rows_skipped(ctx):
+    _reset(ctx)
+    execute_db("INSERT INTO relationships (term, related_terms) VALUES ('broken', 'not json')")
+    save_relationship('car', ['insurance'])
+    assert set(get_expansion_index()['terms']) == {'car'}
+
+def test_admin_api(ctx, client):
+    _reset(ctx)
+    response = client.post('/admin/api/relationships', json={'term': 'Garden', 'related_terms': 'shed, lawn'})
+    relationship_id = response.json['id']
+    assert client.get('/admin/api/relationships').json == \
+        [{'id': relationship_id, 'term': 'garden', 'related_terms': ['shed', 'lawn']}]
+    assert expand_terms('garden') == {'shed', 'lawn'}
+
+    assert client.delete(f'/admin/api/relationships/{relationship_id}').json == {'deleted': relationship_id}
+    assert client.delete(f'/admin/api/relationships/{relationship_id}').status_code == 404
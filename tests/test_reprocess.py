@@ -0,0 +1,156 @@
+"""
+/home/life/tests/test_reprocess.py
+Version: 1.0.0
+Purpose: Archive reprocessing - selection filters, stages, failure report and checkpoint resume
+Created: 2026-10-18
+"""
+
+import os
+import hashlib
+import pytest
+from PIL import Image
+from utils.util_db import query_db, execute_db, transaction
+from utils.util_text import get_file_text
+from utils.util_derivatives import get_derivative_path, register_derivatives
+from utils.util_reprocess import (reprocess_files, select_files, count_files, get_checkpoint_path,
+                                  load_checkpoint)
+
+def _checksummed(file_id, path):
+    """Give a fixture row the real MD5 of its file"""
+    with open(path, 'rb') as f:
+        execute_db('UPDATE files SET checksum = ? WHERE id = ?', (hashlib.md5(f.read()).hexdigest(), file_id))
+    return file_id
+
+def _document(ctx, make_file, name, text, **fields):
+    path = os.path.join(ctx.config['DATA_DIR'], 'documents', name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+    return _checksummed(make_file(name, filepath=path, **fields), path)
+
+def _photo(ctx, make_file, name, taken=None):
+    path = os.path.join(ctx.config['DATA_DIR'], 'images', name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    exif = Image.Exif()
+    if taken:
+        exif[0x8769] = {0x9003: taken}
+    Image.new('RGB', (600, 400), 'teal').save(path, 'JPEG', exif=exif.tobytes())
+    return _checksummed(make_file(name, category='images/events', filetype='image/jpeg', filepath=path), path)
+
+def test_selection_filters(ctx, make_file):
+    old = make_file('a.txt', category='documents/financial', upload_date='2020-01-05 10:00:00')
+    new = make_file('b.txt', category='documents/personal', upload_date='2024-06-01 10:00:00')
+    photo = make_file('c.jpg', category='images/family', filetype='image/jpeg', upload_date='2024-07-01 10:00:00')
+
+    def ids(**filters):
+        return [row['id'] for row in select_files(filters)]
+
+    assert ids() == [old, new, photo]
+    assert ids(category='documents/') == [old, new]
+    assert ids(filetype='image/') == [photo]
+    assert ids(since='2024-01-01') == [new, photo]
+    assert ids(until='2024-01-01') == [old]
+    assert [row['id'] for row in select_files({}, after_id=old, limit=1)] == [new]
+    assert count_files({'category': 'documents/'}) == 2
+
+def test_text_and_hash_stages(ctx, make_file):
+    ctx.config['REPROCESS_BATCH_SIZE'] = 2
+    same = 'the quarterly statement for the savings account shows interest paid in march ' * 5
+    a = _document(ctx, make_file, 'a.txt', same)
+    b = _document(ctx, make_file, 'b.txt', same + '\n')
+    broken = _document(ctx, make_file, 'c.docx', 'not a zip')
+    gone = make_file('gone.txt', filepath='/no/such/gone.txt')
+
+    report = reprocess_files(['hash', 'text'])
+    assert (report['total'], report['processed']) == (4, 4)
+    assert report['stages'] == {'hash': {'done': 3, 'changed': 0, 'failed': 1},
+                                'text': {'done': 2, 'changed': 2, 'failed': 1}}
+    failures = {(failure['file_id'], failure['stage']) for failure in report['failures']}
+    assert failures == {(broken, 'text'), (gone, 'hash')}
+    assert get_file_text(a).startswith('the quarterly statement')
+    assert [tuple(row) for row in query_db('SELECT file_id, similar_id FROM document_duplicates')] == [(a, b)]
+
+    # Same text again: nothing changed
+    assert reprocess_files(['text'])['stages']['text']['changed'] == 0
+
+def test_image_stages_replace_derivatives(ctx, make_file):
+    photo = _photo(ctx, make_file, 'p.jpg')
+    checksum = query_db('SELECT checksum FROM files WHERE id = ?', (photo,), one=True)['checksum']
+    old_size = get_derivative_path(checksum, 'large', 'jpeg')
+    os.makedirs(os.path.dirname(old_size), exist_ok=True)
+    open(old_size, 'wb').close()
+    with transaction():
+        register_derivatives(checksum, [(old_size, 0)])
+
+    report = reprocess_files(['thumbnails', 'metadata', 'hash'], {'filetype': 'image/'})
+    assert report['stages'] == {'thumbnails': {'done': 1, 'changed': 1, 'failed': 0},
+                                'metadata': {'done': 1, 'changed': 0, 'failed': 0},
+                                'hash': {'done': 1, 'changed': 1, 'failed': 0}}
+    assert not os.path.exists(old_size)
+    paths = [row['path'] for row in query_db('SELECT path FROM derivative_cache')]
+    assert len(paths) == 1 and '_thumb.' in paths[0] and os.path.exists(paths[0])
+    assert query_db('SELECT COUNT(*) FROM image_hashes WHERE file_id = ?', (photo,), one=True)[0] == 1
+
+    assert reprocess_files(['hash'], {'filetype': 'image/'})['stages']['hash']['changed'] == 0
+
+def test_hash_stage_reports_checksum_mismatch(ctx, make_file):
+    intact = _document(ctx, make_file, 'intact.txt', 'unchanged since upload')
+    damaged = _document(ctx, make_file, 'damaged.txt', 'as uploaded')
+    with open(query_db('SELECT filepath FROM files WHERE id = ?', (damaged,), one=True)['filepath'], 'a') as f:
+        f.write(' and then changed on disk')
+    stored = query_db('SELECT checksum FROM files WHERE id = ?', (damaged,), one=True)['checksum']
+
+    report = reprocess_files(['hash'])
+    assert report['stages']['hash'] == {'done': 1, 'changed': 0, 'failed': 1}
+    assert report['failures'][0]['file_id'] == damaged
+    assert report['failures'][0]['error'].startswith(f'Checksum mismatch: stored {stored}')
+    # Reported, never rewritten
+    assert query_db('SELECT checksum FROM files WHERE id = ?', (damaged,), one=True)['checksum'] == stored
+    assert intact not in {failure['file_id'] for failure in report['failures']}
+
+def test_metadata_stage_replaces_date_taken(ctx, make_file):
+    photo = _photo(ctx, make_file, 'dated.jpg', taken='2019:07:14 09:30:00')
+    execute_db("UPDATE metadata SET date_taken = '2001-01-01' WHERE file_id = ?", (photo,))
+
+    assert reprocess_files(['metadata'])['stages']['metadata'] == {'done': 1, 'changed': 1, 'failed': 0}
+    assert str(query_db('SELECT date_taken FROM metadata WHERE file_id = ?', (photo,), one=True)[0]) == '2019-07-14'
+    assert reprocess_files(['metadata'])['stages']['metadata']['changed'] == 0
+
+def test_category_stage_moves_files(ctx, make_file):
+    file_id = _document(ctx, make_file, 'invoice.txt', 'gas', category='documents/personal')
+    report = reprocess_files(['category'])
+    assert report['stages']['category'] == {'done': 1, 'changed': 1, 'failed': 0}
+    row = query_db('SELECT filepath FROM files WHERE id = ?', (file_id,), one=True)
+    assert row['filepath'] == os.path.join(ctx.config['DATA_DIR'], 'documents/financial', 'invoice.txt')
+
+def test_interrupted_run_resumes_from_checkpoint(ctx, make_file):
+    ctx.config['REPROCESS_BATCH_SIZE'] = 2
+    ids = [_document(ctx, make_file, f'{i}.txt', f'text number {i}') for i in range(5)]
+    checkpoint = get_checkpoint_path(['text'], {})
+    batches = []
+
+    def stop_after_first(report):
+        batches.append(report['processed'])
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        reprocess_files(['text'], checkpoint=checkpoint, progress=stop_after_first)
+    saved = load_checkpoint(checkpoint)
+    assert saved['last_id'] == ids[1] and saved['report']['processed'] == 2
+    assert get_file_text(ids[2]) is None
+
+    report = reprocess_files(['text'], checkpoint=checkpoint, progress=lambda report: batches.append(report['processed']))
+    assert batches == [2, 4, 5]
+    assert (report['processed'], report['stages']['text']['done']) == (5, 5)
+    assert all(get_file_text(file_id) for file_id in ids)
+    assert not os.path.exists(checkpoint)
+
+def test_checkpoint_key_ignores_stage_order(ctx):
+    assert get_checkpoint_path(['text', 'hash'], {}) == get_checkpoint_path(['hash', 'text'], {})
+    assert get_checkpoint_path(['text'], {}) != get_checkpoint_path(['text'], {'category': 'documents/'})
+
+def test_reprocess_command(ctx, make_file):
+    _document(ctx, make_file, 'a.txt', 'hello')
+    result = ctx.test_cli_runner().invoke(args=['reprocess', '--stage', 'text', '--workers', '1', '--nice', '0'])
+    assert 'Reprocessed 1 of 1 files' in result.output
+    assert '  text: 1 done, 1 changed, 0 failed' in result.output.splitlines()
@@ -0,0 +1,80 @@
+"""
+/home/life/tests/test_search.py
+Version: 1.0.0
+Purpose: FTS5 file search - trigger-maintained index, ranking, snippets and the LIKE fallback
+Created: 2026-10-18
+"""
+
+from utils.util_db import query_db, execute_db
+from utils.util_search import search_files, build_match_query, rebuild_search_index
+
+def _ids(text):
+    results, total = search_files(text, 20)
+    assert total == len(results)
+    return [result['id'] for result in results]
+
+def test_new_files_are_indexed_by_triggers(make_file):
+    invoice = make_file('invoice_2024.pdf', description='electricity bill', tags='utilities, home')
+    make_file('holiday.jpg', category='images/events', filetype='image/jpeg')
+
+    assert _ids('invoice') == [invoice]
+    assert _ids('electricity') == [invoice]
+    assert _ids('utilities') == [invoice]
+    assert _ids('elec') == [invoice]
+
+def test_edits_keep_the_index_in_sync(make_file):
+    file_id = make_file('scan.pdf', title='Old title')
+
+    execute_db('UPDATE metadata SET title = ? WHERE file_id = ?', ('Passport renewal', file_id))
+    assert _ids('passport') == [file_id]
+    assert _ids('old') == []
+
+    execute_db("INSERT INTO tags (name) VALUES ('zebra')")
+    execute_db("INSERT INTO file_tags (file_id, tag_id) SELECT ?, id FROM tags WHERE name = 'zebra'", (file_id,))
+    assert _ids('zebra') == [file_id]
+
+    execute_db("DELETE FROM file_tags WHERE file_id = ?", (file_id,))
+    assert _ids('zebra') == []
+
+def test_deleted_files_are_not_found(make_file):
+    file_id = make_file('contract.pdf')
+    execute_db('UPDATE files SET deleted = 1 WHERE id = ?', (file_id,))
+    assert _ids('contract') == []
+
+def test_title_match_ranks_above_text_match(make_file):
+    in_text = make_file('a.pdf', ocr_text='some words about a mortgage somewhere in the text')
+    in_title = make_file('b.pdf', title='Mortgage statement')
+    assert _ids('mortgage') == [in_title, in_text]
+
+def test_snippet_highlights_matches_and_escapes_html(make_file):
+    make_file('note.txt', ocr_text='<b>the dentist</b> appointment is on monday')
+    result = search_files('dentist', 20)[0][0]
+    assert '<mark>dentist</mark>' in result['snippet']
+    assert '&lt;b&gt;' in result['snippet']
+
+def test_user_operators_are_taken_literally():
+    assert build_match_query('cats NOT dogs') == '"cats"* "NOT"* "dogs"*'
+    assert build_match_query('"; DROP') == '"DROP"*'
+    assert build_match_query('   ') is None
+
+def test_rebuild_reindexes_every_file(make_file):
+    make_file('one.txt')
+    make_file('two.txt')
+    execute_db('DELETE FROM files_fts')
+    assert _ids('one') == []
+    assert rebuild_search_index() == 2
+    assert len(_ids('txt')) == 2
+
+def test_like_fallback_without_fts(make_file):
+    file_id = make_file('receipt.pdf', description='Hardware store', tags='diy')
+    other = make_file('other.pdf')
+    execute_db('UPDATE files SET deleted = 1 WHERE id = ?', (other,))
+
+    # Triggers reference files_fts, so drop them with it as a build without FTS5 never had them
+    for row in query_db("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'files_fts_%'"):
+        execute_db(f"DROP TRIGGER {row['name']}")
+    execute_db('DROP TABLE files_fts')
+
+    assert _ids('hardware') == [file_id]
+    assert _ids('diy') == [file_id]
+    assert _ids('other') == []
@@ -0,0 +1,110 @@
+"""
+/home/life/tests/test_similar_documents.py
+Version: 1.0.0
+Purpose: Near-duplicate documents - MinHash estimates, LSH candidates and canonical pairs
+Created: 2026-10-18
+"""
+
+import random
+from utils.util_db import query_db, execute_db, transaction
+from utils.util_similar import (text_shingles, minhash_signature, estimate_similarity, find_similar_documents,
+                                prepare_document_signatures, record_document_signatures, sign_document,
+                                get_similar_documents, index_documents)
+
+WORDS = [f'word{i}' for i in range(500)]
+
+def _text(seed, length=400):
+    rng = random.Random(seed)
+    return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+def _edited(text, changes, seed=1):
+    rng = random.Random(seed)
+    words = text.split()
+    for position in rng.sample(range(len(words)), changes):
+        words[position] = 'edited'
+    return ' '.join(words)
+
+def _pairs():
+    return [tuple(row)[:2] for row in query_db('SELECT file_id, similar_id FROM document_duplicates ORDER BY 1, 2')]
+
+def test_estimate_tracks_jaccard(ctx):
+    original = _text(1)
+    for changes in (0, 5, 40):
+        a, b = text_shingles(original), text_shingles(_edited(original, changes))
+        jaccard = len(a & b) / len(a | b)
+        estimate = estimate_similarity(minhash_signature(a), minhash_signature(b))
+        assert abs(estimate - jaccard) < 0.12
+
+def test_shingles_ignore_case_and_punctuation(ctx):
+    assert text_shingles('The  quick, brown FOX!') == text_shingles('the quick brown fox')
+    assert len(text_shingles('one two')) == 1
+    assert text_shingles('   ') == set()
+
+def test_near_copies_found_unrelated_not(ctx, make_file):
+    original = _text(1)
+    a, b, c = make_file('a.pdf'), make_file('b.pdf'), make_file('c.pdf')
+    sign_document(a, original)
+    sign_document(c, _text(2))
+    matches = sign_document(b, _edited(original, 3))
+    assert [match['file_id'] for match in matches] == [a]
+    assert matches[0]['similarity'] >= 0.8
+    assert _pairs() == [(a, b)]
+    assert [row['file_id'] for row in get_similar_documents(a)] == [b]
+    assert [row['file_id'] for row in get_similar_documents(b)] == [a]
+
+def test_threshold_applies(ctx, make_file):
+    original = _text(1)
+    a = make_file('a.pdf')
+    sign_document(a, original)
+    edited = _edited(original, 8)
+    assert find_similar_documents(edited, min_similarity=0.99) == []
+    assert find_similar_documents(edited)[0]['file_id'] == a
+
+def test_resigning_replaces_pairs(ctx, make_file):
+    first, second = _text(1), _text(2)
+    a, b, c = make_file('a.pdf'), make_file('b.pdf'), make_file('c.pdf')
+    sign_document(a, first)
+    sign_document(b, second)
+    sign_document(c, first)
+    assert _pairs() == [(a, c)]
+
+    # c's text was re-extracted and now matches b - the a/c pair goes
+    sign_document(c, second)
+    assert _pairs() == [(b, c)]
+    assert sign_document(c, '') == []
+    assert _pairs() == []
+    assert query_db('SELECT COUNT(*) as count FROM document_buckets WHERE file_id = ?', (c,), one=True)['count'] == 0
+
+def test_batch_matched_on_new_signatures(ctx, make_file):
+    first, second = _text(1), _text(2)
+    a, b, c = make_file('a.pdf'), make_file('b.pdf'), make_file('c.pdf')
+    sign_document(a, first)
+    sign_document(b, first)
+
+    # a and b re-extracted together: they now match each other's new text and c, not b's stored signature
+    prepared = prepare_document_signatures([(a, second), (b, _edited(second, 3)), (c, second)])
+    assert [entry['similar'] for entry in prepared][0] == []
+    with transaction():
+        found = record_document_signatures(prepared)
+    assert sorted(match['file_id'] for match in found[c]) == [a, b]
+    assert _pairs() == [(a, b), (a, c), (b, c)]
+
+def test_deleted_documents_not_matched(ctx, make_file):
+    a, b = make_file('a.pdf'), make_file('b.pdf')
+    sign_document(a, _text(1))
+    sign_document(b, _text(1))
+    execute_db('UPDATE files SET deleted = 1 WHERE id = ?', (a,))
+    assert find_similar_documents(_text(1), exclude_id=b) == []
+    assert get_similar_documents(b) == []
+
+def test_index_documents_signs_only_new_text(ctx, make_file):
+    a = make_file('a.pdf', ocr_text=_text(1))
+    make_file('b.pdf', ocr_text=_text(1))
+    make_file('c.pdf')
+    assert index_documents() == (2, 1)
+    assert index_documents() == (0, 0)
+    assert index_documents(reindex=True) == (2, 2)
+    assert _pairs() == [(a, a + 1)]
+
+    result = ctx.test_cli_runner().invoke(args=['index-documents'])
+    assert result.output.strip() == 'Signed 0 documents, 0 with probable duplicates'
@@ -0,0 +1,127 @@
+"""
+/home/life/tests/test_similar_images.py
+Version: 1.0.0
+Purpose: Near-duplicate photos - multi-index Hamming search, canonical pairs and the job pipeline
+Created: 2026-10-18
+"""
+
+import os
+import random
+from PIL import Image, ImageDraw
+from utils.util_db import query_db, execute_db, transaction
+from utils.util_jobs import enqueue_file_jobs, work_jobs
+from utils.util_similar import (HammingIndex, to_unsigned, find_similar_images, record_image_hash,
+                                get_similar_files, get_similarity_index)
+
+def _pairs():
+    return [tuple(row) for row in query_db('SELECT file_id, similar_id, distance FROM image_duplicates ORDER BY 1, 2')]
+
+def _flip(value, bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+def test_index_search_matches_brute_force():
+    rng = random.Random(7)
+    base = rng.getrandbits(64)
+    hashes = {file_id: _flip(base, rng.sample(range(64), rng.randrange(0, 12))) for file_id in range(1, 300)}
+    hashes.update({file_id: rng.getrandbits(64) for file_id in range(300, 600)})
+    index = HammingIndex()
+    for file_id, value in hashes.items():
+        index.add(file_id, value)
+
+    for radius in (0, 3, 6, 10):
+        expected = sorted(((file_id, bin(base ^ value).count('1')) for file_id, value in hashes.items()
+                           if bin(base ^ value).count('1') <= radius), key=lambda item: (item[1], item[0]))
+        assert index.search(base, radius) == expected
+
+def test_readding_a_file_replaces_its_hash():
+    index = HammingIndex()
+    index.add(1, 0)
+    index.add(1, (1 << 64) - 1)
+    assert index.search(0, 6) == []
+    assert index.search((1 << 64) - 1, 0) == [(1, 0)]
+    assert len(index) == 1
+
+def test_signed_hashes_round_trip():
+    assert to_unsigned(-1) == (1 << 64) - 1
+    assert to_unsigned(5) == 5
+
+def test_pairs_stored_once_and_replaced_on_rehash(ctx, make_file):
+    a, b, c = (make_file(name, filetype='image/jpeg') for name in ('a.jpg', 'b.jpg', 'c.jpg'))
+    with transaction():
+        record_image_hash(a, 0b1111)
+    with transaction():
+        assert record_image_hash(c, 0b0111) == [{'file_id': a, 'distance': 1}]
+    with transaction():
+        assert [match['file_id'] for match in record_image_hash(b, -1 << 4)] == []
+    assert _pairs() == [(a, c, 1)]
+    assert get_similar_files(a) == [{'file_id': c, 'distance': 1}]
+    assert get_similar_files(c) == [{'file_id': a, 'distance': 1}]
+
+    # c re-hashed (say after a rotation) next to b instead of a
+    with transaction():
+        record_image_hash(c, (-1 << 4) | 1)
+    assert _pairs() == [(b, c, 1)]
+
+def test_deleted_and_excluded_files_not_matched(ctx, make_file):
+    a, b = make_file('a.jpg', filetype='image/jpeg'), make_file('b.jpg', filetype='image/jpeg')
+    with transaction():
+        record_image_hash(a, 42)
+        record_image_hash(b, 43)
+    assert [match['file_id'] for match in find_similar_images(42, exclude_id=a)] == [b]
+    execute_db('UPDATE files SET deleted = 1 WHERE id = ?', (b,))
+    assert find_similar_images(42, exclude_id=a) == []
+    assert get_similar_files(a) == []
+
+def test_rolled_back_hashes_never_reach_the_index(ctx, make_file):
+    a, b = make_file('a.jpg', filetype='image/jpeg'), make_file('b.jpg', filetype='image/jpeg')
+    try:
+        with transaction():
+            record_image_hash(a, 99)
+            # Seen inside the transaction, without loading it into the shared index
+            assert find_similar_images(99, exclude_id=b) == [{'file_id': a, 'distance': 0}]
+            raise RuntimeError('roll back')
+    except RuntimeError:
+        pass
+
+    assert len(get_similarity_index()) == 0
+    with transaction():
+        record_image_hash(b, -1)
+    assert find_similar_images(99) == []
+    assert [match['file_id'] for match in find_similar_images(-1)] == [b]
+
+def _picture(path, shade):
+    img = Image.new('RGB', (400, 300), 'white')
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((50, 50, 250, 250), fill=(shade, 0, 0))
+    draw.rectangle((260, 40, 380, 120), fill=(0, 0, shade))
+    img.save(path, 'JPEG')
+
+def test_uploads_hashed_by_the_image_job(app, tmp_path):
+    with app.app_context():
+        ids = []
+        for name, shade in (('a.jpg', 200), ('b.jpg', 190)):
+            path = str(tmp_path / name)
+            _picture(path, shade)
+            file_id = execute_db('INSERT INTO files (filename, filepath, filetype, checksum) VALUES (?, ?, ?, ?)',
+                                 (name, path, 'image/jpeg', name * 8))
+            execute_db('INSERT INTO metadata (file_id, title) VALUES (?, ?)', (file_id, name))
+            enqueue_file_jobs(file_id, path)
+            ids.append(file_id)
+
+    work_jobs(app, drain=True)
+    with app.app_context():
+        assert query_db('SELECT COUNT(*) as count FROM image_hashes', one=True)['count'] == 2
+        assert [pair[:2] for pair in _pairs()] == [tuple(ids)]
+
+def test_hash_images_queues_only_unhashed_images(ctx, make_file):
+    hashed = make_file('a.jpg', filetype='image/jpeg')
+    with transaction():
+        record_image_hash(hashed, 1)
+    photo = make_file('b.JPG', filetype='image/jpeg')
+    make_file('c.txt')
+    execute_db('DELETE FROM jobs')
+
+    assert ctx.test_cli_runner().invoke(args=['hash-images']).output.strip() == 'Queued 1 images'
+    assert [tuple(row) for row in query_db('SELECT job_type, file_id FROM jobs')] == [('process_image', photo)]
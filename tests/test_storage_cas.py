@@ -0,0 +1,112 @@
+"""
+/home/life/tests/test_storage_cas.py
+Version: 1.0.0
+Purpose: Content-addressed storage - hardlinked category paths, adopting existing files, object gc with a grace period
+Created: 2026-10-18
+"""
+
+import os
+import hashlib
+import pytest
+from utils.util_db import execute_db
+from utils.util_storage import move_to_storage, get_object_path, store_object, collect_unreferenced_objects
+
+@pytest.fixture
+def cas(ctx):
+    ctx.config['STORAGE_CAS'] = True
+    return ctx
+
+def _staged(app, data, name='upload.tmp'):
+    staging = os.path.join(app.config['DATA_DIR'], '.staging')
+    os.makedirs(staging, exist_ok=True)
+    path = os.path.join(staging, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path, hashlib.md5(data).hexdigest()
+
+def test_same_bytes_stored_once(cas):
+    first, checksum = _staged(cas, b'same bytes', 'one.tmp')
+    second, _ = _staged(cas, b'same bytes', 'two.tmp')
+
+    a = move_to_storage(first, 'documents/general', 'report.txt', checksum)
+    b = move_to_storage(second, 'documents/work', 'report.txt', checksum)
+    obj = get_object_path(checksum)
+
+    assert a == os.path.join(cas.config['DATA_DIR'], 'documents/general', 'report.txt')
+    assert os.path.samefile(a, obj) and os.path.samefile(b, obj)
+    assert os.stat(obj).st_nlink == 3
+    assert not os.path.exists(first) and not os.path.exists(second)
+    assert obj.endswith(os.path.join(checksum[:2], checksum[2:4], checksum))
+
+def test_name_clash_gets_a_suffix(cas):
+    first, checksum = _staged(cas, b'one', 'one.tmp')
+    second, other = _staged(cas, b'two', 'two.tmp')
+    a = move_to_storage(first, 'documents/general', 'notes.txt', checksum)
+    b = move_to_storage(second, 'documents/general', 'notes.txt', other)
+    assert os.path.basename(b) == 'notes_1.txt'
+    with open(a, 'rb') as f:
+        assert f.read() == b'one'
+
+def test_plain_storage_without_cas(ctx):
+    path, checksum = _staged(ctx, b'plain')
+    stored = move_to_storage(path, 'documents/general', 'plain.txt', checksum)
+    assert os.stat(stored).st_nlink == 1
+    assert not os.path.exists(get_object_path(checksum))
+
+def test_store_object_adopts_and_deduplicates(cas):
+    base = cas.config['DATA_DIR']
+    os.makedirs(os.path.join(base, 'documents'), exist_ok=True)
+    paths = [os.path.join(base, 'documents', name) for name in ('a.txt', 'b.txt')]
+    for path in paths:
+        with open(path, 'wb') as f:
+            f.write(b'duplicate')
+    checksum = hashlib.md5(b'duplicate').hexdigest()
+
+    assert store_object(paths[0], checksum) == 'added'
+    assert store_object(paths[1], checksum) == 'deduplicated'
+    assert store_object(paths[1], checksum) == 'present'
+    assert os.path.samefile(paths[0], paths[1])
+    with open(paths[1], 'rb') as f:
+        assert f.read() == b'duplicate'
+
+def test_store_object_refuses_mismatched_content(cas):
+    base = cas.config['DATA_DIR']
+    os.makedirs(os.path.join(base, 'documents'), exist_ok=True)
+    original, changed = (os.path.join(base, 'documents', name) for name in ('a.txt', 'b.txt'))
+    for path, data in ((original, b'stored'), (changed, b'edited since')):
+        with open(path, 'wb') as f:
+            f.write(data)
+    checksum = hashlib.md5(b'stored').hexdigest()
+
+    assert store_object(original, checksum) == 'added'
+    # b.txt's row claims the same checksum, but its bytes differ - it must not be replaced
+    assert store_object(changed, checksum) == 'mismatch'
+    assert not os.path.samefile(original, changed)
+    with open(changed, 'rb') as f:
+        assert f.read() == b'edited since'
+
+def test_gc_removes_only_unreferenced_objects(cas, make_file):
+    kept_path, kept = _staged(cas, b'kept', 'kept.tmp')
+    gone_path, gone = _staged(cas, b'gone', 'gone.tmp')
+    live = move_to_storage(kept_path, 'documents/general', 'kept.txt', kept)
+    deleted = move_to_storage(gone_path, 'documents/general', 'gone.txt', gone)
+    execute_db('UPDATE files SET checksum = ? WHERE id = ?', (kept, make_file('kept.txt', filepath=live)))
+
+    # Still linked from the archive - nothing to collect
+    assert collect_unreferenced_objects(grace=0) == (0, 0)
+
+    os.remove(deleted)
+    os.remove(live)
+    # Just unlinked - an upload's object looks the same until its link is made
+    assert collect_unreferenced_objects() == (0, 0)
+    # Unlinked, but a file row still uses the checksum
+    assert collect_unreferenced_objects(grace=0) == (1, 4)
+    assert os.path.exists(get_object_path(kept))
+    assert not os.path.exists(get_object_path(gone))
+
+def test_gc_objects_command(cas):
+    path, checksum = _staged(cas, b'orphan')
+    os.remove(move_to_storage(path, 'documents/general', 'orphan.txt', checksum))
+    assert cas.test_cli_runner().invoke(args=['gc-objects']).output.strip() == 'Removed 0 objects, freed 0 bytes'
+    result = cas.test_cli_runner().invoke(args=['gc-objects', '--grace', '0'])
+    assert result.output.strip() == 'Removed 1 objects, freed 6 bytes'
@@ -0,0 +1,137 @@
+"""
+/home/life/tests/test_text_extraction.py
+Version: 1.0.0
+Purpose: Text extraction - plain, Word, OpenDocument and PDF readers, pool batches and the job
+Created: 2026-10-18
+"""
+
+import zlib
+import codecs
+import zipfile
+import threading
+from utils.util_db import query_db, execute_db
+from utils.util_jobs import enqueue_file_jobs, work_jobs
+from utils.util_text import (run_text_extraction, extract_texts_parallel, store_file_text, get_file_text,
+                             can_extract_text)
+
+def _docx(path, paragraphs):
+    ns = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+    body = ''.join(f'<w:p><w:r><w:t>{first}</w:t><w:tab/><w:t>{second}</w:t></w:r></w:p>'
+                   for first, second in paragraphs)
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('word/document.xml', f'<w:document xmlns:w="{ns}"><w:body>{body}</w:body></w:document>')
+
+def _odt(path):
+    ns = 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'
+    content = (f'<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+               f'xmlns:text="{ns}"><office:body><office:text>'
+               f'<text:h>Heading</text:h><text:p>Two<text:s text:c="3"/>spaces<text:line-break/>next</text:p>'
+               f'</office:text></office:body></office:document-content>')
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('content.xml', content)
+
+def _pdf(path, content, flate=True):
+    data = zlib.compress(content) if flate else content
+    with open(path, 'wb') as f:
+        f.write(b'%%PDF-1.4\n1 0 obj\n<< /Length %d%s >>\nstream\n' % (len(data), b' /Filter /FlateDecode' if flate else b''))
+        f.write(data)
+        f.write(b'\nendstream\nendobj\n%%EOF\n')
+
+def test_plain_text_encodings(tmp_path):
+    cases = {
+        'utf8.txt': 'Grüße aus Köln'.encode('utf-8'),
+        'bom.txt': codecs.BOM_UTF8 + 'Grüße aus Köln'.encode('utf-8'),
+        'utf16.txt': 'Grüße aus Köln'.encode('utf-16'),
+        'latin.txt': 'Grüße aus Köln'.encode('cp1252'),
+    }
+    for name, data in cases.items():
+        (tmp_path / name).write_bytes(data)
+        result = run_text_extraction(str(tmp_path / name), 1000)
+        assert (result['text'], result['extractor'], result['error']) == ('Grüße aus Köln', 'plain', None)
+
+def test_whitespace_collapsed_but_lines_kept(tmp_path):
+    (tmp_path / 'a.txt').write_text('one   two\t\tthree  \n\n\n  four\r\n')
+    assert run_text_extraction(str(tmp_path / 'a.txt'), 1000)['text'] == 'one two three\nfour'
+    assert run_text_extraction(str(tmp_path / 'a.txt'), 3)['text'] == 'one'
+
+def test_word_and_opendocument(tmp_path):
+    _docx(tmp_path / 'a.docx', [('Invoice', '42'), ('Total', '£10')])
+    _odt(tmp_path / 'b.odt')
+    assert run_text_extraction(str(tmp_path / 'a.docx'), 1000)['text'] == 'Invoice 42\nTotal £10'
+    odt = run_text_extraction(str(tmp_path / 'b.odt'), 1000)
+    assert (odt['text'], odt['extractor']) == ('Heading\nTwo spaces\nnext', 'odt')
+
+def test_pdf_text_operators(tmp_path):
+    _pdf(tmp_path / 'a.pdf', b'BT /F1 12 Tf 72 700 Td (Hello \\(world\\)) Tj T* '
+                             b'[(Ban) -20 (k) -300 (stat) 5 (ement)] TJ 0 -14 Td <4F4B> Tj ET')
+    _pdf(tmp_path / 'b.pdf', b'BT (Plain stream) Tj ET', flate=False)
+    assert run_text_extraction(str(tmp_path / 'a.pdf'), 1000)['text'] == 'Hello (world)\nBank statement\nOK'
+    assert run_text_extraction(str(tmp_path / 'b.pdf'), 1000)['text'] == 'Plain stream'
+
+    (tmp_path / 'c.pdf').write_bytes(b'%PDF-1.4\n/Encrypt 5 0 R\n')
+    assert 'encrypted' in run_text_extraction(str(tmp_path / 'c.pdf'), 1000)['error']
+
+def test_unreadable_files_report_errors(tmp_path):
+    (tmp_path / 'a.docx').write_bytes(b'not a zip')
+    assert run_text_extraction(str(tmp_path / 'a.docx'), 1000)['error'].startswith('BadZipFile')
+    assert run_text_extraction(str(tmp_path / 'a.mov'), 1000)['error'] == 'ValueError: No text extractor for this file type'
+
+def test_timeout_holds_outside_the_main_thread(tmp_path):
+    _pdf(tmp_path / 'long.pdf', b'BT (word) Tj ET\n' * 20000)
+    results = []
+    # Inline extraction in a job thread - no alarm there, the parser's deadline stops it
+    path = str(tmp_path / 'long.pdf')
+    thread = threading.Thread(target=lambda: results.append(run_text_extraction(path, 10 ** 6, 1e-6)))
+    thread.start()
+    thread.join()
+    assert results[0]['error'] == 'Timed out after 1e-06s' and results[0]['text'] == ''
+    assert run_text_extraction(str(tmp_path / 'long.pdf'), 10 ** 6, 60)['text'].startswith('word')
+
+def test_batches_run_in_the_pool(ctx, tmp_path):
+    ctx.config['TEXT_EXTRACT_WORKERS'] = 2
+    paths = []
+    for i in range(4):
+        (tmp_path / f'{i}.txt').write_text(f'file {i}')
+        paths.append(str(tmp_path / f'{i}.txt'))
+    paths.append(str(tmp_path / 'missing.txt'))
+
+    results = extract_texts_parallel(paths)
+    assert [result['text'] for result in results[:4]] == [f'file {i}' for i in range(4)]
+    assert results[4]['source'] == paths[4] and results[4]['error']
+
+def test_stored_text_compressed_and_searchable(ctx, make_file):
+    file_id = make_file('a.pdf')
+    ctx.config['TEXT_SEARCH_LIMIT'] = 5
+    store_file_text(file_id, 'long extracted text', 'pdf')
+    assert get_file_text(file_id) == 'long extracted text'
+    assert query_db('SELECT ocr_text FROM metadata WHERE file_id = ?', (file_id,), one=True)['ocr_text'] == 'long '
+    assert get_file_text(file_id + 1) is None
+
+def test_extract_text_job(app, tmp_path):
+    path = tmp_path / 'letter.docx'
+    _docx(path, [('Electricity', 'invoice'), ('Account', '12345')])
+    with app.app_context():
+        file_id = execute_db('INSERT INTO files (filename, filepath, filetype) VALUES (?, ?, ?)',
+                             ('letter.docx', str(path), 'application/msword'))
+        execute_db('INSERT INTO metadata (file_id, title) VALUES (?, ?)', (file_id, 'letter'))
+        assert enqueue_file_jobs(file_id, str(path)) == 1
+
+    work_jobs(app, drain=True)
+    with app.app_context():
+        assert get_file_text(file_id) == 'Electricity invoice\nAccount 12345'
+        assert query_db('SELECT extractor FROM file_texts WHERE file_id = ?', (file_id,), one=True)[0] == 'docx'
+        assert query_db('SELECT COUNT(*) FROM document_signatures WHERE file_id = ?', (file_id,), one=True)[0] == 1
+        assert query_db("SELECT rowid FROM files_fts WHERE files_fts MATCH 'electricity'", one=True)[0] == file_id
+
+def test_extract_text_command_queues_readable_files(ctx, make_file):
+    done = make_file('a.txt', filepath='/x/a.txt')
+    store_file_text(done, 'text', 'plain')
+    todo = make_file('b.pdf', filepath='/x/b.pdf')
+    make_file('c.mov', filepath='/x/c.mov')
+    execute_db('DELETE FROM jobs')
+    assert can_extract_text('/x/b.PDF') and not can_extract_text('/x/c.mov')
+
+    runner = ctx.test_cli_runner()
+    assert runner.invoke(args=['extract-text']).output.strip() == 'Queued 1 files'
+    assert [row['file_id'] for row in query_db('SELECT file_id FROM jobs')] == [todo]
+    assert runner.invoke(args=['extract-text', '--reextract']).output.strip() == 'Queued 2 files'
@@ -0,0 +1,50 @@
+"""
+/home/life/tests/test_transactions.py
+Version: 1.0.0
+Purpose: transaction() and execute_many - single commit, nesting and rollback
+Created: 2026-10-18
+"""
+
+import pytest
+from utils.util_db import get_db, query_db, execute_db, execute_many, transaction, in_transaction
+
+def _settings(prefix):
+    return [row['key'] for row in query_db('SELECT key FROM settings WHERE key LIKE ? ORDER BY key', (f'{prefix}%',))]
+
+def test_execute_db_commits_outside_a_transaction(ctx):
+    execute_db("INSERT INTO settings (key, value) VALUES ('tx-a', '1')")
+    assert not get_db().in_transaction
+
+def test_execute_many_inserts_every_row(ctx):
+    assert execute_many('INSERT INTO settings (key, value) VALUES (?, ?)',
+                        [(f'tx-{i}', str(i)) for i in range(5)]) == 5
+    assert execute_many('INSERT INTO settings (key, value) VALUES (?, ?)', []) == 0
+    assert len(_settings('tx-')) == 5
+
+def test_transaction_commits_once_at_the_end(ctx):
+    with transaction():
+        assert in_transaction()
+        execute_db("INSERT INTO settings (key, value) VALUES ('tx-a', '1')")
+        execute_many('INSERT INTO settings (key, value) VALUES (?, ?)', [('tx-b', '2')])
+        assert get_db().in_transaction
+    assert not in_transaction()
+    assert not get_db().in_transaction
+    assert _settings('tx-') == ['tx-a', 'tx-b']
+
+def test_exception_rolls_back_everything(ctx):
+    with pytest.raises(RuntimeError):
+        with transaction():
+            execute_db("INSERT INTO settings (key, value) VALUES ('tx-a', '1')")
+            raise RuntimeError('boom')
+    assert _settings('tx-') == []
+    assert not in_transaction()
+
+def test_nested_block_joins_the_outer_transaction(ctx):
+    with pytest.raises(RuntimeError):
+        with transaction():
+            with transaction():
+                execute_db("INSERT INTO settings (key, value) VALUES ('tx-inner', '1')")
+            # Leaving the inner block must not have committed
+            assert get_db().in_transaction
+            raise RuntimeError('boom')
+    assert _settings('tx-') == []
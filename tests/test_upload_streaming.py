@@ -0,0 +1,58 @@
+"""
+/home/life/tests/test_upload_streaming.py
+Version: 1.0.0
+Purpose: Uploads streamed into staging with the checksum and MIME head taken while receiving
+Created: 2026-10-18
+"""
+
+import io
+import os
+import hashlib
+from utils.util_db import query_db
+from utils.util_storage import StagedUpload, UPLOAD_HEAD_SIZE, get_staging_dir
+
+def test_staged_upload_hashes_while_writing(ctx):
+    data = os.urandom(3 * UPLOAD_HEAD_SIZE + 17)
+    staged = StagedUpload(get_staging_dir(), '.bin')
+    for start in range(0, len(data), 1000):
+        staged.write(data[start:start + 1000])
+
+    path = staged.finish()
+    assert staged.checksum == hashlib.md5(data).hexdigest()
+    assert staged.head == data[:UPLOAD_HEAD_SIZE]
+    assert staged.size == len(data)
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+    staged.discard()
+    assert not os.path.exists(path)
+
+def test_upload_is_stored_with_streamed_checksum(app, client):
+    data = b'Meeting notes\n' * 5000
+    response = client.post('/files/upload', data={'files': [(io.BytesIO(data), 'notes.txt')], 'tags': 'work'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+
+    with app.app_context():
+        row = query_db('SELECT filepath, checksum, filetype, size FROM files', one=True)
+        assert row['checksum'] == hashlib.md5(data).hexdigest()
+        assert row['filetype'] == 'text/plain'
+        assert row['size'] == len(data)
+        with open(row['filepath'], 'rb') as f:
+            assert f.read() == data
+        assert os.listdir(get_staging_dir()) == []
+
+def test_rejected_upload_leaves_no_staging_file(app, client):
+    client.post('/files/upload', data={'files': [(io.BytesIO(b'MZ...'), 'setup.exe')]},
+                content_type='multipart/form-data')
+    with app.app_context():
+        assert query_db('SELECT COUNT(*) as count FROM files', one=True)['count'] == 0
+        assert os.listdir(get_staging_dir()) == []
+
+def test_duplicate_upload_is_skipped(app, client):
+    for name in ('first.txt', 'second.txt'):
+        client.post('/files/upload', data={'files': [(io.BytesIO(b'same bytes'), name)]},
+                    content_type='multipart/form-data')
+    with app.app_context():
+        assert [row['filename'] for row in query_db('SELECT filename FROM files')] == ['first.txt']
+        assert os.listdir(get_staging_dir()) == []